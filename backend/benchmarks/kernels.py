@@ -0,0 +1,397 @@
+"""
+Microbenchmarks for the per-frame kernels, at every QualityPreset resolution,
+checked against stored baselines.
+
+    cd backend
+    python -m benchmarks.kernels --save-baseline        # record benchmarks/baselines/kernels.json
+    python -m benchmarks.kernels                        # fails if a kernel got slower than its threshold
+    python -m benchmarks.kernels --filter 'camera|flow' --resolution 720x1280
+
+Baselines are machine specific: record them on the machine that runs the check.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "kernels.json"
+DEFAULT_THRESHOLD = 0.25
+MIN_REGRESSION_MS = 0.05
+
+@dataclass
+class Kernel:
+    name: str
+    # Called once per resolution with (width, height); returns the function to time
+    prepare: Callable[[int, int], Callable[[], object]]
+
+@dataclass
+class KernelResult:
+    name: str
+    resolution: str
+    median_ms: float
+    min_ms: float
+    runs: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@{self.resolution}"
+
+def test_frame(width: int, height: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frame = np.stack([255 * x / width, 255 * y / height, 128 + 100 * np.sin((x + y) / 40.0)], axis=-1)
+    frame += rng.normal(0, 10, frame.shape)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+def shifted_frame(frame: np.ndarray, dx: int = 6, dy: int = 3) -> np.ndarray:
+    return np.roll(frame, (dy, dx), axis=(0, 1))
+
+def synthetic_landmarks(width: int, height: int) -> Dict:
+    """
+    Landmarks of a face centred in the upper half of the frame, laid out like
+    detect_detailed_landmarks() output, so the animator stages do their full
+    work without a real face or MediaPipe.
+    """
+    def point(x: float, y: float) -> Tuple[int, int]:
+        return (int(x * width), int(y * height))
+
+    def bbox(x: float, y: float, w: float, h: float) -> Tuple[int, int, int, int]:
+        return (int(x * width), int(y * height), int(w * width), int(h * height))
+
+    return {
+        'upper_lip': point(0.50, 0.505),
+        'lower_lip': point(0.50, 0.525),
+        'left_lip_corner': point(0.44, 0.515),
+        'right_lip_corner': point(0.56, 0.515),
+        'left_eye_center': point(0.42, 0.40),
+        'right_eye_center': point(0.58, 0.40),
+        'left_eyebrow_inner': point(0.46, 0.375),
+        'left_eyebrow_outer': point(0.37, 0.37),
+        'right_eyebrow_inner': point(0.54, 0.375),
+        'right_eyebrow_outer': point(0.63, 0.37),
+        'nose_tip': point(0.50, 0.46),
+        'nose_bridge': point(0.50, 0.41),
+        'chin': point(0.50, 0.58),
+        'jaw_left': point(0.34, 0.47),
+        'jaw_right': point(0.66, 0.47),
+        'forehead_center': point(0.50, 0.32),
+        'left_cheek': point(0.40, 0.48),
+        'right_cheek': point(0.60, 0.48),
+        'left_eye_bbox': bbox(0.38, 0.39, 0.08, 0.02),
+        'right_eye_bbox': bbox(0.54, 0.39, 0.08, 0.02),
+        'mouth_bbox': bbox(0.44, 0.505, 0.12, 0.02),
+        'face_bbox': bbox(0.34, 0.32, 0.32, 0.26),
+        'all_landmarks': None
+    }
+
+def engine_kernels() -> List[Kernel]:
+    from services.advanced_video_engine import AdvancedVideoEngine, CameraMovement
+    from services.optical_flow import FlowEstimator, FlowMethod
+
+    # The filters and camera moves don't use the VGG model, so skip loading it
+    with mock.patch.object(AdvancedVideoEngine, "load_style_transfer_model", lambda self: None):
+        engine = AdvancedVideoEngine()
+
+    kernels = []
+    for style in ("vintage", "noir", "neon", "watercolor", "anime"):
+        def prepare(w, h, apply=getattr(engine, f"_apply_{style}_filter")):
+            img = Image.fromarray(test_frame(w, h))
+            return lambda: apply(img)
+        kernels.append(Kernel(f"engine.filter.{style}", prepare))
+
+    for movement in CameraMovement:
+        def prepare(w, h, movement=movement):
+            frame = test_frame(w, h)
+            return lambda: engine.apply_camera_movement(frame, 15, 30, movement)
+        kernels.append(Kernel(f"engine.camera.{movement.value}", prepare))
+
+    def prepare_flow(w, h, method):
+        estimator = FlowEstimator()
+        frame = test_frame(w, h)
+        moved = shifted_frame(frame)
+        # What a cache miss costs: downscale both inputs and compute, bypassing reuse
+        return lambda: estimator.compute(estimator.downscale(frame, "bench_prev"),
+                                         estimator.downscale(moved, "bench_curr"), method)
+
+    def prepare_warp(w, h):
+        frame = test_frame(w, h)
+        flow = np.full((h, w, 2), 1.5, dtype=np.float32)
+        return lambda: engine.apply_optical_flow_warp(frame, flow)
+
+    def prepare_lighting(w, h):
+        frame = test_frame(w, h)
+        return lambda: engine.apply_dynamic_lighting(frame, 10, 30)
+
+    def prepare_atmosphere(w, h):
+        frame = test_frame(w, h)
+        return lambda: engine.apply_atmospheric_effects(frame, 10)
+
+    for method in FlowMethod:
+        kernels.append(Kernel(f"engine.optical_flow.{method.value}",
+                              lambda w, h, method=method: prepare_flow(w, h, method)))
+
+    kernels += [
+        Kernel("engine.optical_flow_warp", prepare_warp),
+        Kernel("engine.lighting", prepare_lighting),
+        Kernel("engine.atmosphere", prepare_atmosphere),
+    ]
+    return kernels
+
+def physics_kernels() -> List[Kernel]:
+    from services.physics_video_generator import PhysicsVideoGenerator
+
+    def generator(w, h) -> PhysicsVideoGenerator:
+        gen = PhysicsVideoGenerator(w, h)
+        gen.particles = gen.initialize_fluid_particles(w / 2, h / 3, count=200)
+        for particle in gen.particles:
+            # Keep particles alive however many times the kernel runs
+            particle.lifetime = particle.max_lifetime = 1e9
+        return gen
+
+    def prepare_interpolate(w, h):
+        gen = PhysicsVideoGenerator(w, h)
+        frame = test_frame(w, h)
+        moved = shifted_frame(frame, 12, 8)
+        return lambda: gen.interpolate_frames(frame, moved, 1)
+
+    def prepare_update(w, h):
+        gen = generator(w, h)
+        return lambda: [p.update(1 / 30, w, h, gen.obstacles) for p in gen.particles]
+
+    def prepare_draw(w, h):
+        gen = generator(w, h)
+        frame = test_frame(w, h)
+        return lambda: gen.render_particles(frame.copy())
+
+    def prepare_post(w, h):
+        gen = PhysicsVideoGenerator(w, h)
+        frame = test_frame(w, h)
+        return lambda: gen.apply_post_processing(frame.copy(), 0, 30)
+
+    return [
+        Kernel("physics.interpolate_frames", prepare_interpolate),
+        Kernel("physics.particle_update", prepare_update),
+        Kernel("physics.particle_draw", prepare_draw),
+        Kernel("physics.post_processing", prepare_post),
+    ]
+
+def animator_kernels() -> List[Kernel]:
+    from services.advanced_character_animator import AdvancedCharacterAnimator, EmotionType
+
+    animator = AdvancedCharacterAnimator()
+    emotion = EmotionType.HAPPY
+
+    def stage(call):
+        def prepare(w, h):
+            frame = test_frame(w, h)
+            landmarks = synthetic_landmarks(w, h)
+            return lambda: call(frame.copy(), landmarks)
+        return prepare
+
+    def prepare_global_motion(w, h):
+        frame = test_frame(w, h)
+        M = animator.global_motion_matrix(frame.shape, 7, emotion, 0.6, 0.3)
+        out = np.empty_like(frame)
+        return lambda: animator.apply_global_motion(frame, M, dst=out)
+
+    return [
+        Kernel("animator.mouth", stage(lambda f, lm: animator.animate_mouth_advanced(f, lm, 0.6, emotion, 0.3))),
+        Kernel("animator.eyes", stage(lambda f, lm: animator.animate_eyes(f, lm, 7, emotion))),
+        Kernel("animator.eyebrows", stage(lambda f, lm: animator.animate_eyebrows(f, lm, 7, emotion, 0.4, 0.3))),
+        Kernel("animator.micro_expressions", stage(lambda f, lm: animator.add_micro_expressions(f, 7, emotion, lm))),
+        Kernel("animator.global_motion", prepare_global_motion),
+        Kernel("animator.render_frame", stage(lambda f, lm: animator.render_frame(f, lm, 7, emotion, 0.6, 0.4, 0.3, 0.3))),
+    ]
+
+def compositor_kernels() -> List[Kernel]:
+    from services.compositor import Compositor, Layer, LayerTransform
+
+    def prepare_overlay(w, h, animated=False):
+        frame = test_frame(w, h)
+        sprite = test_frame(w // 3, h // 3, seed=1)
+        x, y = w - w // 3 - 50, h - h // 3 - 100
+        transform = (lambda i, total: LayerTransform(x - i % 20, y, scale=1.0 + 0.01 * (i % 10), opacity=0.3)) \
+            if animated else LayerTransform(x, y, opacity=0.3)
+        compositor = Compositor([Layer.from_image(sprite, (w // 3, h // 3), transform, feather=9)])
+        counter = iter(range(10 ** 9))
+        return lambda: compositor.composite(frame, next(counter), 30)
+
+    return [
+        Kernel("compositor.hybrid_overlay", prepare_overlay),
+        Kernel("compositor.animated_overlay", lambda w, h: prepare_overlay(w, h, animated=True)),
+    ]
+
+def effects_kernels() -> List[Kernel]:
+    from services.effects import Blur, EffectGraph, Grade, OpenCVBackend, Warp
+
+    backend = OpenCVBackend()
+
+    def graph_kernel(build):
+        def prepare(w, h):
+            frame = test_frame(w, h)
+            out = np.empty_like(frame)
+            graph = build(w, h)
+            return lambda: backend.render(graph, frame, dst=out)
+        return prepare
+
+    return [
+        # Lighting and fog fuse into one transform; the zoom is a crop resize
+        Kernel("effects.grades_zoom", graph_kernel(lambda w, h: EffectGraph()
+                                                   .add(Grade.gain(0.97)).add(Grade.mix([200, 200, 210], 0.03))
+                                                   .add(Warp.crop(w // 10, h // 10, w - w // 10, h - h // 10, w, h)))),
+        Kernel("effects.pan", graph_kernel(lambda w, h: EffectGraph().add(Warp.translate(w // 20, 0)))),
+        Kernel("effects.rotate_blur", graph_kernel(lambda w, h: EffectGraph()
+                                                   .add(Warp.rotate((w // 2, h // 2), 7)).add(Blur.motion(5)))),
+    ]
+
+KERNEL_GROUPS = {
+    "engine": engine_kernels,
+    "physics": physics_kernels,
+    "animator": animator_kernels,
+    "compositor": compositor_kernels,
+    "effects": effects_kernels,
+}
+
+def preset_resolutions() -> List[Tuple[int, int]]:
+    try:
+        from services.advanced_video_engine import QualityPreset
+        resolutions = [preset.value["resolution"] for preset in QualityPreset]
+    except ImportError:
+        resolutions = [(480, 854), (720, 1280), (1080, 1920)]
+    return sorted(set(resolutions), key=lambda r: r[0] * r[1])
+
+def time_kernel(fn: Callable[[], object], min_time: float, max_runs: int) -> Tuple[float, float, int]:
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+        samples = []
+        deadline = time.perf_counter() + min_time
+        while len(samples) < max_runs and (len(samples) < 5 or time.perf_counter() < deadline):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), min(samples), len(samples)
+
+def load_baseline(path: Path) -> Dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+def save_baseline(path: Path, results: List[KernelResult], threshold: float, previous: Dict) -> None:
+    kernels = dict(previous.get("kernels", {}))
+    for r in results:
+        entry = {"min_ms": round(r.min_ms, 4), "median_ms": round(r.median_ms, 4)}
+        # Per-kernel thresholds edited into the file survive re-baselining
+        if "threshold" in kernels.get(r.key, {}):
+            entry["threshold"] = kernels[r.key]["threshold"]
+        kernels[r.key] = entry
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "threshold": previous.get("threshold", threshold),
+        "kernels": kernels,
+    }, indent=2, sort_keys=True))
+    print(f"💾 Baseline for {len(results)} kernels written to {path}")
+
+def compare(results: List[KernelResult], baseline: Dict, threshold: Optional[float]) -> List[str]:
+    default_threshold = baseline.get("threshold", DEFAULT_THRESHOLD)
+    regressions = []
+    # Minimum of the runs: scheduler noise only ever adds time, so it is the stablest statistic
+    print(f"\n{'kernel':<44} {'min':>10} {'baseline':>10} {'change':>8}")
+    print(f"{'-'*76}")
+    for r in results:
+        entry = baseline.get("kernels", {}).get(r.key)
+        if entry is None:
+            print(f"{r.key:<44} {r.min_ms:9.3f}ms {'—':>10} {'new':>8}")
+            continue
+        limit = threshold if threshold is not None else entry.get("threshold", default_threshold)
+        change = r.min_ms / entry["min_ms"] - 1 if entry["min_ms"] > 0 else 0.0
+        regressed = change > limit and r.min_ms - entry["min_ms"] > MIN_REGRESSION_MS
+        mark = " ❌" if regressed else (" 🚀" if change < -limit else "")
+        print(f"{r.key:<44} {r.min_ms:9.3f}ms {entry['min_ms']:9.3f}ms {change:+7.1%}{mark}")
+        if regressed:
+            regressions.append(f"{r.key}: {entry['min_ms']:.3f}ms → {r.min_ms:.3f}ms "
+                               f"({change:+.1%}, threshold {limit:.0%})")
+    return regressions
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Per-frame kernel microbenchmarks")
+    parser.add_argument("--filter", default=None, help="regex on kernel names")
+    parser.add_argument("--resolution", action="append", type=parse_resolution, default=None,
+                        help="WxH to run at (repeatable); defaults to every QualityPreset resolution")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent timing each kernel")
+    parser.add_argument("--max-runs", type=int, default=200)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="record results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help=f"allowed slowdown as a fraction (default from baseline file, else {DEFAULT_THRESHOLD})")
+    parser.add_argument("--json", dest="json_path", default=None, help="write results to this file")
+    return parser.parse_args()
+
+def main() -> int:
+    args = parse_args()
+    pattern = re.compile(args.filter) if args.filter else None
+    resolutions = args.resolution or preset_resolutions()
+
+    kernels: List[Kernel] = []
+    for group, build in KERNEL_GROUPS.items():
+        try:
+            kernels += build()
+        except ImportError as e:
+            print(f"⚠️  Skipping {group} kernels: {e}")
+    if pattern:
+        kernels = [k for k in kernels if pattern.search(k.name)]
+    if not kernels:
+        print("No kernels to run")
+        return 1
+
+    results: List[KernelResult] = []
+    for width, height in resolutions:
+        print(f"\n📏 {width}x{height}")
+        for kernel in kernels:
+            fn = kernel.prepare(width, height)
+            median_ms, min_ms, runs = time_kernel(fn, args.min_time, args.max_runs)
+            results.append(KernelResult(kernel.name, f"{width}x{height}", median_ms, min_ms, runs))
+            print(f"   {kernel.name:<36} {median_ms:9.3f}ms  (min {min_ms:.3f}ms, {runs} runs)")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps([{**r.__dict__, "key": r.key} for r in results], indent=2))
+
+    baseline = load_baseline(args.baseline)
+    if args.save_baseline:
+        save_baseline(args.baseline, results, args.threshold or DEFAULT_THRESHOLD, baseline)
+        return 0
+    if not baseline:
+        print(f"\nℹ️  No baseline at {args.baseline}, run with --save-baseline to record one")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} kernel(s) regressed:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+    print("\n✅ No kernel regressed beyond its threshold")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
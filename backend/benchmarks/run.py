@@ -0,0 +1,406 @@
+"""
+End-to-end benchmarks for every generation pipeline, run offline against the
+fixture server in benchmarks/stubs.py. Each case runs in a fresh process so
+peak RSS and caches are per case.
+
+    cd backend
+    python -m benchmarks.run                       # default matrix, 2s clips
+    python -m benchmarks.run --filter 'cinematic/.*/speed' --duration 5
+    python -m benchmarks.run --json results.json --write-cost-model
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.stubs import ENHANCED_PROMPT, SCRIPT, FixtureServer, offline
+
+EFFECT_FLAGS = (
+    "enable_optical_flow",
+    "enable_style_transfer",
+    "enable_lighting_effects",
+    "enable_atmospheric_effects",
+)
+
+@dataclass
+class BenchCase:
+    name: str
+    pipeline: str
+    params: Dict = field(default_factory=dict)
+
+@dataclass
+class BenchResult:
+    name: str
+    pipeline: str
+    params: Dict
+    wall_seconds: float = 0.0
+    stages: Dict[str, float] = field(default_factory=dict)
+    frames: int = 0
+    resolution: Tuple[int, int] = (0, 0)
+    frames_per_second: float = 0.0
+    peak_rss_mb: float = 0.0
+    output_bytes: int = 0
+    error: Optional[str] = None
+
+class StageTimer:
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+def probe_video(path: Path) -> Tuple[int, Tuple[int, int]]:
+    import cv2
+    capture = cv2.VideoCapture(str(path))
+    try:
+        frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        return frames, size
+    finally:
+        capture.release()
+
+def preset_settings(quality: str) -> Tuple[int, Tuple[int, int], str]:
+    from services.advanced_video_engine import QualityPreset
+    preset = QualityPreset[quality.upper()].value
+    return preset["fps"], preset["resolution"], preset["bitrate"]
+
+def synthesize(timer: StageTimer, path: Path) -> str:
+    from services.tts_service import synthesize_audio
+    with timer.stage("tts"):
+        asyncio.run(synthesize_audio(SCRIPT, str(path)))
+    return str(path)
+
+def bench_prompts(timer: StageTimer, params: Dict, work: Path, duration: float) -> Dict:
+    from models.script_generator import generate_tiktok_script
+    from services.perplexity_service import PerplexityService
+    with timer.stage("script"):
+        script = generate_tiktok_script("octopus facts")
+    with timer.stage("enhance"):
+        asyncio.run(PerplexityService().enhance_video_prompt(script, mode="advanced"))
+    return {}
+
+def bench_tiktok(timer: StageTimer, params: Dict, work: Path, duration: float) -> Dict:
+    from services.local_video_generator import generate_ai_video_free
+    from services.video_assembler import create_tiktok_video
+    from services.video_finder import find_and_download_video
+
+    background = work / "background.mp4"
+    with timer.stage("background"):
+        if params.get("background") == "pexels":
+            find_and_download_video(SCRIPT, str(background))
+        else:
+            generate_ai_video_free(SCRIPT, str(background))
+    audio = synthesize(timer, work / "speech.mp3")
+    output = work / "tiktok.mp4"
+    with timer.stage("render"):
+        create_tiktok_video(SCRIPT, audio, str(background), str(output),
+                            resolution=tuple(params.get("resolution", (720, 1280))), fps=params.get("fps", 15))
+    return {"output": output}
+
+def bench_free_video(timer: StageTimer, params: Dict, work: Path, duration: float) -> Dict:
+    from services.local_video_generator import generate_ai_video_free
+    output = work / "free.mp4"
+    with timer.stage("generate"):
+        generate_ai_video_free(ENHANCED_PROMPT, str(output))
+    return {"output": output}
+
+def bench_replicate(timer: StageTimer, params: Dict, work: Path, duration: float) -> Dict:
+    from services.ai_video_generator import generate_ai_video
+    output = work / "replicate.mp4"
+    with timer.stage("generate"):
+        generate_ai_video(ENHANCED_PROMPT, str(output))
+    return {"output": output}
+
+def bench_cinematic(timer: StageTimer, params: Dict, work: Path, duration: float) -> Dict:
+    from services.advanced_video_engine import (
+        AdvancedVideoEngine, CameraMovement, QualityPreset, VideoConfig, VideoStyle
+    )
+    from services.segment_encoder import encode_frames
+
+    fps, _, bitrate = preset_settings(params["quality"])
+    with timer.stage("load_models"):
+        engine = AdvancedVideoEngine()
+    config = VideoConfig(
+        style=VideoStyle(params["style"]),
+        quality=QualityPreset[params["quality"].upper()],
+        camera_movement=CameraMovement(params["camera"]),
+        duration=duration,
+        **params.get("effects", {})
+    )
+    with timer.stage("frames"):
+        frames = engine.generate_video_frames(config, ENHANCED_PROMPT)
+    output = work / "cinematic.mp4"
+    with timer.stage("encode"):
+        encode_frames(frames, str(output), fps, bitrate=bitrate)
+    return {"output": output, "frames": len(frames), "resolution": (frames[0].shape[1], frames[0].shape[0])}
+
+def bench_character(timer: StageTimer, params: Dict, work: Path, duration: float) -> Dict:
+    from services.advanced_character_animator import AdvancedCharacterAnimator, EmotionType
+    from services.ai_image_generator import generate_ai_image
+
+    fps, resolution, _ = preset_settings(params["quality"])
+    image = work / "character.png"
+    with timer.stage("image"):
+        generate_ai_image("professional portrait, realistic human, clear face, high detail", str(image))
+    audio = synthesize(timer, work / "speech.mp3")
+    with timer.stage("load_models"):
+        animator = AdvancedCharacterAnimator()
+    resolution = (min(resolution[0], animator.width), min(resolution[1], animator.height))
+    output = work / "character.mp4"
+    with timer.stage("animate"):
+        animator.create_animated_video(str(image), audio, str(output), EmotionType.HAPPY,
+                                       duration, fps, resolution=resolution)
+    return {"output": output}
+
+def bench_hybrid(timer: StageTimer, params: Dict, work: Path, duration: float) -> Dict:
+    from services.unified_video_generator import UnifiedVideoGenerator
+
+    quality = params["quality"]
+    fps, _, _ = preset_settings(quality)
+    with timer.stage("load_models"):
+        generator = UnifiedVideoGenerator()
+    audio = synthesize(timer, work / "speech.mp3")
+    with timer.stage("image"):
+        image_url = generator._generate_character_image(generator._get_character_prompt("person"), quality)
+    with timer.stage("background_frames"):
+        background = generator._generate_background_frames(ENHANCED_PROMPT, "cinematic", quality, "static", duration)
+    output = work / "hybrid.mp4"
+    # _compose_hybrid_video split in two so compositing and encoding are timed separately
+    with timer.stage("compose"):
+        frames = generator._compose_hybrid_frames(image_url, background, audio, "happy", fps)
+    with timer.stage("encode"):
+        generator.write_video(frames, audio, str(output), quality, duration)
+    return {"output": output, "frames": len(frames), "resolution": (frames[0].shape[1], frames[0].shape[0])}
+
+def bench_physics(timer: StageTimer, params: Dict, work: Path, duration: float) -> Dict:
+    from services.physics_video_generator import PhysicsVideoGenerator
+    from services.segment_encoder import encode_frames
+
+    fps, resolution, bitrate = preset_settings(params["quality"])
+    with timer.stage("load_models"):
+        generator = PhysicsVideoGenerator(*resolution)
+    with timer.stage("frames"):
+        frames = generator.generate_physics_video(
+            "Water splashing into a glass with droplets and particles", duration=duration, fps=fps)
+    output = work / "physics.mp4"
+    with timer.stage("encode"):
+        encode_frames(frames, str(output), fps, bitrate=bitrate)
+    return {"output": output, "frames": len(frames), "resolution": (frames[0].shape[1], frames[0].shape[0])}
+
+PIPELINES = {
+    "prompts": bench_prompts,
+    "tiktok": bench_tiktok,
+    "free_video": bench_free_video,
+    "replicate": bench_replicate,
+    "cinematic": bench_cinematic,
+    "character": bench_character,
+    "hybrid": bench_hybrid,
+    "physics": bench_physics,
+}
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_case(case: BenchCase, base_url: str, duration: float) -> BenchResult:
+    result = BenchResult(case.name, case.pipeline, case.params)
+    timer = StageTimer()
+    work = Path(tempfile.mkdtemp(prefix="bench_"))
+    start = time.perf_counter()
+    try:
+        with offline(base_url):
+            info = PIPELINES[case.pipeline](timer, case.params, work, duration)
+        result.wall_seconds = time.perf_counter() - start
+        output = info.get("output")
+        if output is not None and Path(output).exists():
+            result.output_bytes = Path(output).stat().st_size
+            frames, size = probe_video(output)
+            result.frames = info.get("frames", frames)
+            result.resolution = tuple(info.get("resolution", size))
+        if result.frames:
+            result.frames_per_second = result.frames / result.wall_seconds
+    except Exception as e:
+        result.wall_seconds = time.perf_counter() - start
+        result.error = f"{e}\n{traceback.format_exc()}"
+    finally:
+        import shutil
+        shutil.rmtree(work, ignore_errors=True)
+    result.stages = {name: round(seconds, 3) for name, seconds in timer.stages.items()}
+    result.peak_rss_mb = round(peak_rss_mb(), 1)
+    return result
+
+def build_cases(full_grid: bool = False) -> List[BenchCase]:
+    from services.advanced_video_engine import CameraMovement, QualityPreset, VideoStyle
+
+    styles = [style.value for style in VideoStyle]
+    presets = [preset.name.lower() for preset in QualityPreset]
+    cameras = [camera.value for camera in CameraMovement]
+
+    cases = [
+        BenchCase("prompts", "prompts"),
+        BenchCase("tiktok/generated", "tiktok", {"background": "generated"}),
+        BenchCase("tiktok/pexels", "tiktok", {"background": "pexels"}),
+        BenchCase("free_video", "free_video"),
+        BenchCase("replicate", "replicate"),
+    ]
+
+    if full_grid:
+        grid = [(s, q, c) for s in styles for q in presets for c in cameras]
+    else:
+        grid = [(s, "speed", "static") for s in styles]
+        grid += [("cinematic", q, "static") for q in presets]
+        grid += [("cinematic", "speed", c) for c in cameras]
+    seen = set()
+    for style, quality, camera in grid:
+        if (style, quality, camera) in seen:
+            continue
+        seen.add((style, quality, camera))
+        cases.append(BenchCase(f"cinematic/{style}/{quality}/{camera}", "cinematic",
+                               {"style": style, "quality": quality, "camera": camera}))
+
+    # Effect isolation cases, used to fit the render cost model
+    cases.append(BenchCase("cinematic/effects/none", "cinematic",
+                           {"style": "cinematic", "quality": "speed", "camera": "static",
+                            "effects": {flag: False for flag in EFFECT_FLAGS}}))
+    for flag in EFFECT_FLAGS:
+        cases.append(BenchCase(f"cinematic/effects/{flag[len('enable_'):]}", "cinematic",
+                               {"style": "cinematic", "quality": "speed", "camera": "static",
+                                "effects": {f: f == flag for f in EFFECT_FLAGS}}))
+
+    for quality in ("speed", "balanced"):
+        cases.append(BenchCase(f"character/{quality}", "character", {"quality": quality}))
+        cases.append(BenchCase(f"hybrid/{quality}", "hybrid", {"quality": quality}))
+        cases.append(BenchCase(f"physics/{quality}", "physics", {"quality": quality}))
+    return cases
+
+def megapixel_frames(result: BenchResult) -> float:
+    return result.frames * result.resolution[0] * result.resolution[1] / 1e6
+
+def fit_cost_coefficients(results: List[BenchResult]) -> Dict[str, float]:
+    """
+    Per megapixel-frame coefficients for services.render_scheduler.CostModel,
+    derived from the effect isolation cases and the per-pipeline stage times.
+    """
+    ok = {r.name: r for r in results if not r.error and r.frames}
+    coefficients: Dict[str, float] = {}
+
+    def per_mpf(result: BenchResult, stage: str) -> float:
+        return result.stages.get(stage, 0.0) / max(megapixel_frames(result), 1e-9)
+
+    encodes = sorted(per_mpf(r, "encode") for r in ok.values() if "encode" in r.stages)
+    if encodes:
+        coefficients["encode"] = encodes[len(encodes) // 2]
+    encode = coefficients.get("encode", 0.0)
+
+    base_case = ok.get("cinematic/effects/none")
+    if base_case:
+        coefficients["base"] = per_mpf(base_case, "frames")
+        coefficients["cinematic"] = 0.0
+        for flag in EFFECT_FLAGS:
+            effect_case = ok.get(f"cinematic/effects/{flag[len('enable_'):]}")
+            if effect_case:
+                coefficients[flag] = max(0.0, per_mpf(effect_case, "frames") - coefficients["base"])
+    base = coefficients.get("base", 0.0)
+
+    def average(values: List[float]) -> Optional[float]:
+        return sum(values) / len(values) if values else None
+
+    kinds = {
+        "character": [per_mpf(r, "animate") - base - encode for r in ok.values() if r.pipeline == "character"],
+        "physics": [per_mpf(r, "frames") - base for r in ok.values() if r.pipeline == "physics"],
+        "hybrid": [per_mpf(r, "compose") for r in ok.values() if r.pipeline == "hybrid"],
+        "tiktok": [per_mpf(r, "render") - base - encode for r in ok.values() if r.pipeline == "tiktok"],
+    }
+    for kind, values in kinds.items():
+        value = average(values)
+        if value is not None:
+            coefficients[kind] = max(0.0, value)
+    return {key: round(value, 6) for key, value in coefficients.items()}
+
+def print_report(results: List[BenchResult]) -> None:
+    print(f"\n{'='*110}")
+    print(f"{'case':<40} {'wall':>8} {'frames':>7} {'fps':>7} {'rss MB':>8} {'out MB':>7}  stages")
+    print(f"{'-'*110}")
+    for r in results:
+        if r.error:
+            print(f"{r.name:<40} {r.wall_seconds:7.2f}s  ❌ {r.error.splitlines()[0][:55]}")
+            continue
+        stages = " · ".join(f"{name} {seconds:.2f}s" for name, seconds in r.stages.items())
+        print(f"{r.name:<40} {r.wall_seconds:7.2f}s {r.frames:>7} {r.frames_per_second:7.1f} "
+              f"{r.peak_rss_mb:8.0f} {r.output_bytes / 1e6:7.2f}  {stages}")
+    print(f"{'='*110}\n")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmarks")
+    parser.add_argument("--duration", type=float, default=2.0, help="clip length in seconds")
+    parser.add_argument("--filter", default=None, help="regex on case names")
+    parser.add_argument("--full-grid", action="store_true", help="every style x preset x camera combination")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated network latency per request (ms)")
+    parser.add_argument("--list", action="store_true", help="list cases and exit")
+    parser.add_argument("--json", dest="json_path", default=None, help="write results to this file")
+    parser.add_argument("--write-cost-model", nargs="?", const="", default=None, metavar="PATH",
+                        help="fit render cost coefficients and save them (default RENDER_COST_MODEL path)")
+    return parser.parse_args()
+
+def main() -> int:
+    args = parse_args()
+    cases = build_cases(args.full_grid)
+    if args.filter:
+        pattern = re.compile(args.filter)
+        cases = [case for case in cases if pattern.search(case.name)]
+    if args.list or not cases:
+        for case in cases:
+            print(case.name)
+        return 0
+
+    results: List[BenchResult] = []
+    with FixtureServer(latency=args.latency / 1000) as server:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn"), max_tasks_per_child=1) as pool:
+            for i, case in enumerate(cases, 1):
+                print(f"\n🏁 [{i}/{len(cases)}] {case.name}")
+                result = pool.submit(run_case, case, server.base_url, args.duration).result()
+                status = "❌ failed" if result.error else f"✅ {result.wall_seconds:.2f}s"
+                print(f"🏁 {case.name}: {status}")
+                results.append(result)
+
+    print_report(results)
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps({
+            "created_at": time.time(),
+            "duration": args.duration,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "results": [asdict(r) for r in results],
+        }, indent=2))
+        print(f"💾 Results written to {args.json_path}")
+
+    if args.write_cost_model is not None:
+        from services.render_scheduler import COST_MODEL_PATH, CostModel
+        model = CostModel(fit_cost_coefficients(results))
+        path = Path(args.write_cost_model) if args.write_cost_model else COST_MODEL_PATH
+        model.save(path)
+        print(f"📐 Render cost model written to {path}: {model.coefficients}")
+
+    return 1 if any(r.error for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""
+Offline stand-ins for the external services the pipelines call. A local HTTP
+server generates fixture images, audio, videos and JSON answers, and offline()
+points requests, httpx and edge-tts at it, so benchmarks measure our own code
+instead of Pollinations/Pexels/Replicate/Perplexity/ZhipuAI/edge-tts latency.
+
+Drop a portrait at benchmarks/fixtures/character.jpg (or set BENCH_FIXTURE_DIR)
+to exercise the face-mesh path of the character animator; the generated
+fixture images have no face in them.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from unittest import mock
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from services.segment_encoder import get_ffmpeg_binary
+
+FIXTURE_DIR = Path(os.getenv("BENCH_FIXTURE_DIR", Path(__file__).resolve().parent / "fixtures"))
+
+STUB_HOSTS = {
+    "image.pollinations.ai",
+    "api.pexels.com",
+    "api.replicate.com",
+    "api.perplexity.ai",
+    "open.bigmodel.cn",
+    "speech.platform.bing.com",
+}
+
+WORD_SECONDS = 0.35
+OFFLINE_ENV = {
+    "PERPLEXITY_API_KEY": "offline",
+    "PEXELS_API_KEY": "offline",
+    "REPLICATE_API_TOKEN": "offline",
+    "ZHIPU_API_KEY": "offline.benchmark",
+}
+
+ENHANCED_PROMPT = ("A sweeping cinematic shot of a coastal city at golden hour, volumetric light through "
+                   "clouds, gentle waves, soft film grain, rich warm colors")
+SCRIPT = ("Did you know octopuses have three hearts? Two pump blood to the gills, one to the body. "
+          "Their blood is blue because it uses copper. And they can taste with their arms. "
+          "Follow for more ocean facts!")
+
+def _fixture_image(width: int, height: int, seed: str, name: Optional[str] = None) -> bytes:
+    if name and (FIXTURE_DIR / name).exists():
+        img = Image.open(FIXTURE_DIR / name).convert("RGB").resize((width, height), Image.Resampling.LANCZOS)
+    else:
+        rng = np.random.default_rng(int(hashlib.md5(seed.encode()).hexdigest()[:8], 16))
+        y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+        base = rng.uniform(40, 200, 3)
+        gradient = np.stack([base[0] + 50 * x / width, base[1] + 50 * y / height,
+                             base[2] + 30 * np.sin(x / 97.0) * np.cos(y / 61.0)], axis=-1)
+        noise = rng.normal(0, 12, (height, width, 3))
+        img = Image.fromarray(np.clip(gradient + noise, 0, 255).astype(np.uint8))
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+            r = rng.uniform(0.03, 0.15) * min(width, height)
+            draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=tuple(int(c) for c in rng.uniform(0, 255, 3)))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def _ffmpeg(args, output: Path) -> bytes:
+    subprocess.run([get_ffmpeg_binary(), "-y", "-loglevel", "error", *args, str(output)],
+                   check=True, stdin=subprocess.DEVNULL)
+    return output.read_bytes()
+
+class FixtureServer:
+    """
+    Local HTTP server answering the stubbed hosts' endpoints. Requests arrive as
+    /<host>/<path>; responses are generated once and cached. latency adds a
+    fixed delay per request for modelling network time.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.workdir = Path(tempfile.mkdtemp(prefix="bench_fixtures_"))
+        self._cache: Dict[Tuple, bytes] = {}
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FixtureServer":
+        self._thread.start()
+        print(f"🧪 Fixture server on {self.base_url}")
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _cached(self, key: Tuple, make) -> bytes:
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = make()
+            return self._cache[key]
+
+    def audio(self, words: int) -> bytes:
+        seconds = max(1.0, words * WORD_SECONDS)
+        return self._cached(("audio", words), lambda: _ffmpeg(
+            ["-f", "lavfi", "-i", f"sine=frequency=180:duration={seconds:.2f}",
+             "-af", "volume='0.4+0.3*sin(2*PI*3*t)':eval=frame", "-c:a", "libmp3lame", "-q:a", "6"],
+            self.workdir / f"speech_{words}.mp3"))
+
+    def background_video(self) -> bytes:
+        return self._cached(("video",), lambda: _ffmpeg(
+            ["-f", "lavfi", "-i", "testsrc2=size=1920x1080:rate=30:duration=6",
+             "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p"],
+            self.workdir / "background.mp4"))
+
+    def route(self, method: str, path: str, query: Dict[str, str], body: bytes) -> Tuple[int, str, bytes]:
+        host, _, rest = path.lstrip("/").partition("/")
+        rest = "/" + rest
+
+        if host == "image.pollinations.ai":
+            width, height = int(query.get("width", 1080)), int(query.get("height", 1920))
+            fixture = "character.jpg" if any(w in rest for w in ("portrait", "character", "face")) else None
+            data = self._cached(("image", width, height, rest[:80], fixture),
+                                lambda: _fixture_image(width, height, rest, fixture))
+            return 200, "image/jpeg", data
+
+        if host == "api.pexels.com":
+            answer = {"videos": [{"video_files": [{"quality": "hd", "width": 1920, "height": 1080,
+                                                   "link": f"{self.base_url}/fixtures/background.mp4"}]}]}
+            return 200, "application/json", json.dumps(answer).encode()
+
+        if host == "fixtures" and rest == "/background.mp4":
+            return 200, "video/mp4", self.background_video()
+
+        if host == "api.replicate.com":
+            answer = {"id": "offline", "status": "succeeded",
+                      "output": f"{self.base_url}/fixtures/background.mp4",
+                      "urls": {"get": f"{self.base_url}/api.replicate.com/v1/predictions/offline"}}
+            return 200, "application/json", json.dumps(answer).encode()
+
+        if host in ("api.perplexity.ai", "open.bigmodel.cn"):
+            content = ENHANCED_PROMPT if host == "api.perplexity.ai" else SCRIPT
+            answer = {"id": "offline", "object": "chat.completion", "created": int(time.time()), "model": "offline",
+                      "choices": [{"index": 0, "finish_reason": "stop",
+                                   "message": {"role": "assistant", "content": content}}],
+                      "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}}
+            return 200, "application/json", json.dumps(answer).encode()
+
+        if host == "speech.platform.bing.com":
+            return 200, "audio/mpeg", self.audio(int(query.get("words", 10)))
+
+        return 404, "text/plain", f"No fixture for {host}{rest}".encode()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _serve(self):
+                parsed = urllib.parse.urlsplit(self.path)
+                query = dict(urllib.parse.parse_qsl(parsed.query))
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                host = parsed.path.lstrip("/").split("/", 1)[0]
+                with server._lock:
+                    server.requests[host] = server.requests.get(host, 0) + 1
+                if server.latency:
+                    time.sleep(server.latency)
+                try:
+                    status, content_type, data = server.route(self.command, parsed.path, query, body)
+                except Exception as e:
+                    status, content_type, data = 500, "text/plain", str(e).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def rewrite_url(url: str, base_url: str) -> str:
+    parts = urllib.parse.urlsplit(str(url))
+    if parts.hostname not in STUB_HOSTS:
+        return str(url)
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{base_url}/{parts.hostname}{parts.path}{query}"
+
+class OfflineCommunicate:
+    """
+    Drop-in for edge_tts.Communicate that streams fixture speech and evenly
+    spaced word boundaries.
+    """
+
+    base_url = ""
+
+    def __init__(self, text: str, voice: str = "", rate: str = "+0%", **kwargs):
+        self.text = text
+
+    async def stream(self):
+        words = self.text.split()
+        url = f"{self.base_url}/speech.platform.bing.com/tts?words={len(words)}"
+        data = await asyncio.to_thread(lambda: urllib.request.urlopen(url).read())
+        for i, word in enumerate(words):
+            yield {"type": "WordBoundary", "offset": int(i * WORD_SECONDS * 1e7),
+                   "duration": int(WORD_SECONDS * 0.8 * 1e7), "text": word}
+        yield {"type": "audio", "data": data}
+
+@contextmanager
+def offline(base_url: str):
+    """
+    Route every stubbed host to the fixture server and give the image and TTS
+    caches a fresh directory, so each run starts cold. VGG19 is built with
+    random weights: same compute, no download.
+    """
+    import requests
+    import httpx
+    import edge_tts
+
+    cache_root = Path(tempfile.mkdtemp(prefix="bench_cache_"))
+    original_request = requests.sessions.Session.request
+    original_send = httpx.Client.send
+    original_async_send = httpx.AsyncClient.send
+
+    def request(self, method, url, *args, **kwargs):
+        return original_request(self, method, rewrite_url(url, base_url), *args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        request.url = httpx.URL(rewrite_url(request.url, base_url))
+        return original_send(self, request, *args, **kwargs)
+
+    async def async_send(self, request, *args, **kwargs):
+        request.url = httpx.URL(rewrite_url(request.url, base_url))
+        return await original_async_send(self, request, *args, **kwargs)
+
+    OfflineCommunicate.base_url = base_url
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.dict(os.environ, OFFLINE_ENV))
+        stack.enter_context(mock.patch.object(requests.sessions.Session, "request", request))
+        stack.enter_context(mock.patch.object(httpx.Client, "send", send))
+        stack.enter_context(mock.patch.object(httpx.AsyncClient, "send", async_send))
+        stack.enter_context(mock.patch.object(edge_tts, "Communicate", OfflineCommunicate))
+
+        from services import advanced_video_engine, ai_image_generator, tts_service, video_finder
+        original_vgg19 = advanced_video_engine.vgg19
+        stack.enter_context(mock.patch.object(
+            advanced_video_engine, "vgg19", lambda pretrained=False, **kwargs: original_vgg19(pretrained=False, **kwargs)))
+        for module, attribute in ((ai_image_generator, "CACHE_DIR"), (tts_service, "TTS_CACHE_DIR")):
+            directory = cache_root / attribute.lower()
+            directory.mkdir(parents=True)
+            stack.enter_context(mock.patch.object(module, attribute, directory))
+        stack.enter_context(mock.patch.object(video_finder, "PEXELS_API_KEY", "offline"))
+
+        try:
+            yield
+        finally:
+            shutil.rmtree(cache_root, ignore_errors=True)
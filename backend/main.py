@@ -3,25 +3,51 @@ if not hasattr(Image, 'ANTIALIAS'):
     Image.ANTIALIAS = Image.LANCZOS
 import cv2
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import functools
+import json
 import os
+import time
 import uuid
 from pathlib import Path
 
 from models.script_generator import generate_tiktok_script
-from services.tts_service import generate_audio
-from services.video_assembler import create_tiktok_video
+from services.tts_service import synthesize_audio
+from services.video_assembler import MAX_TIKTOK_DURATION, create_tiktok_video, tiktok_duration
 from services.image_generator import generate_background_from_text
 from services.ai_image_generator import generate_ai_image
 from services.local_video_generator import generate_ai_video_free
 from services.video_finder import find_and_download_video
-from services.unified_video_generator import generate_advanced_video
+from services.unified_video_generator import (
+    UnifiedVideoGenerator, add_advanced_asset_stages, add_advanced_render_stages
+)
 from services.physics_video_generator import PhysicsVideoGenerator
 from services.perplexity_service import PerplexityService
+from services.pipeline import AssetMemo, StageGraph
+from services.render_jobs import (
+    PREVIEW_FPS, PREVIEW_RESOLUTION, JobStatus, attach_profile, job_registry, publish_video,
+    schedule_final_render, staging_path
+)
+from services.render_scheduler import RenderBudgetExceeded, RenderDeadlineExceeded, RenderPlan, render_scheduler
+from services.job_broker import QueueStatus, broker_from_env
+from services.shared_storage import storage_from_env
+from services.video_serving import VideoFileResponse
+from services.output_store import output_store
+from services.lipsync import word_boundaries_path
+from services.profiling import (
+    admin_authorized, folded_stacks, job_profiler, profile_path, profiling_requested
+)
+from services.telemetry import (
+    CONTENT_TYPE, admission_rejections, http_request_seconds, job_span, queue_depth, render_metrics, tracer
+)
+from services.admission import (
+    AdmissionRejected, ClientInfo, admission, client_from_headers, priority_for
+)
 import os
 from dotenv import load_dotenv
 
@@ -39,11 +65,38 @@ app.add_middleware(
 
 print("✅ CORS middleware configured")
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        http_request_seconds.observe(time.perf_counter() - start, method=request.method,
+                                     route=getattr(route, "path", "unmatched"), status=str(status))
+
 OUTPUT_DIR = Path("/tmp/output")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 print(f"✅ Output directory created: {OUTPUT_DIR}")
 
+MAX_BATCH_ITEMS = 50
+
+job_broker = broker_from_env()
+shared_storage = storage_from_env() if job_broker is not None else None
+
+def queue_metrics() -> Dict:
+    stats = admission.stats()
+    depth = {("admission", "running"): stats["running"], ("admission", "queued"): stats["queued"]}
+    if job_broker is not None:
+        depth.update({("broker", status): count for status, count in job_broker.stats().items()})
+    return depth
+
+queue_depth.set_function(queue_metrics)
+
 class VideoRequest(BaseModel):
     text: str
     is_custom: bool = False
@@ -55,10 +108,20 @@ class VideoRequest(BaseModel):
     quality: str = "high"
     camera_movement: str = "dynamic"
     duration: float = 10.0
+    preview: bool = False
+    deadline: Optional[float] = None
 
 class VideoResponse(BaseModel):
     script: str
     video_url: str
+    stage_timings: Optional[Dict[str, float]] = None
+    job_id: Optional[str] = None
+    tier: Optional[str] = None
+    render_plan: Optional[Dict] = None
+
+class BatchRequest(BaseModel):
+    items: List[VideoRequest]
+    max_parallel: Optional[int] = None
 
 class PhysicsVideoRequest(BaseModel):
     text: str
@@ -67,9 +130,30 @@ class PhysicsVideoRequest(BaseModel):
     enable_particles: bool = True
     duration: float = 5.0
     fps: int = 30
+    preview: bool = False
+    deadline: Optional[float] = None
+
+def scheduling_error(job_id: str, error: Exception) -> HTTPException:
+    if isinstance(error, AdmissionRejected):
+        status_code = 429
+    elif isinstance(error, RenderBudgetExceeded):
+        status_code = 503
+    else:
+        status_code = 504
+    
+    admission_rejections.inc(reason={429: "admission", 503: "budget", 504: "deadline"}[status_code])
+    job_registry.update(job_id, status=JobStatus.FAILED, error=str(error))
+    print(f"🚫 Job {job_id} not rendered ({status_code}): {error}")
+    
+    retry_after = getattr(error, "retry_after", None)
+    headers = {"Retry-After": str(int(retry_after + 0.999))} if retry_after else None
+    return HTTPException(status_code=status_code, detail=str(error), headers=headers)
 
 @app.on_event("startup")
 async def startup_event():
+    asyncio.ensure_future(output_store.run_sweeper())
+    if shared_storage is not None:
+        asyncio.ensure_future(shared_storage.run_sweeper())
     print("🎉 Text-to-TikTok API is ready!")
 
 @app.get("/")
@@ -80,84 +164,340 @@ async def root():
 async def test_endpoint():
     return {"message": "Test endpoint working", "output_dir": str(OUTPUT_DIR), "dir_exists": OUTPUT_DIR.exists()}
 
+def plan_basic_job(request: VideoRequest) -> Tuple[RenderPlan, Optional[RenderPlan]]:
+    # The clip follows the TTS audio, up to MAX_TIKTOK_DURATION; render stages revise the plan
+    render_plan = render_scheduler.plan("tiktok", "speed", MAX_TIKTOK_DURATION, effects={},
+                                        deadline_seconds=request.deadline, allow_quality_change=False)
+    preview_plan = render_scheduler.plan("tiktok", "preview", MAX_TIKTOK_DURATION, effects={},
+                                         deadline_seconds=request.deadline,
+                                         allow_quality_change=False) if request.preview else None
+    return render_plan, preview_plan
+
+def plan_advanced_job(request: VideoRequest) -> Tuple[RenderPlan, Optional[RenderPlan]]:
+    render_plan = render_scheduler.plan(request.video_type, request.quality, request.duration,
+                                        deadline_seconds=request.deadline)
+    preview_plan = render_scheduler.plan(
+        request.video_type, "preview", request.duration,
+        effects={"enable_style_transfer": True, "enable_lighting_effects": True},
+        deadline_seconds=request.deadline, allow_quality_change=False
+    ) if request.preview else None
+    return render_plan, preview_plan
+
+def plan_physics_job(request: PhysicsVideoRequest) -> Tuple[RenderPlan, Optional[RenderPlan]]:
+    render_plan = render_scheduler.plan("physics", "balanced", request.duration, fps=request.fps,
+                                        effects={}, deadline_seconds=request.deadline,
+                                        allow_quality_change=False)
+    preview_plan = render_scheduler.plan("physics", "preview", request.duration, effects={},
+                                         deadline_seconds=request.deadline,
+                                         allow_quality_change=False) if request.preview else None
+    return render_plan, preview_plan
+
+JOB_PLANNERS = {"basic": plan_basic_job, "advanced": plan_advanced_job, "physics": plan_physics_job}
+
+def enqueue_job(kind: str, request: BaseModel, session_id: str, client: ClientInfo) -> VideoResponse:
+    """
+    Hand a job to the render workers. It is admitted here like an in-process
+    job (per-client cap, queue cap, token bucket) so the broker queue can't
+    grow without bound; AdmissionRejected becomes a 429 in the endpoint.
+    """
+    render_plan, preview_plan = JOB_PLANNERS[kind](request)
+    admission.admit_queued(client, (preview_plan or render_plan).estimated_cost,
+                           pending=job_broker.pending(client.key),
+                           queued=job_broker.stats()[QueueStatus.QUEUED.value])
+    job_broker.enqueue(session_id, kind, {
+        "request": request.model_dump(),
+        "client": {"key": client.key, "paid": client.paid},
+        "profile": job_profiler.requested_mode(session_id),
+    })
+    print(f"📮 Queued {kind} job {session_id} for render workers")
+    
+    backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
+    return VideoResponse(
+        script=request.text,
+        video_url=f"{backend_url}/videos/{session_id}_video.mp4",
+        job_id=session_id
+    )
+
+def traced_job(kind: str):
+    """
+    Run a job inside a root span whose trace id is the job id, so its stages and
+    service calls show up under /jobs/{job_id}/trace.
+    """
+    def decorate(run_job):
+        @functools.wraps(run_job)
+        async def run(request, session_id: str, *args, **kwargs):
+            try:
+                with job_span(kind, session_id), job_profiler.session(session_id, kind):
+                    return await run_job(request, session_id, *args, **kwargs)
+            finally:
+                if job_profiler.is_requested(session_id):
+                    attach_profile(session_id)
+        return run
+    return decorate
+
+def mark_profiling(session_id: str, headers) -> None:
+    mode = profiling_requested(headers)
+    if mode is not None:
+        job_profiler.request(session_id, mode)
+    else:
+        job_profiler.claim_armed(session_id)
+
+def require_admin(http_request: Request) -> None:
+    if not admin_authorized(http_request.headers):
+        raise HTTPException(status_code=403, detail="Admin token required (X-Admin-Token, ADMIN_TOKEN)")
+
+def share_stage(assets: Optional[AssetMemo], key, func):
+    return assets.share(key, func) if assets is not None else func
+
+@traced_job("basic")
+async def run_basic_job(request: VideoRequest, session_id: str, client: ClientInfo,
+                        background_tasks: BackgroundTasks, assets: Optional[AssetMemo] = None) -> VideoResponse:
+    load_dotenv()
+    pexels_api_key = os.getenv("PEXELS_API_KEY")
+    print(f"🔑 Pexels API Key: {'✅ Set' if pexels_api_key else '❌ Not set'}")
+    
+    background_video = OUTPUT_DIR / f"{session_id}_background.mp4"
+    audio_path = OUTPUT_DIR / f"{session_id}_audio.mp3"
+    video_path = OUTPUT_DIR / f"{session_id}_video.mp4"
+    
+    def make_script():
+        if request.is_custom:
+            print(f"\n📝 Using custom script: {request.text[:50]}...")
+            return request.text
+        print(f"\n🤖 Generating AI script...")
+        script = generate_tiktok_script(request.text)
+        print(f"✅ AI generated script: {script[:50]}...")
+        return script
+    
+    def make_background(script):
+        if request.is_custom:
+            print(f"🔍 Trying to download Pexels video...")
+            if find_and_download_video(script, str(background_video)):
+                print(f"✅ Pexels video downloaded: {background_video}")
+                return str(background_video)
+            print(f"⚠️  Pexels video failed, falling back to AI animated video...")
+        
+        print(f"🎨 Generating AI animated video...")
+        generate_ai_video_free(script, str(background_video))
+        print(f"✅ AI animated video generated: {background_video}")
+        return str(background_video)
+    
+    async def make_audio(script):
+        print(f"\n🎵 Generating TTS audio...")
+        await synthesize_audio(script, str(audio_path))
+        print(f"✅ Audio generated: {audio_path}")
+        return str(audio_path)
+    
+    def make_render(output_path, plan):
+        def render(script, background_path, audio_path):
+            # Planned for the longest clip; the audio gives the real length
+            render_scheduler.revise(session_id, plan, tiktok_duration(audio_path))
+            print(f"\n🎬 Creating video...")
+            create_tiktok_video(
+                script=script,
+                audio_path=audio_path,
+                background_path=background_path,
+                output_path=str(output_path),
+                resolution=plan.resolution,
+                fps=plan.fps
+            )
+            print(f"✅ Video created: {output_path}")
+            return str(output_path)
+        return render
+    
+    job_registry.create(session_id, str(video_path))
+    output_store.track(session_id, background_video, audio_path, word_boundaries_path(str(audio_path)),
+                       staging_path(video_path, "preview"), staging_path(video_path, "final"))
+    tier = "preview" if request.preview else "final"
+    staged_path = staging_path(video_path, tier)
+    
+    render_plan, preview_plan = plan_basic_job(request)
+    
+    graph = StageGraph(f"generate-video {session_id[:8]}")
+    graph.add("script", share_stage(assets, ("script", request.text, request.is_custom), make_script))
+    graph.add("background", share_stage(assets, ("background", request.is_custom), make_background),
+              deps=["script"])
+    graph.add("tts", share_stage(assets, "tts", make_audio), deps=["script"])
+    plan = preview_plan or render_plan
+    graph.add("render", make_render(staged_path, plan), deps=["script", "background", "tts"])
+    
+    async with admission.slot(client, priority_for(client, tier), plan.estimated_cost):
+        results = await render_scheduler.run(session_id, plan, graph.run())
+    script = results["script"]
+    publish_video(session_id, staged_path, video_path, tier, graph)
+    
+    if request.preview:
+        final_path = staging_path(video_path, "final")
+        final_graph = StageGraph(f"generate-video final {session_id[:8]}")
+        final_graph.seed(results, ["script", "background", "tts"])
+        final_graph.add("render", make_render(final_path, render_plan), deps=["script", "background", "tts"])
+        schedule_final_render(background_tasks, session_id, final_graph, final_path, video_path,
+                              render_plan, client)
+    
+    backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
+    video_url = f"{backend_url}/videos/{session_id}_video.mp4"
+    
+    print(f"\n✅ Video ready ({tier}): {video_url}\n")
+    
+    return VideoResponse(
+        script=script,
+        video_url=video_url,
+        stage_timings=graph.timing_summary(),
+        job_id=session_id,
+        tier=tier,
+        render_plan=render_plan.summary()
+    )
+
 @app.post("/generate-video", response_model=VideoResponse)
-async def generate_video(request: VideoRequest, background_tasks: BackgroundTasks):
+async def generate_video(request: VideoRequest, background_tasks: BackgroundTasks, http_request: Request):
     try:
         session_id = str(uuid.uuid4())
+        client = client_from_headers(http_request.headers, http_request.client.host if http_request.client else None)
+        mark_profiling(session_id, http_request.headers)
         
         print(f"\n{'='*50}")
         print(f"📥 Request received - is_custom: {request.is_custom}, text: {request.text[:50]}...")
         print(f"🆔 Session ID: {session_id}")
         print(f"{'='*50}\n")
         
-        load_dotenv()
-        pexels_api_key = os.getenv("PEXELS_API_KEY")
-        print(f"🔑 Pexels API Key: {'✅ Set' if pexels_api_key else '❌ Not set'}")
+        if job_broker is not None:
+            return enqueue_job("basic", request, session_id, client)
         
-        if request.is_custom:
-            script = request.text
-            print(f"\n📝 Using custom script: {script[:50]}...")
-            
-            background_video = OUTPUT_DIR / f"{session_id}_background.mp4"
-            print(f"🔍 Trying to download Pexels video...")
-            success = find_and_download_video(script, str(background_video))
-            
-            if success:
-                background_path = str(background_video)
-                print(f"✅ Pexels video downloaded: {background_path}")
-            else:
-                print(f"⚠️  Pexels video failed, falling back to AI animated video...")
-                background_video_ai = OUTPUT_DIR / f"{session_id}_background.mp4"
-                generate_ai_video_free(script, str(background_video_ai))
-                background_path = str(background_video_ai)
-                print(f"✅ AI animated video generated: {background_path}")
-        else:
-            print(f"\n🤖 Generating AI script...")
-            script = generate_tiktok_script(request.text)
-            print(f"✅ AI generated script: {script[:50]}...")
-            
-            background_video_ai = OUTPUT_DIR / f"{session_id}_background.mp4"
-            print(f"🎨 Generating AI animated video...")
-            generate_ai_video_free(script, str(background_video_ai))
-            background_path = str(background_video_ai)
-            print(f"✅ AI animated video generated: {background_path}")
-        
-        audio_path = OUTPUT_DIR / f"{session_id}_audio.mp3"
-        print(f"\n🎵 Generating TTS audio...")
-        generate_audio(script, str(audio_path))
-        print(f"✅ Audio generated: {audio_path}")
-
-        video_path = OUTPUT_DIR / f"{session_id}_video.mp4"
-
-        print(f"\n🎬 Creating video...")
-        create_tiktok_video(
-            script=script,
-            audio_path=str(audio_path),
-            background_path=background_path,
-            output_path=str(video_path)
-        )
-        print(f"✅ Video created: {video_path}")
-        
-        backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
-        video_url = f"{backend_url}/videos/{session_id}_video.mp4"
-        
-        print(f"\n✅ Video ready: {video_url}\n")
-        
-        return VideoResponse(
-            script=script,
-            video_url=video_url
-        )
+        with output_store.job(session_id):
+            return await run_basic_job(request, session_id, client, background_tasks)
         
+    except (AdmissionRejected, RenderBudgetExceeded, RenderDeadlineExceeded) as e:
+        raise scheduling_error(session_id, e)
     except Exception as e:
         import traceback
         error_detail = f"{str(e)}\n{traceback.format_exc()}"
         print(f"\n❌ Error generating video: {error_detail}\n")
+        job_registry.update(session_id, status=JobStatus.FAILED, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+@traced_job("advanced")
+async def run_advanced_job(request: VideoRequest, session_id: str, client: ClientInfo,
+                           background_tasks: BackgroundTasks, assets: Optional[AssetMemo] = None,
+                           generator: Optional[UnifiedVideoGenerator] = None) -> VideoResponse:
+    audio_path = OUTPUT_DIR / f"{session_id}_audio.mp3"
+    video_path = OUTPUT_DIR / f"{session_id}_video.mp4"
+    
+    def make_script():
+        if request.is_custom:
+            print(f"\n📝 Using custom script: {request.text[:100]}...")
+            return request.text
+        print(f"\n🤖 Generating AI script...")
+        script = generate_tiktok_script(request.text)
+        print(f"✅ AI generated script: {script[:100]}...")
+        return script
+    
+    async def enhance(script):
+        perplexity_service = PerplexityService()
+        print(f"\n🎯 Enhancing prompt with Perplexity AI...")
+        try:
+            enhanced_script = await perplexity_service.enhance_video_prompt(script, mode="advanced")
+            print(f"✅ Prompt enhanced: {enhanced_script[:100]}...")
+            return enhanced_script
+        except Exception as e:
+            print(f"⚠️  Perplexity enhancement failed: {e}")
+            return script
+    
+    async def make_audio(enhanced_script):
+        print(f"\n🎵 Generating TTS audio...")
+        try:
+            await synthesize_audio(enhanced_script, str(audio_path))
+            print(f"✅ Audio generated: {audio_path}")
+            return str(audio_path)
+        except Exception as e:
+            print(f"❌ Audio generation failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Audio generation failed: {str(e)}")
+    
+    graph = StageGraph(f"advanced-video {session_id[:8]}")
+    graph.add("script", share_stage(assets, ("script", request.text, request.is_custom), make_script))
+    graph.add("enhance", share_stage(assets, "enhance", enhance), deps=["script"])
+    graph.add("tts", share_stage(assets, "tts", make_audio), deps=["enhance"])
+    
+    job_registry.create(session_id, str(video_path))
+    output_store.track(session_id, audio_path, word_boundaries_path(str(audio_path)),
+                       staging_path(video_path, "preview"), staging_path(video_path, "final"))
+    tier = "preview" if request.preview else "final"
+    staged_path = staging_path(video_path, tier)
+    
+    render_plan, preview_plan = plan_advanced_job(request)
+    
+    def add_render_stages(target_graph, output_path, quality, prefix="", keep_image=False,
+                          effects=None, fps=None):
+        return add_advanced_render_stages(
+            target_graph,
+            prompt_stage="enhance",
+            audio_stage="tts",
+            output_path=str(output_path),
+            video_type=request.video_type,
+            style=request.style,
+            emotion=request.emotion,
+            quality=quality,
+            camera_movement=request.camera_movement,
+            duration=request.duration,
+            prefix=prefix,
+            keep_image=keep_image or assets is not None,
+            effects=effects,
+            fps=fps,
+            generator=generator
+        )
+    
+    print(f"\n🎬 Generating advanced video...")
+    try:
+        generator = generator or UnifiedVideoGenerator()
+        add_advanced_asset_stages(graph, "enhance", request.video_type, request.character_type,
+                                  render_plan.quality, generator, assets)
+        if request.preview:
+            add_render_stages(graph, staged_path, "preview", prefix="preview_", keep_image=True)
+        else:
+            add_render_stages(graph, staged_path, render_plan.quality,
+                              effects=render_plan.effects, fps=render_plan.fps)
+        plan = preview_plan or render_plan
+        async with admission.slot(client, priority_for(client, tier), plan.estimated_cost):
+            results = await render_scheduler.run(session_id, plan, graph.run())
+        publish_video(session_id, staged_path, video_path, tier, graph)
+        print(f"✅ Video generated: {video_path}")
+    except (HTTPException, RenderDeadlineExceeded, AdmissionRejected):
+        raise
+    except Exception as e:
+        print(f"❌ Video generation failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Video generation failed: {str(e)}")
+    
+    enhanced_script = results["enhance"]
+    
+    if request.preview:
+        final_path = staging_path(video_path, "final")
+        final_graph = StageGraph(f"advanced-video final {session_id[:8]}")
+        final_graph.seed(results, ["script", "enhance", "tts", "image"])
+        add_render_stages(final_graph, final_path, render_plan.quality,
+                          effects=render_plan.effects, fps=render_plan.fps)
+        schedule_final_render(background_tasks, session_id, final_graph, final_path, video_path,
+                              render_plan, client)
+    
+    backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
+    video_url = f"{backend_url}/videos/{session_id}_video.mp4"
+    
+    print(f"\n✅ Advanced video ready ({tier}): {video_url}\n")
+    
+    return VideoResponse(
+        script=enhanced_script,
+        video_url=video_url,
+        stage_timings=graph.timing_summary(),
+        job_id=session_id,
+        tier=tier,
+        render_plan=render_plan.summary()
+    )
+
 @app.post("/generate-advanced-video", response_model=VideoResponse)
-async def generate_advanced_video_endpoint(request: VideoRequest, background_tasks: BackgroundTasks):
+async def generate_advanced_video_endpoint(request: VideoRequest, background_tasks: BackgroundTasks,
+                                           http_request: Request):
     try:
         session_id = str(uuid.uuid4())
+        client = client_from_headers(http_request.headers, http_request.client.host if http_request.client else None)
+        mark_profiling(session_id, http_request.headers)
         
         print(f"\n{'='*60}")
         print(f"🚀 Advanced AI Video Generation Request")
@@ -173,78 +513,192 @@ async def generate_advanced_video_endpoint(request: VideoRequest, background_tas
         print(f"🆔 Session ID: {session_id}")
         print(f"{'='*60}\n")
         
-        if request.is_custom:
-            script = request.text
-            print(f"\n📝 Using custom script: {script[:100]}...")
-        else:
-            print(f"\n🤖 Generating AI script...")
-            script = generate_tiktok_script(request.text)
-            print(f"✅ AI generated script: {script[:100]}...")
+        if job_broker is not None:
+            return enqueue_job("advanced", request, session_id, client)
         
-        perplexity_service = PerplexityService()
+        with output_store.job(session_id):
+            return await run_advanced_job(request, session_id, client, background_tasks)
         
-        print(f"\n🎯 Enhancing prompt with Perplexity AI...")
-        try:
-            enhanced_script = await perplexity_service.enhance_video_prompt(script, mode="advanced")
-            print(f"✅ Prompt enhanced: {enhanced_script[:100]}...")
-        except Exception as e:
-            print(f"⚠️  Perplexity enhancement failed: {e}")
-            enhanced_script = script
-        
-        audio_path = OUTPUT_DIR / f"{session_id}_audio.mp3"
-        print(f"\n🎵 Generating TTS audio...")
-        try:
-            generate_audio(enhanced_script, str(audio_path))
-            print(f"✅ Audio generated: {audio_path}")
-        except Exception as e:
-            print(f"❌ Audio generation failed: {e}")
-            raise HTTPException(status_code=500, detail=f"Audio generation failed: {str(e)}")
-        
-        video_path = OUTPUT_DIR / f"{session_id}_video.mp4"
-        
-        print(f"\n🎬 Generating advanced video...")
-        try:
-            generate_advanced_video(
-                prompt=enhanced_script,
-                audio_path=str(audio_path),
-                output_path=str(video_path),
-                video_type=request.video_type,
-                style=request.style,
-                character_type=request.character_type,
-                emotion=request.emotion,
-                quality=request.quality,
-                camera_movement=request.camera_movement,
-                duration=request.duration
-            )
-            print(f"✅ Video generated: {video_path}")
-        except Exception as e:
-            print(f"❌ Video generation failed: {e}")
-            raise HTTPException(status_code=500, detail=f"Video generation failed: {str(e)}")
-        
-        backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
-        video_url = f"{backend_url}/videos/{session_id}_video.mp4"
-        
-        print(f"\n✅ Advanced video ready: {video_url}\n")
-        
-        return VideoResponse(
-            script=enhanced_script,
-            video_url=video_url
-        )
-        
-    except HTTPException:
+    except HTTPException as e:
+        job_registry.update(session_id, status=JobStatus.FAILED, error=str(e.detail))
         raise
+    except (AdmissionRejected, RenderBudgetExceeded, RenderDeadlineExceeded) as e:
+        raise scheduling_error(session_id, e)
     except Exception as e:
         import traceback
         error_detail = f"{str(e)}\n{traceback.format_exc()}"
         print(f"\n❌ Error generating advanced video: {error_detail}\n")
+        job_registry.update(session_id, status=JobStatus.FAILED, error=str(e))
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.get("/videos/{filename}")
-async def get_video(filename: str):
+@app.post("/batch")
+async def generate_batch(batch: BatchRequest, http_request: Request):
+    """
+    Render a group of VideoRequests as one job group. Script, enhancement, TTS,
+    backgrounds and character images are shared between items with the same
+    inputs, and results are streamed back as NDJSON, one line per finished item.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(batch.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch has more than {MAX_BATCH_ITEMS} items")
+    
+    batch_id = str(uuid.uuid4())
+    client = client_from_headers(http_request.headers, http_request.client.host if http_request.client else None)
+    assets = AssetMemo()
+    background_tasks = BackgroundTasks()
+    parallel = min(batch.max_parallel or admission.max_pending_per_client, admission.max_pending_per_client)
+    limit = asyncio.Semaphore(max(1, parallel))
+    
+    print(f"\n📦 Batch {batch_id}: {len(batch.items)} items, {parallel} in parallel")
+    
+    generator = None
+    if job_broker is None and any(item.use_advanced for item in batch.items):
+        generator = await asyncio.to_thread(UnifiedVideoGenerator)
+    
+    async def run_item(index: int, item: VideoRequest) -> Dict:
+        job_id = f"{batch_id}-{index}"
+        mark_profiling(job_id, http_request.headers)
+        # Other items may reuse this item's audio and backgrounds until the batch closes
+        output_store.retain(job_id)
+        assets.on_close(lambda: output_store.release(job_id))
+        async with limit:
+            try:
+                if job_broker is not None:
+                    response = enqueue_job("advanced" if item.use_advanced else "basic", item, job_id, client)
+                elif item.use_advanced:
+                    response = await run_advanced_job(item, job_id, client, background_tasks, assets, generator)
+                else:
+                    response = await run_basic_job(item, job_id, client, background_tasks, assets)
+                return {"index": index, "status": "ok", **response.model_dump()}
+            except (AdmissionRejected, RenderBudgetExceeded, RenderDeadlineExceeded) as e:
+                error = scheduling_error(job_id, e)
+            except HTTPException as e:
+                job_registry.update(job_id, status=JobStatus.FAILED, error=str(e.detail))
+                error = e
+            except Exception as e:
+                print(f"❌ Batch item {job_id} failed: {e}")
+                job_registry.update(job_id, status=JobStatus.FAILED, error=str(e))
+                error = HTTPException(status_code=500, detail=str(e))
+        return {"index": index, "job_id": job_id, "status": "failed",
+                "status_code": error.status_code, "error": str(error.detail)}
+    
+    async def stream():
+        tasks = [asyncio.ensure_future(run_item(index, item)) for index, item in enumerate(batch.items)]
+        failed = 0
+        try:
+            yield json.dumps({"batch_id": batch_id, "items": len(tasks)}) + "\n"
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                failed += result["status"] != "ok"
+                yield json.dumps(result) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            background_tasks.add_task(assets.close)
+        
+        print(f"📦 Batch {batch_id} done: {len(tasks) - failed} ok, {failed} failed, "
+              f"{assets.hits} shared asset hits")
+        yield json.dumps({"batch_id": batch_id, "completed": len(tasks) - failed, "failed": failed,
+                          "shared_asset_hits": assets.hits}) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson", background=background_tasks)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_registry.get(job_id)
+    backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
+    if job is None and job_broker is not None:
+        queued = job_broker.get(job_id)
+        if queued is not None:
+            return {**queued.to_dict(), "video_url": f"{backend_url}/videos/{job_id}_video.mp4"}
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {**job.to_dict(), "video_url": f"{backend_url}/videos/{Path(job.video_path).name}"}
+
+@app.get("/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str):
+    spans = tracer.trace(job_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="No trace recorded for this job")
+    return {"job_id": job_id, "spans": spans}
+
+def video_is_final(filename: str) -> bool:
+    job_id = filename.split("_")[0]
+    job = job_registry.get(job_id)
+    if job is not None:
+        return job.status == JobStatus.COMPLETED
+    if job_broker is not None:
+        queued = job_broker.get(job_id)
+        if queued is not None:
+            return queued.status == QueueStatus.COMPLETED
+    return True
+
+@app.api_route("/videos/{filename}", methods=["GET", "HEAD"])
+async def get_video(filename: str, request: Request):
     video_path = OUTPUT_DIR / filename
+    if not video_path.exists() and shared_storage is not None:
+        video_path = shared_storage.path(filename) or video_path
+        shared_storage.touch(filename)
     if not video_path.exists():
         raise HTTPException(status_code=404, detail="Video not found")
-    return FileResponse(video_path)
+    output_store.touch(video_path)
+    # Previews are replaced in place by the final render, so only finished videos are immutable
+    return VideoFileResponse(video_path, request.headers, request.method, immutable=video_is_final(filename))
+
+@app.get("/storage")
+async def storage_usage():
+    return await asyncio.to_thread(output_store.usage)
+
+@app.get("/queue")
+async def queue_status():
+    if job_broker is not None:
+        return {**admission.stats(), "broker": job_broker.stats()}
+    return admission.stats()
+
+@app.post("/admin/profiling")
+async def arm_profiling(http_request: Request, next_jobs: int = 1, mode: str = "full"):
+    require_admin(http_request)
+    if mode not in ("full", "cpu"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'cpu'")
+    armed = job_profiler.arm(next_jobs, mode)
+    print(f"🔬 Profiling armed for the next {armed} jobs ({mode})")
+    return job_profiler.stats()
+
+@app.get("/admin/profiling")
+async def profiling_status(http_request: Request):
+    require_admin(http_request)
+    return job_profiler.stats()
+
+def load_profile(job_id: str) -> Dict:
+    fallback = shared_storage.path(profile_path(job_id).name) if shared_storage is not None else None
+    profile = job_profiler.get(job_id, fallback)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile recorded for this job")
+    return profile
+
+@app.get("/admin/jobs/{job_id}/profile")
+async def get_job_profile(job_id: str, http_request: Request):
+    require_admin(http_request)
+    profile = await asyncio.to_thread(load_profile, job_id)
+    return {key: value for key, value in profile.items() if key != "folded"}
+
+@app.get("/admin/jobs/{job_id}/profile/flamegraph")
+async def get_job_flamegraph(job_id: str, http_request: Request):
+    """
+    Folded stacks ("frame;frame;frame count"), the input format of flamegraph.pl
+    and speedscope.
+    """
+    require_admin(http_request)
+    profile = await asyncio.to_thread(load_profile, job_id)
+    return PlainTextResponse(folded_stacks(profile), headers={
+        "Content-Disposition": f'attachment; filename="{job_id}.folded"'
+    })
+
+@app.get("/metrics")
+async def metrics():
+    return Response(await asyncio.to_thread(render_metrics), media_type=CONTENT_TYPE)
 
 @app.get("/health")
 async def health_check():
@@ -283,10 +737,147 @@ async def test_perplexity():
         import traceback
         return {"status": "error", "error": str(e), "traceback": traceback.format_exc()}
 
+@traced_job("physics")
+async def run_physics_job(request: PhysicsVideoRequest, session_id: str, client: ClientInfo,
+                          background_tasks: BackgroundTasks) -> VideoResponse:
+    import shutil
+    from moviepy.editor import ImageSequenceClip, AudioFileClip, VideoFileClip, CompositeVideoClip
+    
+    audio_path = OUTPUT_DIR / f"{session_id}_audio.mp3"
+    video_path = OUTPUT_DIR / f"{session_id}_video.mp4"
+    
+    async def enhance():
+        perplexity_service = PerplexityService()
+        print(f"\n🎯 Enhancing prompt with Perplexity AI...")
+        return await perplexity_service.enhance_video_prompt(request.text, mode="physics")
+    
+    async def make_audio():
+        print(f"\n🎵 Generating TTS audio...")
+        await synthesize_audio(request.text, str(audio_path))
+        print(f"✅ Audio generated: {audio_path}")
+        return str(audio_path)
+    
+    def add_physics_stages(target_graph, output_path, fps, resolution=(1080, 1920),
+                           post_processing=True, prefix=""):
+        temp_frames_dir = OUTPUT_DIR / f"{session_id}_{prefix}frames"
+        video_no_audio = OUTPUT_DIR / f"{session_id}_{prefix}no_audio.mp4"
+        output_store.track(session_id, temp_frames_dir, video_no_audio, output_path)
+        
+        def render_frames(enhanced_prompt):
+            generator = PhysicsVideoGenerator(*resolution, post_processing=post_processing)
+            
+            print(f"\n🎬 Generating physics-based video frames...")
+            frames = generator.generate_physics_video(
+                prompt=enhanced_prompt,
+                duration=request.duration,
+                fps=fps
+            )
+            
+            if not frames:
+                raise HTTPException(status_code=500, detail="Failed to generate physics video frames")
+            return frames
+        
+        def encode(frames):
+            print(f"\n🎞️  Creating video from {len(frames)} frames...")
+            
+            temp_frames_dir.mkdir(parents=True, exist_ok=True)
+            
+            try:
+                for i, frame in enumerate(frames):
+                    frame_path = temp_frames_dir / f"frame_{i:06d}.png"
+                    cv2.imwrite(str(frame_path), cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+                
+                print(f"✅ Frames saved to: {temp_frames_dir}")
+                
+                clip = ImageSequenceClip(str(temp_frames_dir), fps=fps)
+                clip.write_videofile(str(video_no_audio), codec='libx264', audio=False, logger=None)
+                print(f"✅ Video without audio: {video_no_audio}")
+                return str(video_no_audio)
+            finally:
+                frames.close()
+                shutil.rmtree(temp_frames_dir, ignore_errors=True)
+        
+        def mux(video_file, audio_file):
+            print(f"\n🎬 Combining video and audio...")
+            try:
+                video_clip = VideoFileClip(video_file)
+                audio_clip = AudioFileClip(audio_file)
+                
+                if audio_clip.duration > video_clip.duration:
+                    audio_clip = audio_clip.subclip(0, video_clip.duration)
+                else:
+                    audio_clip = audio_clip.loop(duration=video_clip.duration)
+                
+                final_clip = video_clip.set_audio(audio_clip)
+                final_clip.write_videofile(str(output_path), codec='libx264', audio_codec='aac', logger=None)
+                
+                print(f"✅ Final video: {output_path}")
+                
+                video_clip.close()
+                audio_clip.close()
+                return str(output_path)
+            finally:
+                video_no_audio.unlink(missing_ok=True)
+        
+        target_graph.add(f"{prefix}frames", render_frames, deps=["enhance"])
+        target_graph.add(f"{prefix}encode", encode, deps=[f"{prefix}frames"])
+        target_graph.add(f"{prefix}mux", mux, deps=[f"{prefix}encode", "tts"])
+        return video_no_audio
+    
+    job_registry.create(session_id, str(video_path))
+    output_store.track(session_id, audio_path, word_boundaries_path(str(audio_path)))
+    tier = "preview" if request.preview else "final"
+    staged_path = staging_path(video_path, tier)
+    
+    render_plan, preview_plan = plan_physics_job(request)
+    
+    graph = StageGraph(f"physics-video {session_id[:8]}")
+    graph.add("enhance", enhance)
+    graph.add("tts", make_audio)
+    if request.preview:
+        video_no_audio = add_physics_stages(graph, staged_path, PREVIEW_FPS, PREVIEW_RESOLUTION,
+                                            post_processing=False, prefix="preview_")
+    else:
+        video_no_audio = add_physics_stages(graph, staged_path, render_plan.fps)
+    
+    plan = preview_plan or render_plan
+    try:
+        async with admission.slot(client, priority_for(client, tier), plan.estimated_cost):
+            results = await render_scheduler.run(session_id, plan, graph.run())
+    finally:
+        video_no_audio.unlink(missing_ok=True)
+    
+    publish_video(session_id, staged_path, video_path, tier, graph)
+    
+    if request.preview:
+        final_path = staging_path(video_path, "final")
+        final_graph = StageGraph(f"physics-video final {session_id[:8]}")
+        final_graph.seed(results, ["enhance", "tts"])
+        add_physics_stages(final_graph, final_path, render_plan.fps)
+        schedule_final_render(background_tasks, session_id, final_graph, final_path, video_path,
+                              render_plan, client)
+    
+    backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
+    video_url = f"{backend_url}/videos/{session_id}_video.mp4"
+    
+    print(f"\n✅ Physics video ready ({tier}): {video_url}\n")
+    
+    return VideoResponse(
+        script=request.text,
+        video_url=video_url,
+        stage_timings=graph.timing_summary(),
+        job_id=session_id,
+        tier=tier,
+        render_plan=render_plan.summary()
+    )
+
 @app.post("/generate-physics-video", response_model=VideoResponse)
-async def generate_physics_video_endpoint(request: PhysicsVideoRequest, background_tasks: BackgroundTasks):
+async def generate_physics_video_endpoint(request: PhysicsVideoRequest, background_tasks: BackgroundTasks,
+                                          http_request: Request):
     try:
         session_id = str(uuid.uuid4())
+        client = client_from_headers(http_request.headers, http_request.client.host if http_request.client else None)
+        mark_profiling(session_id, http_request.headers)
         
         print(f"\n{'='*60}")
         print(f"🌊 Physics-Based Video Generation Request")
@@ -300,84 +891,22 @@ async def generate_physics_video_endpoint(request: PhysicsVideoRequest, backgrou
         print(f"🆔 Session ID: {session_id}")
         print(f"{'='*60}\n")
         
-        from moviepy.editor import ImageSequenceClip, AudioFileClip, VideoFileClip, CompositeVideoClip
-        
-        perplexity_service = PerplexityService()
-        
-        print(f"\n🎯 Enhancing prompt with Perplexity AI...")
-        enhanced_prompt = await perplexity_service.enhance_video_prompt(request.text, mode="physics")
-        
-        generator = PhysicsVideoGenerator()
-        
-        print(f"\n🎬 Generating physics-based video frames...")
-        frames = generator.generate_physics_video(
-            prompt=enhanced_prompt,
-            duration=request.duration,
-            fps=request.fps
-        )
-        
-        if not frames:
-            raise HTTPException(status_code=500, detail="Failed to generate physics video frames")
-        
-        print(f"\n🎞️  Creating video from {len(frames)} frames...")
-        
-        temp_frames_dir = OUTPUT_DIR / f"{session_id}_frames"
-        temp_frames_dir.mkdir(parents=True, exist_ok=True)
-        
-        for i, frame in enumerate(frames):
-            frame_path = temp_frames_dir / f"frame_{i:06d}.png"
-            cv2.imwrite(str(frame_path), cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
-        
-        print(f"✅ Frames saved to: {temp_frames_dir}")
+        if job_broker is not None:
+            return enqueue_job("physics", request, session_id, client)
         
-        video_no_audio = OUTPUT_DIR / f"{session_id}_no_audio.mp4"
-        
-        clip = ImageSequenceClip(str(temp_frames_dir), fps=request.fps)
-        clip.write_videofile(str(video_no_audio), codec='libx264', audio=False, logger=None)
-        print(f"✅ Video without audio: {video_no_audio}")
-        
-        audio_path = OUTPUT_DIR / f"{session_id}_audio.mp3"
-        print(f"\n🎵 Generating TTS audio...")
-        generate_audio(request.text, str(audio_path))
-        print(f"✅ Audio generated: {audio_path}")
-        
-        video_path = OUTPUT_DIR / f"{session_id}_video.mp4"
-        
-        print(f"\n🎬 Combining video and audio...")
-        video_clip = VideoFileClip(str(video_no_audio))
-        audio_clip = AudioFileClip(str(audio_path))
-        
-        if audio_clip.duration > video_clip.duration:
-            audio_clip = audio_clip.subclip(0, video_clip.duration)
-        else:
-            audio_clip = audio_clip.loop(duration=video_clip.duration)
-        
-        final_clip = video_clip.set_audio(audio_clip)
-        final_clip.write_videofile(str(video_path), codec='libx264', audio_codec='aac', logger=None)
-        
-        print(f"✅ Final video: {video_path}")
-        
-        video_clip.close()
-        audio_clip.close()
-        
-        import shutil
-        shutil.rmtree(temp_frames_dir, ignore_errors=True)
-        video_no_audio.unlink(missing_ok=True)
-        
-        backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
-        video_url = f"{backend_url}/videos/{session_id}_video.mp4"
-        
-        print(f"\n✅ Physics video ready: {video_url}\n")
-        
-        return VideoResponse(
-            script=request.text,
-            video_url=video_url
-        )
+        with output_store.job(session_id):
+            return await run_physics_job(request, session_id, client, background_tasks)
         
+    except HTTPException as e:
+        job_registry.update(session_id, status=JobStatus.FAILED, error=str(e.detail))
+        raise
+    except (AdmissionRejected, RenderBudgetExceeded, RenderDeadlineExceeded) as e:
+        raise scheduling_error(session_id, e)
     except Exception as e:
         import traceback
         error_detail = f"{str(e)}\n{traceback.format_exc()}"
         print(f"\n❌ Error generating physics video: {error_detail}\n")
+        job_registry.update(session_id, status=JobStatus.FAILED, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
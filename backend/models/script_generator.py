@@ -2,6 +2,8 @@ from zhipuai import ZhipuAI
 import os
 from typing import Optional
 
+from services.telemetry import count_upstream, span
+
 client = ZhipuAI(api_key=os.getenv("ZHIPU_API_KEY", "your-zhipu-api-key-here"))
 
 def generate_tiktok_script(topic: str, duration: int = 15) -> str:
@@ -22,21 +24,23 @@ Format the script as spoken text only, no labels or stage directions.
 Script:"""
 
     try:
-        response = client.chat.completions.create(
-            model="glm-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a viral TikTok content creator. You write engaging, short scripts optimized for 15-second videos."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.9,
-            max_tokens=200
-        )
+        with span("zhipuai.script"):
+            response = client.chat.completions.create(
+                model="glm-4",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a viral TikTok content creator. You write engaging, short scripts optimized for 15-second videos."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                temperature=0.9,
+                max_tokens=200
+            )
+        count_upstream("zhipuai", 200)
         
         script = response.choices[0].message.content.strip()
         
@@ -51,6 +55,7 @@ Script:"""
         return script
         
     except Exception as e:
+        count_upstream("zhipuai", getattr(e, "status_code", None))
         print(f"Error generating script: {e}")
         print("Using fallback script template...")
         fallback_scripts = {
@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+from services.render_scheduler import MAX_CONCURRENT_RENDERS
+
+PAID_API_KEYS = {key.strip() for key in os.getenv("PAID_API_KEYS", "").split(",") if key.strip()}
+
+MAX_QUEUED_JOBS = 64
+MAX_PENDING_PER_CLIENT = 4
+TOKEN_SECONDS = 10.0
+# Idle clients' buckets and tags are dropped at most this often
+PRUNE_INTERVAL_SECONDS = 60.0
+
+CLIENT_WEIGHTS = {"paid": 4.0, "free": 1.0}
+BUCKET_CAPACITY = {"paid": 120.0, "free": 30.0}
+BUCKET_REFILL_PER_SECOND = {"paid": 0.5, "free": 0.1}
+
+class JobPriority(IntEnum):
+    PREVIEW = 0
+    PAID = 1
+    FREE = 2
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@dataclass(frozen=True)
+class ClientInfo:
+    key: str
+    paid: bool = False
+
+    @property
+    def tier(self) -> str:
+        return "paid" if self.paid else "free"
+
+def client_from_headers(headers, host: Optional[str]) -> ClientInfo:
+    """
+    Only known keys identify a client; anything else is keyed by address, so
+    made-up keys can't mint fresh buckets, pending caps or queue shares.
+    """
+    api_key = headers.get("x-api-key")
+    if api_key and api_key in PAID_API_KEYS:
+        return ClientInfo(key=f"key:{api_key}", paid=True)
+    return ClientInfo(key=f"ip:{host or 'unknown'}")
+
+def priority_for(client: ClientInfo, tier: str = "final") -> JobPriority:
+    if tier == "preview":
+        return JobPriority.PREVIEW
+    return JobPriority.PAID if client.paid else JobPriority.FREE
+
+def cost_tokens(estimated_seconds: float) -> float:
+    return max(1.0, estimated_seconds / TOKEN_SECONDS)
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def try_consume(self, tokens: float) -> bool:
+        self._refill()
+        tokens = min(tokens, self.capacity)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def wait_time(self, tokens: float) -> float:
+        self._refill()
+        deficit = min(tokens, self.capacity) - self.tokens
+        return max(0.0, deficit / self.refill_per_second)
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    start_tag: float
+    seq: int
+    client: ClientInfo = field(compare=False)
+    cost: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+class AdmissionController:
+    """
+    Admission control for render jobs. Each client has a cost-weighted token bucket,
+    so a 4K/60fps job uses up more of the allowance than a 720p one. Jobs are queued
+    by priority class, then by start-time fair queuing tags. Paid clients have a
+    larger weight, so their tags advance more slowly. Full queues and empty
+    buckets are rejected with a Retry-After estimate.
+    """
+
+    def __init__(self, capacity: int = MAX_CONCURRENT_RENDERS, max_queued: int = MAX_QUEUED_JOBS,
+                 max_pending_per_client: int = MAX_PENDING_PER_CLIENT):
+        self.capacity = capacity
+        self.max_queued = max_queued
+        self.max_pending_per_client = max_pending_per_client
+        self._queue: List[_Waiter] = []
+        self._running = 0
+        self._running_cost = 0.0
+        self._pending: Dict[str, int] = {}
+        self._finish_tags: Dict[str, float] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._pruned = time.monotonic()
+
+    def _bucket(self, client: ClientInfo) -> TokenBucket:
+        bucket = self._buckets.get(client.key)
+        if bucket is None:
+            bucket = TokenBucket(BUCKET_CAPACITY[client.tier], BUCKET_REFILL_PER_SECOND[client.tier])
+            self._buckets[client.key] = bucket
+        return bucket
+
+    def _prune(self) -> None:
+        """
+        Forget clients with nothing pending, a full bucket and a finish tag the
+        virtual clock has passed: a fresh bucket and tag would behave the same,
+        so per-address state doesn't pile up for every caller ever seen.
+        """
+        now = time.monotonic()
+        if now - self._pruned < PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned = now
+        for key in set(self._buckets) | set(self._finish_tags):
+            if key in self._pending or self._finish_tags.get(key, 0.0) > self._virtual_time:
+                continue
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.is_full():
+                self._buckets.pop(key, None)
+                self._finish_tags.pop(key, None)
+
+    def estimated_wait(self) -> float:
+        queued_cost = sum(waiter.cost for waiter in self._queue)
+        return (queued_cost + self._running_cost) / max(self.capacity, 1)
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._running,
+            "queued": len(self._queue),
+            "capacity": self.capacity,
+            "estimated_wait_seconds": round(self.estimated_wait(), 1),
+        }
+
+    def _tag(self, client: ClientInfo, cost: float) -> float:
+        start = max(self._virtual_time, self._finish_tags.get(client.key, 0.0))
+        self._finish_tags[client.key] = start + cost_tokens(cost) / CLIENT_WEIGHTS[client.tier]
+        return start
+
+    def _check(self, client: ClientInfo, cost: float, pending: int, queued: int, wait: float) -> float:
+        if pending >= self.max_pending_per_client:
+            raise AdmissionRejected(
+                f"Too many pending jobs for this client (max {self.max_pending_per_client})",
+                retry_after=max(1.0, wait)
+            )
+        if queued >= self.max_queued:
+            raise AdmissionRejected("Render queue is full", retry_after=max(1.0, wait))
+
+        self._prune()
+        bucket = self._bucket(client)
+        tokens = cost_tokens(cost)
+        if not bucket.try_consume(tokens):
+            raise AdmissionRejected(
+                f"Render allowance exhausted ({tokens:.1f} tokens needed)",
+                retry_after=max(1.0, bucket.wait_time(tokens))
+            )
+        return tokens
+
+    def admit_queued(self, client: ClientInfo, cost: float, pending: int, queued: int) -> None:
+        """
+        Admission for jobs handed to render workers through the broker: the same
+        per-client cap, queue cap and token bucket as acquire(), counted from the
+        broker's queue. Nothing waits here; workers take a slot when they run the job.
+        """
+        self._check(client, cost, pending, queued, wait=queued * cost / max(self.capacity, 1))
+
+    async def acquire(self, client: ClientInfo, priority: JobPriority, cost: float) -> None:
+        tokens = self._check(client, cost, self._pending.get(client.key, 0), len(self._queue),
+                             self.estimated_wait())
+
+        self._pending[client.key] = self._pending.get(client.key, 0) + 1
+        start_tag = self._tag(client, cost)
+
+        if self._running < self.capacity and not self._queue:
+            self._start(start_tag, cost)
+            return
+
+        waiter = _Waiter(int(priority), start_tag, next(self._seq), client, cost,
+                         asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        print(f"🚦 Queued {client.key} ({priority.name.lower()}, {tokens:.1f} tokens), "
+              f"{len(self._queue)} waiting")
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(client, cost)
+            else:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+                self._finish_pending(client)
+            raise
+
+    def _start(self, start_tag: float, cost: float) -> None:
+        self._running += 1
+        self._running_cost += cost
+        self._virtual_time = max(self._virtual_time, start_tag)
+
+    def _finish_pending(self, client: ClientInfo) -> None:
+        remaining = self._pending.get(client.key, 1) - 1
+        if remaining > 0:
+            self._pending[client.key] = remaining
+        else:
+            self._pending.pop(client.key, None)
+
+    def release(self, client: ClientInfo, cost: float) -> None:
+        self._running -= 1
+        self._running_cost = max(0.0, self._running_cost - cost)
+        self._finish_pending(client)
+
+        while self._queue and self._running < self.capacity:
+            waiter = heapq.heappop(self._queue)
+            if waiter.future.cancelled():
+                continue
+            self._start(waiter.start_tag, waiter.cost)
+            waiter.future.set_result(None)
+
+        # An idle server's virtual clock catches up with the last finish tag (as in SFQ)
+        if not self._running and not self._queue and self._finish_tags:
+            self._virtual_time = max(self._virtual_time, max(self._finish_tags.values()))
+
+    @asynccontextmanager
+    async def slot(self, client: ClientInfo, priority: JobPriority, cost: float):
+        await self.acquire(client, priority, cost)
+        try:
+            yield
+        finally:
+            self.release(client, cost)
+
+admission = AdmissionController()
@@ -2,14 +2,23 @@ import numpy as np
 import cv2
 from PIL import Image, ImageDraw, ImageFilter
 import math
+import threading
 from pathlib import Path
-import librosa
 import soundfile as sf
 import mediapipe as mp
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, Iterator, List, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+from services.audio_analysis import AudioFeatureTrack, analyze_audio, default_feature_track
+from services.cancellation import check_cancelled
+from services.lipsync import VisemeTrack, load_viseme_track
+from services.frame_buffers import frame_buffers, place
+from services.frame_store import FrameStore
+from services.segment_encoder import encode_frames
+from services.profiling import frame_clock
+from services.telemetry import count_cache, span
+
 class EmotionType(Enum):
     NEUTRAL = "neutral"
     HAPPY = "happy"
@@ -22,6 +31,13 @@ class EmotionType(Enum):
     CALM = "calm"
     CONFIDENT = "confident"
 
+def resolve_emotion(emotion: str) -> EmotionType:
+    try:
+        return EmotionType(emotion.lower())
+    except ValueError:
+        print(f"⚠️  Unknown emotion '{emotion}', using neutral")
+        return EmotionType.NEUTRAL
+
 class ExpressionIntensity(Enum):
     SUBTLE = 0.3
     MODERATE = 0.6
@@ -50,45 +66,23 @@ class AdvancedCharacterAnimator:
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
+        self._face_mesh_lock = threading.Lock()
         self.previous_landmarks = None
         self.emotion_history = []
         self.max_emotion_history = 10
         self.animation_params = AnimationParams()
+        self._feather_masks: Dict[Tuple[int, int], np.ndarray] = {}
+        self._base_cache: Dict[Tuple[str, Tuple[int, int]], Tuple[np.ndarray, Optional[Dict]]] = {}
         
-    def analyze_audio_for_expression(self, audio_path: str) -> Dict:
+    def analyze_audio(self, audio_path: str, fps: int = 30) -> AudioFeatureTrack:
         try:
-            y, sr = librosa.load(audio_path)
-            
-            rms = librosa.feature.rms(y=y)[0]
-            pitch = librosa.yin(y, fmin=50, fmax=400)
-            pitch = pitch[~np.isnan(pitch)]
-            
-            energy = np.mean(rms)
-            pitch_mean = np.mean(pitch) if len(pitch) > 0 else 150
-            pitch_std = np.std(pitch) if len(pitch) > 0 else 20
-            
-            tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-            
-            zero_crossings = np.mean(librosa.feature.zero_crossing_rate(y))
-            
-            return {
-                'energy': float(energy),
-                'pitch_mean': float(pitch_mean),
-                'pitch_std': float(pitch_std),
-                'tempo': float(tempo),
-                'sharpness': float(zero_crossings),
-                'duration': librosa.get_duration(y=y, sr=sr)
-            }
+            return analyze_audio(audio_path, fps)
         except Exception as e:
             print(f"Error analyzing audio: {e}")
-            return {
-                'energy': 0.5,
-                'pitch_mean': 150,
-                'pitch_std': 20,
-                'tempo': 120,
-                'sharpness': 0.1,
-                'duration': 5.0
-            }
+            return default_feature_track(fps)
+    
+    def analyze_audio_for_expression(self, audio_path: str) -> Dict:
+        return self.analyze_audio(audio_path).summary()
     
     def map_audio_to_emotion(self, audio_features: Dict) -> EmotionType:
         energy = audio_features['energy']
@@ -116,7 +110,8 @@ class AdvancedCharacterAnimator:
     def detect_detailed_landmarks(self, image_array: np.ndarray) -> Optional[Dict]:
         try:
             rgb_image = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
-            results = self.face_mesh.process(rgb_image)
+            with self._face_mesh_lock:
+                results = self.face_mesh.process(rgb_image)
             
             if results.multi_face_landmarks:
                 landmarks = results.multi_face_landmarks[0]
@@ -170,93 +165,103 @@ class AdvancedCharacterAnimator:
             return None
     
     def generate_per_frame_audio_intensity(self, audio_path: str, fps: int = 30) -> np.ndarray:
-        try:
-            y, sr = librosa.load(audio_path)
-            duration = librosa.get_duration(y=y, sr=sr)
-            total_frames = int(duration * fps)
-            
-            hop_length = int(sr / fps)
-            rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-            
-            pitch = librosa.yin(y, fmin=50, fmax=400)
-            pitch = pitch[~np.isnan(pitch)]
-            
-            rms_normalized = rms / (np.max(rms) + 1e-6)
-            
-            if len(rms_normalized) < total_frames:
-                rms_normalized = np.pad(rms_normalized, (0, total_frames - len(rms_normalized)))
-            else:
-                rms_normalized = rms_normalized[:total_frames]
-            
-            return rms_normalized
-        except Exception as e:
-            print(f"Error generating audio intensity: {e}")
-            return np.ones(150) * 0.5
+        return self.analyze_audio(audio_path, fps).intensity
+    
+    def _clip_roi(self, image_array: np.ndarray, x1: int, y1: int,
+                  x2: int, y2: int) -> Optional[Tuple[int, int, int, int]]:
+        h, w = image_array.shape[:2]
+        x1, y1 = max(0, int(x1)), max(0, int(y1))
+        x2, y2 = min(w, int(x2)), min(h, int(y2))
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return None
+        return x1, y1, x2, y2
+    
+    def _feather_mask(self, h: int, w: int) -> np.ndarray:
+        key = (h, w)
+        mask = self._feather_masks.get(key)
+        if mask is None:
+            feather = max(2, min(h, w) // 6)
+            ramp_y = np.minimum(np.arange(h), np.arange(h)[::-1]).astype(np.float32)
+            ramp_x = np.minimum(np.arange(w), np.arange(w)[::-1]).astype(np.float32)
+            ramp_y = np.clip(ramp_y / feather, 0.0, 1.0)
+            ramp_x = np.clip(ramp_x / feather, 0.0, 1.0)
+            mask = np.outer(ramp_y, ramp_x)[:, :, np.newaxis]
+            self._feather_masks[key] = mask
+        return mask
+    
+    def _blend_roi(self, image_array: np.ndarray, roi: Tuple[int, int, int, int],
+                   patch: np.ndarray) -> None:
+        x1, y1, x2, y2 = roi
+        region = image_array[y1:y2, x1:x2]
+        mask = self._feather_mask(y2 - y1, x2 - x1)
+        blended = region.astype(np.float32)
+        blended += (patch.astype(np.float32) - blended) * mask
+        region[:] = blended.astype(np.uint8)
     
     def animate_mouth_advanced(self, image_array: np.ndarray, landmarks: Dict, 
-                              audio_intensity: float, emotion: EmotionType) -> np.ndarray:
+                              audio_intensity: float, emotion: EmotionType,
+                              spread: float = 0.0) -> np.ndarray:
         if landmarks is None:
             return image_array
         
-        h, w = image_array.shape[:2]
+        if abs(spread) > 0.05:
+            self._spread_lips(image_array, landmarks, spread)
         
-        upper_lip = landmarks['upper_lip']
         lower_lip = landmarks['lower_lip']
         left_corner = landmarks['left_lip_corner']
         right_corner = landmarks['right_lip_corner']
         chin = landmarks['chin']
-        mouth_bbox = landmarks['mouth_bbox']
         
         emotion_intensity = self._get_emotion_intensity(emotion)
-        base_opening = audio_intensity * 15 * emotion_intensity
-        
-        mouth_opening = int(base_opening)
+        mouth_opening = int(audio_intensity * 15 * emotion_intensity)
         if mouth_opening < 1:
             return image_array
         
         mouth_width = right_corner[0] - left_corner[0]
-        mouth_aspect_ratio = audio_intensity
-        
-        lower_lip_y, chin_y = lower_lip[1], chin[1]
-        
-        lower_face_start = lower_lip_y
-        lower_face_end = min(chin_y + mouth_opening, h)
-        
-        if lower_face_end <= lower_face_start:
-            return image_array
-        
-        lower_face = image_array[lower_face_start:lower_face_end, :].copy()
-        if lower_face.shape[0] < 5:
-            return image_array
-        
-        vertical_stretch = 1.0 + (mouth_opening / lower_face.shape[0]) * 0.5
-        new_height = int(lower_face.shape[0] * vertical_stretch)
+        pad_x = max(int(mouth_width * 0.4), 4)
         
-        if new_height <= 0:
+        roi = self._clip_roi(image_array, left_corner[0] - pad_x, lower_lip[1],
+                             right_corner[0] + pad_x, chin[1] + mouth_opening)
+        if roi is None:
             return image_array
+        x1, y1, x2, y2 = roi
         
-        lower_face_resized = cv2.resize(lower_face, (lower_face.shape[1], new_height))
-        
-        target_end_y = lower_face_start + new_height
-        if target_end_y > h:
-            lower_face_resized = lower_face_resized[:h - lower_face_start]
-            target_end_y = h
-        
-        if lower_face_resized.shape[0] < 1:
+        source_h = min(chin[1], y2) - y1
+        if source_h < 5:
             return image_array
         
-        current_lower_face = image_array[lower_face_start:target_end_y, :]
-        
-        alpha = np.linspace(0.7, 1.0, min(current_lower_face.shape[0], lower_face_resized.shape[0])).reshape(-1, 1, 1)
-        alpha = alpha.astype(np.float32)
+        source = image_array[y1:y1 + source_h, x1:x2]
+        stretched = cv2.resize(source, (x2 - x1, y2 - y1), interpolation=cv2.INTER_LINEAR)
         
-        blended = (current_lower_face.astype(np.float32) * alpha + 
-                 lower_face_resized[:current_lower_face.shape[0]].astype(np.float32) * (1 - alpha)).astype(np.uint8)
-        
-        image_array[lower_face_start:target_end_y, :] = blended
+        self._blend_roi(image_array, roi, stretched)
         
         return image_array
     
+    def _spread_lips(self, image_array: np.ndarray, landmarks: Dict, spread: float) -> None:
+        upper_lip = landmarks['upper_lip']
+        lower_lip = landmarks['lower_lip']
+        left_corner = landmarks['left_lip_corner']
+        right_corner = landmarks['right_lip_corner']
+        
+        mouth_width = right_corner[0] - left_corner[0]
+        pad_x = max(int(mouth_width * 0.3), 4)
+        pad_y = max((lower_lip[1] - upper_lip[1]) // 2, 6)
+        
+        roi = self._clip_roi(image_array, left_corner[0] - pad_x, upper_lip[1] - pad_y,
+                             right_corner[0] + pad_x, lower_lip[1] + pad_y)
+        if roi is None:
+            return
+        x1, y1, x2, y2 = roi
+        
+        scale_x = 1.0 + spread * 0.08
+        center_x = (left_corner[0] + right_corner[0]) / 2 - x1
+        M = np.float32([[scale_x, 0, (1 - scale_x) * center_x], [0, 1, 0]])
+        
+        region = image_array[y1:y2, x1:x2]
+        spread_region = cv2.warpAffine(region, M, (x2 - x1, y2 - y1), flags=cv2.INTER_LINEAR,
+                                       borderMode=cv2.BORDER_REPLICATE)
+        self._blend_roi(image_array, roi, spread_region)
+    
     def _get_emotion_intensity(self, emotion: EmotionType) -> float:
         intensity_map = {
             EmotionType.NEUTRAL: 1.0,
@@ -275,33 +280,27 @@ class AdvancedCharacterAnimator:
         if landmarks is None or not self.animation_params.eye_movement:
             return image_array
         
-        left_eye_center = landmarks['left_eye_center']
-        right_eye_center = landmarks['right_eye_center']
-        left_eye_bbox = landmarks['left_eye_bbox']
-        right_eye_bbox = landmarks['right_eye_bbox']
-        
         eye_movement_freq = 0.15
         eye_movement_amp = 3
         
         eye_offset_x = int(math.sin(frame_num * eye_movement_freq) * eye_movement_amp)
         eye_offset_y = int(math.cos(frame_num * eye_movement_freq * 0.7) * eye_movement_amp * 0.5)
         
-        for eye_bbox in [left_eye_bbox, right_eye_bbox]:
+        emotion_brightness = self._get_emotion_brightness(emotion)
+        if emotion_brightness == 1.0:
+            return image_array
+        
+        for eye_bbox in [landmarks['left_eye_bbox'], landmarks['right_eye_bbox']]:
             x, y, bw, bh = eye_bbox
-            x = max(0, x + eye_offset_x)
-            y = max(0, y + eye_offset_y)
-            
-            x2 = min(image_array.shape[1], x + bw)
-            y2 = min(image_array.shape[0], y + bh)
+            roi = self._clip_roi(image_array, x + eye_offset_x, y + eye_offset_y,
+                                 x + eye_offset_x + bw, y + eye_offset_y + bh)
+            if roi is None:
+                continue
+            x1, y1, x2, y2 = roi
             
-            if x2 > x and y2 > y:
-                eye_region = image_array[y:y2, x:x2]
-                
-                emotion_brightness = self._get_emotion_brightness(emotion)
-                eye_region = eye_region.astype(np.float32) * emotion_brightness
-                eye_region = np.clip(eye_region, 0, 255).astype(np.uint8)
-                
-                image_array[y:y2, x:x2] = eye_region
+            region = image_array[y1:y2, x1:x2]
+            brightened = cv2.convertScaleAbs(region, alpha=emotion_brightness)
+            self._blend_roi(image_array, roi, brightened)
         
         return image_array
     
@@ -319,36 +318,32 @@ class AdvancedCharacterAnimator:
         return brightness_map.get(emotion, 1.0)
     
     def animate_eyebrows(self, image_array: np.ndarray, landmarks: Dict, 
-                       frame_num: int, emotion: EmotionType) -> np.ndarray:
+                       frame_num: int, emotion: EmotionType,
+                       pitch: float = 0.0, onset: float = 0.0) -> np.ndarray:
         if landmarks is None or not self.animation_params.eyebrow_movement:
             return image_array
         
-        left_inner = landmarks['left_eyebrow_inner']
-        left_outer = landmarks['left_eyebrow_outer']
-        right_inner = landmarks['right_eyebrow_inner']
-        right_outer = landmarks['right_eyebrow_outer']
-        
         eyebrow_movement = self._get_eyebrow_movement(emotion)
         
         freq = 0.08
-        offset_y = int(math.sin(frame_num * freq) * eyebrow_movement)
-        
-        for eyebrow in [(left_inner, left_outer), (right_inner, right_outer)]:
-            inner, outer = eyebrow
-            y_min = min(inner[1], outer[1]) + offset_y
-            y_max = max(inner[1], outer[1]) + offset_y + 5
-            x_min = min(inner[0], outer[0]) - 5
-            x_max = max(inner[0], outer[0]) + 5
-            
-            x_min = max(0, x_min)
-            y_min = max(0, y_min)
-            x_max = min(image_array.shape[1], x_max)
-            y_max = min(image_array.shape[0], y_max)
-            
-            if x_max > x_min and y_max > y_min:
-                eyebrow_region = image_array[y_min:y_max, x_min:x_max]
-                eyebrow_region = cv2.GaussianBlur(eyebrow_region, (3, 3), 0)
-                image_array[y_min:y_max, x_min:x_max] = eyebrow_region
+        offset_y = int(math.sin(frame_num * freq) * eyebrow_movement - pitch * 4 - onset * 2)
+        if offset_y == 0:
+            return image_array
+        
+        for inner, outer in [(landmarks['left_eyebrow_inner'], landmarks['left_eyebrow_outer']),
+                             (landmarks['right_eyebrow_inner'], landmarks['right_eyebrow_outer'])]:
+            pad = abs(offset_y) + 6
+            roi = self._clip_roi(image_array,
+                                 min(inner[0], outer[0]) - 6, min(inner[1], outer[1]) - pad,
+                                 max(inner[0], outer[0]) + 6, max(inner[1], outer[1]) + pad)
+            if roi is None:
+                continue
+            x1, y1, x2, y2 = roi
+            
+            region = image_array[y1:y2, x1:x2]
+            M = np.float32([[1, 0, 0], [0, 1, offset_y]])
+            shifted = cv2.warpAffine(region, M, (x2 - x1, y2 - y1), borderMode=cv2.BORDER_REPLICATE)
+            self._blend_roi(image_array, roi, shifted)
         
         return image_array
     
@@ -365,32 +360,68 @@ class AdvancedCharacterAnimator:
         }
         return movement_map.get(emotion, 0.0)
     
-    def animate_head(self, image_array: np.ndarray, frame_num: int, 
-                    emotion: EmotionType, landmarks: Dict = None) -> np.ndarray:
-        if not self.animation_params.head_movement:
-            return image_array
-        
-        head_movement_intensity = self._get_head_movement_intensity(emotion)
+    def _head_motion(self, frame_num: int, emotion: EmotionType,
+                     audio_intensity: float = 0.0, onset: float = 0.0) -> Tuple[float, float, float]:
+        head_movement_intensity = self._get_head_movement_intensity(emotion) * (1.0 + audio_intensity * 0.5)
         
         wobble_freq_x = 0.05
         wobble_freq_y = 0.03
         rotation_freq = 0.04
         
         head_wobble_x = math.sin(frame_num * wobble_freq_x) * 3 * head_movement_intensity
-        head_wobble_y = math.sin(frame_num * wobble_freq_y) * 2 * head_movement_intensity
+        head_wobble_y = math.sin(frame_num * wobble_freq_y) * 2 * head_movement_intensity + onset * 4
         rotation = math.sin(frame_num * rotation_freq) * 1.5 * head_movement_intensity
         
-        center_x, center_y = image_array.shape[1] // 2, image_array.shape[0] // 2
+        return head_wobble_x, head_wobble_y, rotation
+    
+    def _breathing_scale(self, frame_num: int) -> float:
+        breathing_freq = 0.12
+        breathing_amp = 0.003
+        
+        return 1.0 + math.sin(frame_num * breathing_freq) * breathing_amp
+    
+    def global_motion_matrix(self, image_shape: Tuple[int, ...], frame_num: int,
+                             emotion: EmotionType, audio_intensity: float = 0.0,
+                             onset: float = 0.0) -> Optional[np.ndarray]:
+        head = self.animation_params.head_movement
+        breathing = self.animation_params.breathing
+        if not head and not breathing:
+            return None
         
-        M = cv2.getRotationMatrix2D((center_x, center_y), rotation, 1.0)
-        rotated = cv2.warpAffine(image_array, M, (image_array.shape[1], image_array.shape[0]), 
-                                flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+        wobble_x, wobble_y, rotation = (self._head_motion(frame_num, emotion, audio_intensity, onset)
+                                        if head else (0.0, 0.0, 0.0))
+        scale = self._breathing_scale(frame_num) if breathing else 1.0
         
-        M_translate = np.float32([[1, 0, head_wobble_x], [0, 1, head_wobble_y]])
-        translated = cv2.warpAffine(rotated, M_translate, (image_array.shape[1], image_array.shape[0]), 
-                                  borderMode=cv2.BORDER_REFLECT)
+        h, w = image_shape[:2]
+        M = cv2.getRotationMatrix2D((w // 2, h // 2), rotation, scale)
+        M[0, 2] += wobble_x
+        M[1, 2] += wobble_y
         
-        return translated
+        return M
+    
+    def apply_global_motion(self, image_array: np.ndarray, M: Optional[np.ndarray],
+                            dst: Optional[np.ndarray] = None) -> np.ndarray:
+        if M is None:
+            return image_array
+        
+        h, w = image_array.shape[:2]
+        return cv2.warpAffine(image_array, M, (w, h), dst=dst,
+                              flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+    
+    def animate_head(self, image_array: np.ndarray, frame_num: int, 
+                    emotion: EmotionType, landmarks: Dict = None,
+                    audio_intensity: float = 0.0, onset: float = 0.0) -> np.ndarray:
+        if not self.animation_params.head_movement:
+            return image_array
+        
+        wobble_x, wobble_y, rotation = self._head_motion(frame_num, emotion, audio_intensity, onset)
+        
+        h, w = image_array.shape[:2]
+        M = cv2.getRotationMatrix2D((w // 2, h // 2), rotation, 1.0)
+        M[0, 2] += wobble_x
+        M[1, 2] += wobble_y
+        
+        return self.apply_global_motion(image_array, M)
     
     def _get_head_movement_intensity(self, emotion: EmotionType) -> float:
         intensity_map = {
@@ -410,30 +441,14 @@ class AdvancedCharacterAnimator:
         if not self.animation_params.breathing:
             return image_array
         
-        breathing_freq = 0.12
-        breathing_amp = 0.003
-        
-        scale = 1.0 + math.sin(frame_num * breathing_freq) * breathing_amp
-        
         h, w = image_array.shape[:2]
-        center = (w // 2, h // 2)
-        
-        new_w = int(w * scale)
-        new_h = int(h * scale)
-        
-        resized = cv2.resize(image_array, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        M = cv2.getRotationMatrix2D((w // 2, h // 2), 0.0, self._breathing_scale(frame_num))
         
-        x1 = (new_w - w) // 2
-        y1 = (new_h - h) // 2
-        
-        if x1 >= 0 and y1 >= 0:
-            resized = resized[y1:y1 + h, x1:x1 + w]
-        
-        return resized
+        return self.apply_global_motion(image_array, M)
     
     def add_micro_expressions(self, image_array: np.ndarray, frame_num: int, 
                              emotion: EmotionType, landmarks: Dict = None) -> np.ndarray:
-        if not self.animation_params.micro_expressions:
+        if not self.animation_params.micro_expressions or not landmarks:
             return image_array
         
         micro_freq = 0.3
@@ -441,91 +456,169 @@ class AdvancedCharacterAnimator:
         
         micro_scale = 1.0 + math.sin(frame_num * micro_freq) * micro_amp
         
-        h, w = image_array.shape[:2]
+        fx, fy, fw, fh = landmarks['face_bbox']
+        roi = self._clip_roi(image_array, fx, fy, fx + fw, fy + fh)
+        if roi is None:
+            return image_array
+        x1, y1, x2, y2 = roi
         
-        if landmarks:
-            face_bbox = landmarks['face_bbox']
-            fx, fy, fw, fh = face_bbox
-            
-            face_region = image_array[fy:fy + fh, fx:fx + fw].copy()
-            
-            face_region = cv2.resize(face_region, None, fx=micro_scale, fy=micro_scale, 
-                                    interpolation=cv2.INTER_LINEAR)
-            
-            if face_region.shape[0] <= fh and face_region.shape[1] <= fw:
-                image_array[fy:fy + face_region.shape[0], fx:fx + face_region.shape[1]] = face_region
+        region = image_array[y1:y2, x1:x2]
+        M = cv2.getRotationMatrix2D(((x2 - x1) / 2, (y2 - y1) / 2), 0.0, micro_scale)
+        scaled = cv2.warpAffine(region, M, (x2 - x1, y2 - y1), flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_REPLICATE)
+        self._blend_roi(image_array, roi, scaled)
         
         return image_array
     
+    def load_base_image(self, base_image_path: str,
+                        size: Optional[Tuple[int, int]] = None) -> Tuple[np.ndarray, Optional[Dict]]:
+        size = size or (self.width, self.height)
+        cached = self._base_cache.get((base_image_path, size))
+        count_cache("character_base", cached is not None)
+        if cached is not None:
+            return cached
+        
+        base_img = Image.open(base_image_path)
+        base_img = base_img.resize(size, Image.Resampling.LANCZOS)
+        
+        if base_img.mode != 'RGB':
+            base_img = base_img.convert('RGB')
+        
+        base_array = np.ascontiguousarray(np.array(base_img))
+        landmarks = self.detect_detailed_landmarks(cv2.cvtColor(base_array, cv2.COLOR_RGB2BGR))
+        
+        self._base_cache = {(base_image_path, size): (base_array, landmarks)}
+        return base_array, landmarks
+    
+    def render_frame(self, base_array: np.ndarray, landmarks: Optional[Dict], frame_num: int,
+                     emotion: EmotionType = EmotionType.NEUTRAL, audio_intensity: float = 0.3,
+                     pitch: float = 0.0, onset: float = 0.0, spread: float = 0.0,
+                     dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Face edits run in a pooled work buffer; the global motion warp writes the
+        finished frame to dst (or a new array).
+        """
+        work = frame_buffers.like("character_work", base_array)
+        np.copyto(work, base_array)
+        
+        image_array = self.animate_mouth_advanced(work, landmarks, audio_intensity, emotion, spread)
+        image_array = self.animate_eyes(image_array, landmarks, frame_num, emotion)
+        image_array = self.animate_eyebrows(image_array, landmarks, frame_num, emotion, pitch, onset)
+        image_array = self.add_micro_expressions(image_array, frame_num, emotion, landmarks)
+        
+        M = self.global_motion_matrix(image_array.shape, frame_num, emotion, audio_intensity, onset)
+        if M is None and image_array is work:
+            # The pooled buffer must not escape the frame
+            return image_array.copy() if dst is None else place(image_array, dst)
+        return self.apply_global_motion(image_array, M, dst)
+    
     def animate_character(self, base_image_path: str, audio_path: str, 
                          frame_num: int, total_frames: int, 
-                         emotion: EmotionType = EmotionType.NEUTRAL) -> np.ndarray:
+                         emotion: EmotionType = EmotionType.NEUTRAL,
+                         audio_intensity: float = 0.3, pitch: float = 0.0,
+                         onset: float = 0.0) -> np.ndarray:
         try:
-            base_img = Image.open(base_image_path)
-            base_img = base_img.resize((self.width, self.height), Image.Resampling.LANCZOS)
-            
-            if base_img.mode != 'RGB':
-                base_img = base_img.convert('RGB')
-            
-            image_array = np.array(base_img)
-            image_array = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
-            
-            landmarks = self.detect_detailed_landmarks(image_array)
+            base_array, landmarks = self.load_base_image(base_image_path)
             
-            audio_intensity = 0.3
-            
-            image_array = self.animate_mouth_advanced(image_array, landmarks, audio_intensity, emotion)
-            image_array = self.animate_eyes(image_array, landmarks, frame_num, emotion)
-            image_array = self.animate_eyebrows(image_array, landmarks, frame_num, emotion)
-            image_array = self.animate_head(image_array, frame_num, emotion, landmarks)
-            image_array = self.apply_breathing(image_array, frame_num, landmarks)
-            image_array = self.add_micro_expressions(image_array, frame_num, emotion, landmarks)
-            
-            image_array = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
-            
-            return image_array
+            return self.render_frame(base_array, landmarks, frame_num, emotion,
+                                     audio_intensity, pitch, onset)
             
         except Exception as e:
             print(f"Error animating character: {e}")
             return np.zeros((self.height, self.width, 3), dtype=np.uint8)
     
+    def frame_features(self, audio_path: str, total_frames: int, fps: int = 30,
+                       emotion: EmotionType = EmotionType.NEUTRAL,
+                       viseme_track: Optional[VisemeTrack] = None
+                       ) -> Tuple[EmotionType, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Per-frame mouth openness, pitch, onsets and lip spread for total_frames
+        frames. Emotion and pitch always come from the (cached) audio analysis;
+        when there is a TTS viseme track it supplies openness, spread and onsets,
+        otherwise those come from the audio too. A neutral emotion is replaced
+        by the one detected in the audio.
+        """
+        if viseme_track is None:
+            viseme_track = load_viseme_track(audio_path)
+        
+        audio_track = self.analyze_audio(audio_path, fps)
+        print(f"📊 Audio features: {audio_track.summary()}")
+        
+        detected_emotion = self.map_audio_to_emotion(audio_track.summary())
+        print(f"😊 Detected emotion: {detected_emotion.value}")
+        
+        if emotion == EmotionType.NEUTRAL:
+            emotion = detected_emotion
+        
+        indices = np.minimum(np.arange(total_frames), max(audio_track.total_frames - 1, 0))
+        pitch = audio_track.pitch[indices]
+        if viseme_track is not None:
+            print(f"👄 Using TTS viseme track ({len(viseme_track.events)} visemes) for mouth shapes")
+            openness, spread, onsets = viseme_track.frame_features(fps, total_frames)
+            return emotion, openness, pitch, onsets, spread
+        
+        openness = audio_track.intensity[indices]
+        onsets = audio_track.onsets[indices]
+        spread = np.zeros(total_frames, dtype=np.float32)
+        return emotion, openness, pitch, onsets, spread
+    
+    def iter_frames(self, base_image_path: str, audio_path: str, total_frames: int, fps: int = 30,
+                    emotion: EmotionType = EmotionType.NEUTRAL,
+                    viseme_track: Optional[VisemeTrack] = None,
+                    resolution: Optional[Tuple[int, int]] = None,
+                    out: Optional[FrameStore] = None) -> Iterator[np.ndarray]:
+        """
+        Render the animation one frame at a time. With out, each frame is written
+        into the store's next slot and that slot is yielded; otherwise every frame
+        is a new array.
+        """
+        emotion, openness, pitch, onsets, spread = self.frame_features(
+            audio_path, total_frames, fps, emotion, viseme_track)
+        
+        print(f"🎬 Creating {total_frames} frames with {emotion.value} emotion...")
+        
+        base_array, landmarks = self.load_base_image(base_image_path, resolution)
+        if landmarks is None:
+            print(f"⚠️  No face detected, applying global motion only")
+        
+        for frame_num in range(total_frames):
+            check_cancelled()
+            slot = out.reserve() if out is not None else None
+            img = self.render_frame(
+                base_array,
+                landmarks,
+                frame_num,
+                emotion,
+                audio_intensity=float(openness[frame_num]),
+                pitch=float(pitch[frame_num]),
+                onset=float(onsets[frame_num]),
+                spread=float(spread[frame_num]),
+                dst=slot
+            )
+            
+            yield img if slot is None else place(img, slot)
+    
     def create_animated_video(self, base_image_path: str, audio_path: str, 
                              output_path: str, emotion: EmotionType = EmotionType.NEUTRAL,
-                             duration: float = 5.0, fps: int = 30) -> str:
+                             duration: float = 5.0, fps: int = 30,
+                             viseme_track: Optional[VisemeTrack] = None,
+                             resolution: Optional[Tuple[int, int]] = None) -> str:
         try:
             print(f"🎬 Creating advanced character animation...")
             
-            audio_features = self.analyze_audio_for_expression(audio_path)
-            print(f"📊 Audio features: {audio_features}")
-            
-            detected_emotion = self.map_audio_to_emotion(audio_features)
-            print(f"😊 Detected emotion: {detected_emotion.value}")
-            
-            if emotion == EmotionType.NEUTRAL:
-                emotion = detected_emotion
-            
-            audio_intensity = self.generate_per_frame_audio_intensity(audio_path, fps)
-            
-            frames = []
             total_frames = int(duration * fps)
-            
-            print(f"🎬 Creating {total_frames} frames with {emotion.value} emotion...")
-            
-            for frame_num in range(total_frames):
-                intensity = audio_intensity[min(frame_num, len(audio_intensity) - 1)]
-                
-                img = self.animate_character(
-                    base_image_path, 
-                    audio_path, 
-                    frame_num, 
-                    total_frames, 
-                    emotion
-                )
-                
-                frames.append(img)
-                
-                if (frame_num + 1) % 10 == 0:
-                    print(f"  Progress: {frame_num + 1}/{total_frames} frames")
+            base_array, landmarks = self.load_base_image(base_image_path, resolution)
+            frames = FrameStore.create(total_frames, base_array.shape[0], base_array.shape[1])
+            
+            with span("frames.character", frames=total_frames):
+                tick = frame_clock("frames.character")
+                rendered = self.iter_frames(base_image_path, audio_path, total_frames, fps, emotion,
+                                            viseme_track, resolution, out=frames)
+                for frame_num, _ in enumerate(rendered):
+                    tick()
+                    
+                    if (frame_num + 1) % 10 == 0:
+                        print(f"  Progress: {frame_num + 1}/{total_frames} frames")
             
             from moviepy.editor import ImageSequenceClip
             from moviepy.audio.io.AudioFileClip import AudioFileClip
@@ -533,30 +626,35 @@ class AdvancedCharacterAnimator:
             
             print(f"🎬 Creating video from {len(frames)} frames...")
             
-            clip = ImageSequenceClip(frames, fps=fps)
-            
-            audio_clip = AudioFileClip(audio_path)
-            
-            if audio_clip.duration > duration:
-                audio_clip = audio_clip.subclip(0, duration)
-            elif audio_clip.duration < duration:
-                audio_clip = audio_loop(audio_clip, duration=duration)
-            
-            final_clip = clip.set_audio(audio_clip)
-            
-            final_clip.write_videofile(
-                output_path,
-                fps=fps,
-                codec='libx264',
-                audio_codec='aac',
-                preset='ultrafast',
-                threads=1,
-                logger=None
-            )
-            
-            clip.close()
-            audio_clip.close()
-            final_clip.close()
+            try:
+                encode_frames(frames, output_path, fps, audio_path=audio_path, preset='ultrafast')
+            except Exception as encode_error:
+                print(f"⚠️  Segmented encode failed: {encode_error}, falling back to single-stream encode...")
+                
+                clip = ImageSequenceClip(list(frames), fps=fps)
+                
+                audio_clip = AudioFileClip(audio_path)
+                
+                if audio_clip.duration > duration:
+                    audio_clip = audio_clip.subclip(0, duration)
+                elif audio_clip.duration < duration:
+                    audio_clip = audio_loop(audio_clip, duration=duration)
+                
+                final_clip = clip.set_audio(audio_clip)
+                
+                final_clip.write_videofile(
+                    output_path,
+                    fps=fps,
+                    codec='libx264',
+                    audio_codec='aac',
+                    preset='ultrafast',
+                    threads=1,
+                    logger=None
+                )
+                
+                clip.close()
+                audio_clip.close()
+                final_clip.close()
             
             print(f"✅ Advanced character animation created: {output_path}")
             return output_path
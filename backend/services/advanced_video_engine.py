@@ -13,6 +13,14 @@ from torchvision.models import vgg19
 import requests
 import urllib.parse
 
+from services.cancellation import check_cancelled
+from services.effects import EffectGraph, Grade, Warp, renderer
+from services.frame_buffers import frame_buffers
+from services.frame_store import FrameStore
+from services.optical_flow import FlowEstimator, FlowMethod
+from services.profiling import frame_clock
+from services.telemetry import count_upstream, traced
+
 class VideoStyle(Enum):
     CINEMATIC = "cinematic"
     ANIME = "anime"
@@ -24,6 +32,7 @@ class VideoStyle(Enum):
     WATERCOLOR = "watercolor"
 
 class QualityPreset(Enum):
+    PREVIEW = {"fps": 12, "resolution": (360, 640), "bitrate": "800k"}
     SPEED = {"fps": 15, "resolution": (720, 1280), "bitrate": "2000k"}
     BALANCED = {"fps": 30, "resolution": (1080, 1920), "bitrate": "5000k"}
     QUALITY = {"fps": 30, "resolution": (1080, 1920), "bitrate": "10000k"}
@@ -52,13 +61,16 @@ class VideoConfig:
     enable_style_transfer: bool = True
     enable_lighting_effects: bool = True
     enable_atmospheric_effects: bool = True
+    fps: Optional[int] = None
+    flow_method: Optional[FlowMethod] = None
 
 class AdvancedVideoEngine:
     def __init__(self):
         self.width = 1080
         self.height = 1920
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.optical_flow_cache = {}
+        self.optical_flow = FlowEstimator()
+        self.renderer = renderer
         self.style_transfer_model = None
         self.load_style_transfer_model()
         
@@ -72,6 +84,12 @@ class AdvancedVideoEngine:
             self.style_transfer_model = None
     
     def generate_base_image(self, prompt: str, style: VideoStyle, output_path: str) -> bool:
+        from services.ai_image_generator import image_fetch_lock
+        with image_fetch_lock(f"{style.value}|{prompt}", 1080, 1920):
+            return self._fetch_base_image(prompt, style, output_path)
+    
+    @traced("image.fetch")
+    def _fetch_base_image(self, prompt: str, style: VideoStyle, output_path: str) -> bool:
         try:
             style_prefix = self._get_style_prefix(style)
             full_prompt = f"{style_prefix} {prompt}"
@@ -103,6 +121,7 @@ class AdvancedVideoEngine:
                     response = requests.get(image_url, timeout=60)
                     
                     print(f"📊 Response status: {response.status_code}, content length: {len(response.content)}")
+                    count_upstream("pollinations", response.status_code)
                     
                     if response.status_code == 429:
                         retry_after = int(response.headers.get('Retry-After', base_delay * (2 ** attempt)))
@@ -277,82 +296,74 @@ class AdvancedVideoEngine:
         
         return anime_array
     
-    def calculate_optical_flow(self, prev_frame: np.ndarray, curr_frame: np.ndarray) -> np.ndarray:
-        prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_RGB2GRAY)
-        curr_gray = cv2.cvtColor(curr_frame, cv2.COLOR_RGB2GRAY)
-        
-        flow = cv2.calcOpticalFlowFarneback(
-            prev_gray, curr_gray, None,
-            pyr_scale=0.5, levels=3, winsize=15,
-            iterations=3, poly_n=5, poly_sigma=1.2,
-            flags=0
-        )
-        
-        return flow
+    def calculate_optical_flow(self, prev_frame: np.ndarray, curr_frame: np.ndarray,
+                               method: Optional[FlowMethod] = None,
+                               dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.optical_flow.flow(prev_frame, curr_frame, method, dst=dst)
     
-    def apply_optical_flow_warp(self, frame: np.ndarray, flow: np.ndarray) -> np.ndarray:
+    def apply_optical_flow_warp(self, frame: np.ndarray, flow: np.ndarray,
+                                dst: Optional[np.ndarray] = None) -> np.ndarray:
         h, w = flow.shape[:2]
         
-        flow = -flow
+        mapping = frame_buffers.get("flow_map", flow.shape, np.float32)
+        np.negative(flow, out=mapping)
         
-        flow[:, :, 0] += np.arange(w)
-        flow[:, :, 1] += np.arange(h)[:, np.newaxis]
+        mapping[:, :, 0] += np.arange(w, dtype=np.float32)
+        mapping[:, :, 1] += np.arange(h, dtype=np.float32)[:, np.newaxis]
         
-        warped = cv2.remap(frame, flow, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+        warped = cv2.remap(frame, mapping, None, cv2.INTER_LINEAR, dst=dst, borderMode=cv2.BORDER_REFLECT)
         
         return warped
     
-    def apply_camera_movement(self, frame: np.ndarray, frame_num: int, total_frames: int, 
-                             movement: CameraMovement) -> np.ndarray:
-        if movement == CameraMovement.STATIC:
-            return frame
-        
-        h, w = frame.shape[:2]
+    def camera_warp(self, frame_shape: Tuple[int, ...], frame_num: int, total_frames: int,
+                    movement: CameraMovement) -> Optional[Warp]:
+        """
+        The camera move for one frame as an effect graph node; None for a static camera.
+        """
+        h, w = frame_shape[:2]
         center_x, center_y = w // 2, h // 2
         
         progress = frame_num / max(total_frames - 1, 1)
         
         if movement == CameraMovement.SLOW_ZOOM_IN:
             scale = 1.0 + (progress * 0.3)
-            return self._apply_zoom(frame, scale, center_x, center_y)
+            return self._zoom_warp(w, h, scale, center_x, center_y)
         
         elif movement == CameraMovement.SLOW_ZOOM_OUT:
             scale = 1.3 - (progress * 0.3)
-            return self._apply_zoom(frame, scale, center_x, center_y)
+            return self._zoom_warp(w, h, scale, center_x, center_y)
         
         elif movement == CameraMovement.PAN_LEFT:
             shift_x = int(progress * w * 0.15)
-            return self._apply_pan(frame, -shift_x, 0)
+            return Warp.translate(-shift_x, 0)
         
         elif movement == CameraMovement.PAN_RIGHT:
             shift_x = int(progress * w * 0.15)
-            return self._apply_pan(frame, shift_x, 0)
+            return Warp.translate(shift_x, 0)
         
         elif movement == CameraMovement.TILT_UP:
             shift_y = int(progress * h * 0.15)
-            return self._apply_pan(frame, 0, -shift_y)
+            return Warp.translate(0, -shift_y)
         
         elif movement == CameraMovement.TILT_DOWN:
             shift_y = int(progress * h * 0.15)
-            return self._apply_pan(frame, 0, shift_y)
+            return Warp.translate(0, shift_y)
         
         elif movement == CameraMovement.ORBIT:
             angle = progress * 15
-            return self._apply_rotation(frame, angle)
+            return Warp.rotate((center_x, center_y), angle)
         
         elif movement == CameraMovement.DOLLY:
             scale = 1.0 + math.sin(progress * math.pi) * 0.2
-            return self._apply_zoom(frame, scale, center_x, center_y)
+            return self._zoom_warp(w, h, scale, center_x, center_y)
         
         elif movement == CameraMovement.CRANE:
             shift_y = int(math.sin(progress * math.pi) * h * 0.1)
-            return self._apply_pan(frame, 0, -shift_y)
+            return Warp.translate(0, -shift_y)
         
-        return frame
+        return None
     
-    def _apply_zoom(self, frame: np.ndarray, scale: float, center_x: int, center_y: int) -> np.ndarray:
-        h, w = frame.shape[:2]
-        
+    def _zoom_warp(self, w: int, h: int, scale: float, center_x: int, center_y: int) -> Optional[Warp]:
         new_w = int(w / scale)
         new_h = int(h / scale)
         
@@ -361,114 +372,117 @@ class AdvancedVideoEngine:
         x2 = min(w, x1 + new_w)
         y2 = min(h, y1 + new_h)
         
-        cropped = frame[y1:y2, x1:x2]
-        
-        if cropped.size == 0:
-            return frame
+        if x2 <= x1 or y2 <= y1:
+            return None
         
-        zoomed = cv2.resize(cropped, (w, h), interpolation=cv2.INTER_LINEAR)
-        
-        return zoomed
-    
-    def _apply_pan(self, frame: np.ndarray, shift_x: int, shift_y: int) -> np.ndarray:
-        h, w = frame.shape[:2]
-        
-        M = np.float32([[1, 0, shift_x], [0, 1, shift_y]])
-        shifted = cv2.warpAffine(frame, M, (w, h), borderMode=cv2.BORDER_REFLECT)
-        
-        return shifted
+        return Warp.crop(x1, y1, x2, y2, w, h)
     
-    def _apply_rotation(self, frame: np.ndarray, angle: float) -> np.ndarray:
-        h, w = frame.shape[:2]
-        center = (w // 2, h // 2)
-        
-        M = cv2.getRotationMatrix2D(center, angle, 1.0)
-        rotated = cv2.warpAffine(frame, M, (w, h), borderMode=cv2.BORDER_REFLECT)
-        
-        return rotated
+    def apply_camera_movement(self, frame: np.ndarray, frame_num: int, total_frames: int, 
+                             movement: CameraMovement, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        With dst the moved frame is written there; a static camera returns frame.
+        """
+        warp = self.camera_warp(frame.shape, frame_num, total_frames, movement)
+        if warp is None:
+            return frame
+        return self.renderer.render(EffectGraph([warp]), frame, dst)
     
-    def apply_dynamic_lighting(self, frame: np.ndarray, frame_num: int, total_frames: int) -> np.ndarray:
+    def lighting_grade(self, frame_num: int, total_frames: int) -> Grade:
         progress = frame_num / max(total_frames - 1, 1)
         
-        frame_array = frame.astype(np.float32)
-        
         brightness_variation = 0.05 * math.sin(progress * 2 * math.pi)
-        frame_array = frame_array * (1.0 + brightness_variation)
         
-        frame_array = np.clip(frame_array, 0, 255)
-        
-        return frame_array.astype(np.uint8)
+        return Grade.gain(1.0 + brightness_variation)
     
-    def apply_atmospheric_effects(self, frame: np.ndarray, frame_num: int) -> np.ndarray:
-        h, w = frame.shape[:2]
-        
+    def fog_grade(self, frame_num: int) -> Grade:
         fog_density = 0.02 + 0.01 * math.sin(frame_num * 0.1)
-        fog_color = np.array([200, 200, 210], dtype=np.float32)
+        fog_color = [200, 200, 210]
         
-        frame_array = frame.astype(np.float32)
-        fogged = frame_array * (1 - fog_density) + fog_color * fog_density
-        
-        return fogged.astype(np.uint8)
+        return Grade.mix(fog_color, fog_density)
+    
+    def apply_dynamic_lighting(self, frame: np.ndarray, frame_num: int, total_frames: int,
+                               dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.renderer.render(EffectGraph([self.lighting_grade(frame_num, total_frames)]), frame, dst)
+    
+    def apply_atmospheric_effects(self, frame: np.ndarray, frame_num: int,
+                                  dst: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.renderer.render(EffectGraph([self.fog_grade(frame_num)]), frame, dst)
     
     def create_temporal_smooth_transition(self, frame1: np.ndarray, frame2: np.ndarray, 
-                                          alpha: float) -> np.ndarray:
-        alpha = np.clip(alpha, 0, 1)
+                                          alpha: float, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        alpha = float(np.clip(alpha, 0, 1))
         
-        blended = (frame1.astype(np.float32) * (1 - alpha) + 
-                  frame2.astype(np.float32) * alpha)
-        
-        return blended.astype(np.uint8)
+        return cv2.addWeighted(frame1, 1 - alpha, frame2, alpha, 0, dst=dst)
     
-    def generate_video_frames(self, config: VideoConfig, prompt: str) -> List[np.ndarray]:
+    @traced("frames.cinematic", count_frames=True)
+    def generate_video_frames(self, config: VideoConfig, prompt: str) -> FrameStore:
         print(f"🎬 Generating video frames with {config.style.value} style...")
         
-        base_image_path = Path("/tmp/output") / f"base_{random.randint(10000, 99999)}.png"
-        self.generate_base_image(prompt, config.style, str(base_image_path))
+        from services.output_store import output_store
         
-        base_img = Image.open(base_image_path)
         quality_settings = config.quality.value
         target_w, target_h = quality_settings["resolution"]
         
-        base_img = base_img.resize((target_w, target_h), Image.Resampling.LANCZOS)
-        base_array = np.array(base_img)
-        
+        with output_store.scratch("base_", ".png") as base_image_path:
+            self.generate_base_image(prompt, config.style, str(base_image_path))
+            base_img = Image.open(base_image_path)
+            base_img = base_img.resize((target_w, target_h), Image.Resampling.LANCZOS)
         if base_img.mode != 'RGB':
             base_img = base_img.convert('RGB')
+        base_array = np.array(base_img)
         
-        total_frames = int(config.duration * quality_settings["fps"])
-        frames = []
+        total_frames = int(config.duration * (config.fps or quality_settings["fps"]))
+        frames = FrameStore.create(total_frames, base_array.shape[0], base_array.shape[1])
         
         prev_frame = None
         prev_flow = None
+        tick = frame_clock("frames.cinematic")
+        
+        # Grades run in a pooled buffer and the camera move writes straight into
+        # the frame's store slot; base_array itself is never written
+        work = frame_buffers.like("cinematic_work", base_array)
+        warp = frame_buffers.like("cinematic_warp", base_array)
+        flow_stats = dict(self.optical_flow.stats)
         
         for frame_num in range(total_frames):
-            frame = base_array.copy()
-            
-            frame = self.apply_style_transfer(frame, config.style, config.enable_style_transfer)
+            check_cancelled()
+            frame = self.apply_style_transfer(base_array, config.style, config.enable_style_transfer)
             
+            graph = EffectGraph()
             if config.enable_lighting_effects:
-                frame = self.apply_dynamic_lighting(frame, frame_num, total_frames)
+                graph.add(self.lighting_grade(frame_num, total_frames))
             
             if config.enable_atmospheric_effects:
-                frame = self.apply_atmospheric_effects(frame, frame_num)
+                graph.add(self.fog_grade(frame_num))
             
             if prev_frame is not None and config.enable_optical_flow:
-                flow = self.calculate_optical_flow(prev_frame, frame)
+                # Flow needs the graded frame, so the grades are rendered on their own
+                frame = self.renderer.render(graph, frame, dst=work)
+                graph = EffectGraph()
+                
+                flow = self.calculate_optical_flow(prev_frame, frame, config.flow_method,
+                                                   dst=frame_buffers.get("cinematic_flow", frame.shape[:2] + (2,), np.float32))
                 
                 flow_intensity = 0.3
-                warped_frame = self.apply_optical_flow_warp(prev_frame, flow * flow_intensity)
+                flow *= flow_intensity
+                warped_frame = self.apply_optical_flow_warp(prev_frame, flow, dst=warp)
                 
                 blend_alpha = 0.5 + 0.3 * math.sin(frame_num * 0.2)
-                frame = self.create_temporal_smooth_transition(warped_frame, frame, blend_alpha)
+                frame = self.create_temporal_smooth_transition(warped_frame, frame, blend_alpha, dst=work)
             
-            frame = self.apply_camera_movement(frame, frame_num, total_frames, config.camera_movement)
+            graph.add(self.camera_warp(frame.shape, frame_num, total_frames, config.camera_movement))
             
-            frames.append(frame)
-            prev_frame = frame.copy()
+            slot = frames.reserve()
+            self.renderer.render(graph, frame, dst=slot)
+            prev_frame = slot
+            tick()
             
             if (frame_num + 1) % 10 == 0:
                 print(f"  Progress: {frame_num + 1}/{total_frames} frames")
         
-        base_image_path.unlink(missing_ok=True)
+        if config.enable_optical_flow:
+            counts = {k: v - flow_stats[k] for k, v in self.optical_flow.stats.items()}
+            print(f"🌊 Optical flow: {counts.pop('computed')} computed, "
+                  + ", ".join(f"{v} {k}" for k, v in counts.items()))
         
         return frames
@@ -4,11 +4,30 @@ import urllib.parse
 import time
 import hashlib
 import os
+import threading
 from functools import lru_cache
 
+from services.telemetry import count_cache, count_upstream, traced
+
 CACHE_DIR = Path("/tmp/image_cache")
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+_fetch_locks = {}
+_fetch_locks_guard = threading.Lock()
+
+def image_fetch_lock(prompt: str, width: int, height: int) -> threading.Lock:
+    """
+    Per-image lock so concurrent requests for the same prompt wait for one fetch
+    and then hit the cache instead of downloading the same image again.
+    """
+    key = get_cache_key(prompt, width, height)
+    with _fetch_locks_guard:
+        lock = _fetch_locks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _fetch_locks[key] = lock
+        return lock
+
 def get_cache_key(prompt: str, width: int, height: int) -> str:
     prompt_hash = hashlib.md5(prompt.encode()).hexdigest()
     return f"{prompt_hash}_{width}x{height}.jpg"
@@ -17,7 +36,9 @@ def get_cached_image(prompt: str, width: int, height: int) -> Path:
     cache_key = get_cache_key(prompt, width, height)
     cache_path = CACHE_DIR / cache_key
     if cache_path.exists():
+        count_cache("image", True)
         return cache_path
+    count_cache("image", False)
     return None
 
 def cache_image(prompt: str, image_data: bytes, width: int, height: int):
@@ -31,6 +52,7 @@ def cache_image(prompt: str, image_data: bytes, width: int, height: int):
         print(f"⚠️ Failed to cache image: {e}")
         return None
 
+@traced("image.fetch")
 def generate_ai_image(prompt: str, output_path: str) -> bool:
     try:
         output_path = Path(output_path)
@@ -65,6 +87,7 @@ def generate_ai_image(prompt: str, output_path: str) -> bool:
                 response = requests.get(image_url, timeout=60)
                 
                 print(f"📊 Response status: {response.status_code}, content length: {len(response.content)}")
+                count_upstream("pollinations", response.status_code)
                 
                 if response.status_code == 429:
                     retry_after = int(response.headers.get('Retry-After', base_delay * (2 ** attempt)))
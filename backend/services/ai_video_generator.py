@@ -3,6 +3,8 @@ import time
 from pathlib import Path
 from typing import Optional
 
+from services.telemetry import count_upstream
+
 def generate_ai_video(prompt: str, output_path: str, duration: int = 4) -> bool:
     """
     Generate an AI video from text prompt using Replicate API.
@@ -56,6 +58,7 @@ def generate_ai_video(prompt: str, output_path: str, duration: int = 4) -> bool:
             json=prediction_data,
             headers=headers
         )
+        count_upstream("replicate", response.status_code)
         response.raise_for_status()
         
         prediction = response.json()
@@ -73,6 +76,7 @@ def generate_ai_video(prompt: str, output_path: str, duration: int = 4) -> bool:
                 return False
             
             response = requests.get(prediction_url, headers=headers)
+            count_upstream("replicate", response.status_code)
             response.raise_for_status()
             status = response.json()
             
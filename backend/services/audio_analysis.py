@@ -0,0 +1,139 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import numpy as np
+import librosa
+
+ANALYSIS_SAMPLE_RATE = 11025
+MAX_CACHED_ANALYSES = 32
+
+_analysis_cache: "OrderedDict[Tuple[str, int], AudioFeatureTrack]" = OrderedDict()
+_analysis_lock = threading.Lock()
+
+@dataclass
+class AudioFeatureTrack:
+    fps: int
+    duration: float
+    energy: float
+    pitch_mean: float
+    pitch_std: float
+    tempo: float
+    sharpness: float
+    intensity: np.ndarray
+    pitch: np.ndarray
+    onsets: np.ndarray
+
+    @property
+    def total_frames(self) -> int:
+        return len(self.intensity)
+
+    def summary(self) -> Dict:
+        return {
+            'energy': self.energy,
+            'pitch_mean': self.pitch_mean,
+            'pitch_std': self.pitch_std,
+            'tempo': self.tempo,
+            'sharpness': self.sharpness,
+            'duration': self.duration
+        }
+
+    def frame(self, frame_num: int) -> Tuple[float, float, float]:
+        if self.total_frames == 0:
+            return 0.3, 0.0, 0.0
+        # Past the end of the audio the last frame holds, rather than replaying the start
+        idx = min(frame_num, self.total_frames - 1)
+        return float(self.intensity[idx]), float(self.pitch[idx]), float(self.onsets[idx])
+
+def default_feature_track(fps: int = 30, duration: float = 5.0) -> AudioFeatureTrack:
+    total_frames = max(int(duration * fps), 1)
+    return AudioFeatureTrack(
+        fps=fps,
+        duration=duration,
+        energy=0.5,
+        pitch_mean=150.0,
+        pitch_std=20.0,
+        tempo=120.0,
+        sharpness=0.1,
+        intensity=np.full(total_frames, 0.5, dtype=np.float32),
+        pitch=np.zeros(total_frames, dtype=np.float32),
+        onsets=np.zeros(total_frames, dtype=np.float32)
+    )
+
+def hash_audio_file(audio_path: str) -> str:
+    digest = hashlib.sha1()
+    with open(audio_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _fit_to_frames(values: np.ndarray, total_frames: int) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float32)
+    if len(values) < total_frames:
+        return np.pad(values, (0, total_frames - len(values)))
+    return values[:total_frames]
+
+def _compute_feature_track(audio_path: str, fps: int) -> AudioFeatureTrack:
+    y, sr = librosa.load(audio_path, sr=ANALYSIS_SAMPLE_RATE, mono=True)
+    duration = len(y) / sr
+    total_frames = max(int(duration * fps), 1)
+    hop_length = max(int(sr / fps), 1)
+
+    rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
+
+    f0 = librosa.yin(y, fmin=50, fmax=400, sr=sr, hop_length=hop_length)
+    voiced = f0[~np.isnan(f0)]
+    pitch_mean = float(np.mean(voiced)) if len(voiced) > 0 else 150.0
+    pitch_std = float(np.std(voiced)) if len(voiced) > 0 else 20.0
+
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
+    tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+
+    zcr = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)[0]
+
+    intensity = rms / (np.max(rms) + 1e-6)
+
+    pitch_track = np.nan_to_num(f0, nan=pitch_mean)
+    pitch_track = np.clip((pitch_track - pitch_mean) / (3 * pitch_std + 1e-6), -1.0, 1.0)
+    pitch_track = pitch_track * (rms > 0.1 * np.max(rms))
+
+    onsets = onset_env / (np.max(onset_env) + 1e-6)
+
+    return AudioFeatureTrack(
+        fps=fps,
+        duration=float(duration),
+        energy=float(np.mean(rms)),
+        pitch_mean=pitch_mean,
+        pitch_std=pitch_std,
+        tempo=float(np.atleast_1d(tempo)[0]),
+        sharpness=float(np.mean(zcr)),
+        intensity=_fit_to_frames(intensity, total_frames),
+        pitch=_fit_to_frames(pitch_track, total_frames),
+        onsets=_fit_to_frames(onsets, total_frames)
+    )
+
+def analyze_audio(audio_path: str, fps: int = 30) -> AudioFeatureTrack:
+    """
+    Decode the audio once at a low sample rate and compute the RMS envelope,
+    pitch, onsets and tempo in a single pass, resampled to one value per video frame.
+    Results are cached by audio content hash.
+    """
+    cache_key = (hash_audio_file(audio_path), fps)
+
+    with _analysis_lock:
+        track = _analysis_cache.get(cache_key)
+        if track is not None:
+            _analysis_cache.move_to_end(cache_key)
+            print(f"🔄 Using cached audio analysis for {cache_key[0][:12]}")
+            return track
+
+    track = _compute_feature_track(audio_path, fps)
+
+    with _analysis_lock:
+        _analysis_cache[cache_key] = track
+        while len(_analysis_cache) > MAX_CACHED_ANALYSES:
+            _analysis_cache.popitem(last=False)
+
+    return track
@@ -0,0 +1,31 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+_cancel_event: "contextvars.ContextVar[Optional[threading.Event]]" = contextvars.ContextVar("render_cancel", default=None)
+
+class RenderCancelled(Exception):
+    pass
+
+@contextmanager
+def cancel_scope():
+    """
+    Give tasks and worker threads started inside the block a cancel event.
+    asyncio tasks, asyncio.to_thread() and FrameStream copy the context, so a
+    job's render loops see the event of the job that started them.
+    """
+    event = threading.Event()
+    token = _cancel_event.set(event)
+    try:
+        yield event
+    finally:
+        _cancel_event.reset(token)
+
+def check_cancelled() -> None:
+    """
+    Called once per frame by render loops; raises once the job is cancelled.
+    """
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise RenderCancelled("Render cancelled")
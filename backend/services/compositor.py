@@ -0,0 +1,206 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from services.cancellation import check_cancelled
+
+# Animated scales are quantised to this step so resized sprites can be reused
+SCALE_STEP = 0.01
+MAX_CACHED_SCALES = 64
+
+@dataclass
+class LayerTransform:
+    """
+    Placement of a layer on one frame: top-left corner in frame pixels, a scale
+    relative to the prepared sprite size, and an opacity multiplier.
+    """
+    x: float
+    y: float
+    scale: float = 1.0
+    opacity: float = 1.0
+
+TransformFn = Callable[[int, int], LayerTransform]
+
+def circle_mask(width: int, height: int, feather: int = 0) -> np.ndarray:
+    """
+    Float32 alpha in [0, 1]: a centred disc, with a soft edge of about feather pixels.
+    """
+    mask = np.zeros((height, width), dtype=np.uint8)
+    radius = min(width, height) // 2
+    cv2.circle(mask, (width // 2, height // 2), max(1, radius - feather // 2), 255, -1)
+    if feather > 0:
+        kernel = feather | 1
+        mask = cv2.GaussianBlur(mask, (kernel, kernel), 0)
+    return mask.astype(np.float32) / 255.0
+
+class Layer:
+    """
+    A sprite composited over the frames. The sprite and its alpha are prepared
+    once; per frame only the covered region of the frame is blended, in place,
+    with float32 weight maps. transform is fixed or a function of
+    (frame_num, total_frames); scaled versions of the sprite are cached per
+    SCALE_STEP so animated zooms don't resize every frame.
+    """
+
+    def __init__(self, sprite: np.ndarray, alpha: np.ndarray,
+                 transform: Union[LayerTransform, TransformFn], name: str = "layer"):
+        if sprite.shape[:2] != alpha.shape[:2]:
+            raise ValueError(f"Sprite {sprite.shape[:2]} and alpha {alpha.shape[:2]} sizes differ")
+        self.sprite = np.ascontiguousarray(sprite[:, :, :3])
+        self.alpha = np.ascontiguousarray(alpha, dtype=np.float32)
+        self.transform = transform
+        self.name = name
+        self._scaled: "OrderedDict[float, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+
+    @classmethod
+    def from_image(cls, image: np.ndarray, size: Tuple[int, int],
+                   transform: Union[LayerTransform, TransformFn], mask: Optional[str] = "circle",
+                   feather: int = 0, name: str = "layer") -> "Layer":
+        """
+        Resize image to size (width, height) once. mask "circle" cuts a disc;
+        None uses the image's own alpha channel if it has one, else the full rectangle.
+        """
+        width, height = size
+        resized = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        if mask == "circle":
+            alpha = circle_mask(width, height, feather)
+        elif mask is None and resized.ndim == 3 and resized.shape[2] == 4:
+            alpha = resized[:, :, 3].astype(np.float32) / 255.0
+        elif mask is None:
+            alpha = np.ones((height, width), dtype=np.float32)
+        else:
+            raise ValueError(f"Unknown layer mask: {mask}")
+        if resized.ndim == 2:
+            resized = cv2.cvtColor(resized, cv2.COLOR_GRAY2RGB)
+        return cls(resized, alpha, transform, name)
+
+    def transform_at(self, frame_num: int, total_frames: int) -> LayerTransform:
+        if callable(self.transform):
+            return self.transform(frame_num, total_frames)
+        return self.transform
+
+    def sprite_at(self, scale: float) -> Tuple[np.ndarray, np.ndarray]:
+        scale = round(scale / SCALE_STEP) * SCALE_STEP
+        if abs(scale - 1.0) < SCALE_STEP / 2:
+            return self.sprite, self.alpha
+        cached = self._scaled.get(scale)
+        if cached is None:
+            h, w = self.alpha.shape
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+            cached = self._scaled[scale] = (cv2.resize(self.sprite, size, interpolation=interpolation),
+                                            cv2.resize(self.alpha, size, interpolation=interpolation))
+            while len(self._scaled) > MAX_CACHED_SCALES:
+                self._scaled.popitem(last=False)
+        else:
+            self._scaled.move_to_end(scale)
+        return cached
+
+    def advance(self, frame_num: int) -> None:
+        """
+        Called once per frame before drawing; static layers have nothing to do.
+        """
+
+    def close(self) -> None:
+        pass
+
+    def prepare(self, frame: np.ndarray, frame_num: int,
+                total_frames: int) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        The frame region the layer covers (a view), the matching part of the
+        sprite and the float32 weights to blend with; None if nothing shows.
+        """
+        self.advance(frame_num)
+        placement = self.transform_at(frame_num, total_frames)
+        if placement.opacity <= 0:
+            return None
+        sprite, alpha = self.sprite_at(placement.scale)
+
+        # Clip the sprite rectangle to the frame; layers may move partly off screen
+        fh, fw = frame.shape[:2]
+        sh, sw = alpha.shape
+        x, y = int(round(placement.x)), int(round(placement.y))
+        x1, y1, x2, y2 = max(0, x), max(0, y), min(fw, x + sw), min(fh, y + sh)
+        if x1 >= x2 or y1 >= y2:
+            return None
+
+        region = frame[y1:y2, x1:x2]
+        sprite = sprite[y1 - y:y2 - y, x1 - x:x2 - x]
+        weight = alpha[y1 - y:y2 - y, x1 - x:x2 - x]
+        if placement.opacity < 1.0:
+            weight = weight * np.float32(placement.opacity)
+        return region, sprite, weight
+
+    def draw(self, frame: np.ndarray, frame_num: int, total_frames: int) -> np.ndarray:
+        parts = self.prepare(frame, frame_num, total_frames)
+        if parts is not None:
+            region, sprite, weight = parts
+            cv2.blendLinear(region, sprite, 1.0 - weight, weight, dst=region)
+        return frame
+
+class StreamLayer(Layer):
+    """
+    Layer whose sprite changes every frame: one frame is taken from frames per
+    composited frame (e.g. a FrameStream of animator output). Frames should be
+    the size of alpha; if the stream runs out the last frame stays up.
+    """
+
+    def __init__(self, frames: Iterable[np.ndarray], alpha: np.ndarray,
+                 transform: Union[LayerTransform, TransformFn], name: str = "stream"):
+        h, w = alpha.shape
+        super().__init__(np.zeros((h, w, 3), dtype=np.uint8), alpha, transform, name)
+        self.source = frames
+        self.frames = iter(frames)
+
+    def advance(self, frame_num: int) -> None:
+        frame = next(self.frames, None)
+        if frame is None:
+            return
+        if frame.shape[:2] != self.alpha.shape:
+            frame = cv2.resize(frame, (self.alpha.shape[1], self.alpha.shape[0]), interpolation=cv2.INTER_AREA)
+        self.sprite = frame[:, :, :3]
+
+    def sprite_at(self, scale: float) -> Tuple[np.ndarray, np.ndarray]:
+        # A new sprite every frame: nothing to cache
+        if abs(scale - 1.0) < SCALE_STEP / 2:
+            return self.sprite, self.alpha
+        h, w = self.alpha.shape
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return cv2.resize(self.sprite, size), cv2.resize(self.alpha, size)
+
+    def close(self) -> None:
+        for frames in (self.frames, self.source):
+            close = getattr(frames, "close", None)
+            if close is not None:
+                close()
+
+class Compositor:
+    """
+    Ordered stack of layers drawn over each frame, bottom first.
+    """
+
+    def __init__(self, layers: Optional[List[Layer]] = None):
+        self.layers: List[Layer] = list(layers or [])
+
+    def add(self, layer: Layer) -> "Compositor":
+        self.layers.append(layer)
+        return self
+
+    def composite(self, frame: np.ndarray, frame_num: int, total_frames: int) -> np.ndarray:
+        for layer in self.layers:
+            layer.draw(frame, frame_num, total_frames)
+        return frame
+
+    def render(self, frames: Iterable[np.ndarray], total_frames: int,
+               tick: Callable[[], None] = lambda: None) -> None:
+        try:
+            for frame_num, frame in enumerate(frames):
+                check_cancelled()
+                self.composite(frame, frame_num, total_frames)
+                tick()
+        finally:
+            for layer in self.layers:
+                layer.close()
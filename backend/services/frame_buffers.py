@@ -0,0 +1,70 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+
+MAX_POOLED_BUFFERS = 32
+MAX_POOLED_BYTES = int(float(os.getenv("FRAME_BUFFER_POOL_MB", "256")) * 1024 * 1024)
+
+class FrameBufferPool:
+    """
+    Reusable scratch arrays for per-frame stages. A render loop asks for the same
+    roles ("lighting", "warp", ...) every frame and gets the same arrays back, so
+    it cycles a fixed set of buffers instead of allocating several full frames
+    per frame. Buffers are per thread, so concurrent renders never share one, and
+    a buffer is only valid until the same role is requested again: copy anything
+    that has to outlive the frame. Each thread's pool is capped by count and by
+    bytes, and should be clear()ed when the thread's render finishes.
+    """
+
+    def __init__(self, max_buffers: int = MAX_POOLED_BUFFERS, max_bytes: int = MAX_POOLED_BYTES):
+        self.max_buffers = max_buffers
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _buffers(self) -> "OrderedDict[Tuple, np.ndarray]":
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = OrderedDict()
+            self._local.nbytes = 0
+        return buffers
+
+    def get(self, role: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        buffers = self._buffers()
+        key = (role, tuple(shape), np.dtype(dtype).str)
+        buffer = buffers.get(key)
+        if buffer is None:
+            buffer = buffers[key] = np.empty(shape, dtype=dtype)
+            self._local.nbytes += buffer.nbytes
+            # A resolution change leaves the old buffers unused; drop the oldest.
+            # Callers keep the arrays they already hold, so eviction is always safe.
+            while len(buffers) > 1 and (len(buffers) > self.max_buffers or self._local.nbytes > self.max_bytes):
+                _, evicted = buffers.popitem(last=False)
+                self._local.nbytes -= evicted.nbytes
+        else:
+            buffers.move_to_end(key)
+        return buffer
+
+    def like(self, role: str, frame: np.ndarray, dtype=None) -> np.ndarray:
+        return self.get(role, frame.shape, dtype or frame.dtype)
+
+    def nbytes(self) -> int:
+        self._buffers()
+        return self._local.nbytes
+
+    def clear(self) -> None:
+        self._local.buffers = OrderedDict()
+        self._local.nbytes = 0
+
+def place(frame: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """
+    Make sure a stage's result ends up in dst; stages given dst= return their
+    input untouched when they have nothing to do.
+    """
+    if frame is not dst:
+        np.copyto(dst, frame)
+    return dst
+
+frame_buffers = FrameBufferPool()
@@ -0,0 +1,173 @@
+import os
+import tempfile
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+FRAME_STORE_DIR = Path(os.getenv("FRAME_STORE_DIR", "/tmp/output"))
+SHM_DIR = Path("/dev/shm")
+FRAME_STORE_BACKING = os.getenv("FRAME_STORE_BACKING", "auto")
+FRAME_STORE_MEMORY_BYTES = int(float(os.getenv("FRAME_STORE_MEMORY_MB", "512")) * 1024 * 1024)
+
+# Slot 0 of the header is the number of frames appended, visible to attached processes
+HEADER_BYTES = 64
+BACKINGS = ("memory", "memmap", "shm")
+
+@dataclass(frozen=True)
+class FrameStoreHandle:
+    """
+    Everything another process needs to open a store with FrameStore.attach().
+    """
+    backing: str
+    name: str
+    capacity: int
+    shape: Tuple[int, int, int]
+
+def _unlink_file(path: str) -> None:
+    Path(path).unlink(missing_ok=True)
+
+def choose_backing(nbytes: int) -> str:
+    if FRAME_STORE_BACKING != "auto":
+        return FRAME_STORE_BACKING
+    return "memory" if nbytes <= FRAME_STORE_MEMORY_BYTES else "memmap"
+
+class FrameStore:
+    """
+    Fixed-shape uint8 frame slots in one preallocated buffer, for pipelines that
+    need random access to a whole frame sequence. Frames are addressed by the
+    order they were appended; past capacity the store wraps as a ring and only
+    the last capacity frames stay readable. Indexing returns a view of the slot,
+    so frames can be edited in place.
+
+    Backings: "memory" is a plain array; "memmap" spills to a file in
+    FRAME_STORE_DIR so the page cache rather than the heap holds the frames;
+    "shm" maps a file in /dev/shm, i.e. RAM shared between processes. memmap and
+    shm stores can be opened from another process with attach(handle()) without
+    copying or pickling the frames. The creating process unlinks the backing file
+    on close() or when the store is garbage collected; frames already handed out
+    stay valid until they are dropped.
+    """
+
+    def __init__(self, buffer: np.ndarray, capacity: int, shape: Tuple[int, int, int],
+                 backing: str, name: Optional[str] = None):
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self.backing = backing
+        self.name = name
+        frame_bytes = int(np.prod(self.shape))
+        self._header = buffer[:8].view(np.int64)
+        self._slots = buffer[HEADER_BYTES:HEADER_BYTES + capacity * frame_bytes].reshape((capacity,) + self.shape)
+        self._finalizer: Optional[weakref.finalize] = None
+
+    @classmethod
+    def create(cls, capacity: int, height: int, width: int, channels: int = 3,
+               backing: Optional[str] = None) -> "FrameStore":
+        shape = (height, width, channels)
+        frames_bytes = capacity * height * width * channels
+        nbytes = HEADER_BYTES + frames_bytes
+        backing = backing or choose_backing(frames_bytes)
+        if backing not in BACKINGS:
+            raise ValueError(f"Unknown frame store backing: {backing}")
+
+        if backing == "memory":
+            store = cls(np.empty(nbytes, dtype=np.uint8), capacity, shape, backing)
+        else:
+            directory = SHM_DIR if backing == "shm" else FRAME_STORE_DIR
+            if backing == "shm" and not directory.is_dir():
+                raise ValueError(f"Shared-memory frame stores need {SHM_DIR}")
+            directory.mkdir(parents=True, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix=".frames_", suffix=".bin", dir=directory)
+            os.close(fd)
+            buffer = np.memmap(path, dtype=np.uint8, mode="w+", shape=(nbytes,))
+            store = cls(buffer, capacity, shape, backing, path)
+            store._finalizer = weakref.finalize(store, _unlink_file, path)
+
+        store._header[0] = 0
+        if backing != "memory":
+            print(f"🗄️  Frame store: {capacity} x {width}x{height} frames "
+                  f"({frames_bytes / 1e6:.0f} MB, {backing})")
+        return store
+
+    @classmethod
+    def attach(cls, handle: FrameStoreHandle) -> "FrameStore":
+        """
+        Open a store created by another process; closing it leaves the file alone.
+        """
+        if handle.backing not in ("memmap", "shm"):
+            raise ValueError(f"A {handle.backing} frame store cannot be attached from another process")
+        buffer = np.memmap(handle.name, dtype=np.uint8, mode="r+")
+        return cls(buffer, handle.capacity, handle.shape, handle.backing, handle.name)
+
+    def handle(self) -> FrameStoreHandle:
+        if self.name is None:
+            raise ValueError("In-memory frame stores cannot be shared between processes")
+        return FrameStoreHandle(self.backing, self.name, self.capacity, self.shape)
+
+    @property
+    def count(self) -> int:
+        return int(self._header[0])
+
+    @property
+    def first(self) -> int:
+        """
+        Index of the oldest frame still readable.
+        """
+        return max(0, self.count - self.capacity)
+
+    @property
+    def nbytes(self) -> int:
+        return self._slots.nbytes
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _slot(self, index: int) -> int:
+        count = self.count
+        if index < 0:
+            index += count
+        if not self.first <= index < count:
+            raise IndexError(f"Frame {index} is not in the store (readable {self.first}..{count - 1})")
+        return index % self.capacity
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self._slots[self._slot(index)]
+
+    def __setitem__(self, index: int, frame: np.ndarray) -> None:
+        np.copyto(self._slots[self._slot(index)], frame)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for index in range(self.first, self.count):
+            yield self._slots[index % self.capacity]
+
+    def reserve(self) -> np.ndarray:
+        """
+        Claim the next slot and return it for the caller to fill in place
+        (e.g. as an OpenCV dst), avoiding a temporary frame and a copy.
+        """
+        if self.capacity == 0:
+            raise IndexError("Frame store has no slots")
+        index = self.count
+        self._header[0] = index + 1
+        return self._slots[index % self.capacity]
+
+    def append(self, frame: np.ndarray) -> int:
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match store shape {self.shape}")
+        index = self.count
+        np.copyto(self.reserve(), frame, casting="unsafe")
+        return index
+
+    def close(self) -> None:
+        self._slots = np.empty((0,) + self.shape, dtype=np.uint8)
+        self._header = np.zeros(1, dtype=np.int64)
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __enter__(self) -> "FrameStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
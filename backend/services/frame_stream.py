@@ -0,0 +1,85 @@
+import contextvars
+import os
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, Tuple
+
+import numpy as np
+
+from services.frame_store import FrameStore
+
+FRAME_STREAM_DEPTH = int(os.getenv("FRAME_STREAM_DEPTH", "8"))
+_DONE = object()
+
+class FrameStream:
+    """
+    Runs a frame generator on its own thread and hands the frames to the
+    consuming thread as they are rendered, so two render loops (e.g. the
+    character animator and the hybrid compositor) work on different cores at
+    once; the heavy OpenCV/NumPy calls release the GIL.
+
+    produce(store) is given a small ring FrameStore and should yield frames it
+    wrote into store.reserve() slots; anything else is copied into the ring.
+    The queue holds at most depth frames and the ring has depth + 2 slots, so a
+    slot is never reused while the consumer can still be reading it, and memory
+    stays at depth + 2 frames however long the stream is. A frame handed out is
+    valid until the next one is requested. Errors in the producer are re-raised
+    in the consumer; a consumer that stops early stops the producer.
+    """
+
+    def __init__(self, produce: Callable[[FrameStore], Iterable[np.ndarray]],
+                 shape: Tuple[int, int, int], depth: int = FRAME_STREAM_DEPTH, name: str = "frame-stream"):
+        height, width, channels = shape
+        self.depth = max(1, depth)
+        self.store = FrameStore.create(self.depth + 2, height, width, channels, backing="memory")
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.depth)
+        self._stop = threading.Event()
+        # The producer's spans and frame clocks belong to the consumer's job
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(target=context.run, args=(self._run, produce), name=name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, produce: Callable[[FrameStore], Iterable[np.ndarray]]) -> None:
+        try:
+            for frame in produce(self.store):
+                index = self.store.count - 1
+                if index < 0 or not np.may_share_memory(frame, self.store[index]):
+                    index = self.store.append(frame)
+                if not self._put(index):
+                    return
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(_DONE)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield self.store[item]
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._stop.set()
+        # Unblock a producer waiting on a full queue
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=5.0)
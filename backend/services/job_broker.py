@@ -0,0 +1,277 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+BROKER_URL = os.getenv("RENDER_BROKER", "")
+
+HEARTBEAT_SECONDS = 10.0
+LEASE_SECONDS = 60.0
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 15.0
+
+class QueueStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+@dataclass
+class QueuedJob:
+    job_id: str
+    kind: str
+    payload: Dict
+    status: QueueStatus = QueueStatus.QUEUED
+    attempts: int = 0
+    max_attempts: int = MAX_ATTEMPTS
+    worker_id: Optional[str] = None
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    available_at: float = field(default_factory=time.time)
+    heartbeat_at: Optional[float] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status.value,
+            "attempts": self.attempts,
+            "worker_id": self.worker_id,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+class JobBroker(ABC):
+    """
+    Queue between the API and render workers. Workers claim a job with a lease,
+    renew it with heartbeats and report completion or failure. Failed jobs and
+    jobs whose worker stopped heartbeating are retried until max_attempts.
+    """
+
+    @abstractmethod
+    def enqueue(self, job_id: str, kind: str, payload: Dict, max_attempts: int = MAX_ATTEMPTS) -> QueuedJob:
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[QueuedJob]:
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        ...
+
+    @abstractmethod
+    def fail(self, job_id: str, worker_id: str, error: str, retry_after: Optional[float] = None) -> bool:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[QueuedJob]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    def pending(self, client_key: str) -> int:
+        """
+        Queued and running jobs enqueued for a client (payload["client"]["key"]).
+        """
+
+class SQLiteBroker(JobBroker):
+    """
+    Broker backed by a single SQLite file. Good for tests and for several worker
+    processes sharing one host or a disk that supports file locking.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    worker_id TEXT,
+                    result TEXT,
+                    error TEXT,
+                    available_at REAL NOT NULL,
+                    heartbeat_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> QueuedJob:
+        return QueuedJob(
+            job_id=row["job_id"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            status=QueueStatus(row["status"]),
+            attempts=row["attempts"],
+            max_attempts=row["max_attempts"],
+            worker_id=row["worker_id"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+            available_at=row["available_at"],
+            heartbeat_at=row["heartbeat_at"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+        )
+
+    def enqueue(self, job_id: str, kind: str, payload: Dict, max_attempts: int = MAX_ATTEMPTS) -> QueuedJob:
+        job = QueuedJob(job_id=job_id, kind=kind, payload=payload, max_attempts=max_attempts)
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, payload, status, max_attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.job_id, job.kind, json.dumps(payload), job.status.value, max_attempts,
+                 job.available_at, job.created_at, job.updated_at)
+            )
+        return job
+
+    def _expire_leases(self, conn: sqlite3.Connection, now: float, lease_seconds: float) -> None:
+        expired = conn.execute(
+            "SELECT job_id, worker_id FROM jobs WHERE status = ? AND heartbeat_at < ?",
+            (QueueStatus.RUNNING.value, now - lease_seconds)
+        ).fetchall()
+        for row in expired:
+            print(f"💔 Worker {row['worker_id']} stopped heartbeating, releasing job {row['job_id']}")
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+            "worker_id = NULL, error = ?, available_at = ?, updated_at = ? "
+            "WHERE status = ? AND heartbeat_at < ?",
+            (QueueStatus.FAILED.value, QueueStatus.QUEUED.value, "Worker heartbeat lost", now, now,
+             QueueStatus.RUNNING.value, now - lease_seconds)
+        )
+
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[QueuedJob]:
+        now = time.time()
+        with self._transaction() as conn:
+            self._expire_leases(conn, now, lease_seconds)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND available_at <= ? "
+                "ORDER BY available_at, created_at LIMIT 1",
+                (QueueStatus.QUEUED.value, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, attempts = attempts + 1, "
+                "heartbeat_at = ?, updated_at = ? WHERE job_id = ?",
+                (QueueStatus.RUNNING.value, worker_id, now, now, row["job_id"])
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+        return self._row_to_job(row)
+
+    def _update_owned(self, job_id: str, worker_id: str, assignments: str, params: tuple) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? "
+                "WHERE job_id = ? AND worker_id = ? AND status = ?",
+                (*params, time.time(), job_id, worker_id, QueueStatus.RUNNING.value)
+            )
+            return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        return self._update_owned(job_id, worker_id, "heartbeat_at = ?", (time.time(),))
+
+    def complete(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        return self._update_owned(job_id, worker_id, "status = ?, result = ?, error = NULL",
+                                  (QueueStatus.COMPLETED.value, json.dumps(result)))
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry_after: Optional[float] = None) -> bool:
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job.attempts >= job.max_attempts:
+            return self._update_owned(job_id, worker_id, "status = ?, error = ?",
+                                      (QueueStatus.FAILED.value, error))
+        delay = retry_after if retry_after is not None else RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+        print(f"🔁 Retrying job {job_id} in {delay:.0f}s (attempt {job.attempts}/{job.max_attempts})")
+        return self._update_owned(job_id, worker_id, "status = ?, error = ?, worker_id = NULL, available_at = ?",
+                                  (QueueStatus.QUEUED.value, error, time.time() + delay))
+
+    def get(self, job_id: str) -> Optional[QueuedJob]:
+        row = self._connection().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        counts = {status.value: 0 for status in QueueStatus}
+        counts.update({row["status"]: row["count"] for row in rows})
+        return counts
+
+    def pending(self, client_key: str) -> int:
+        row = self._connection().execute(
+            "SELECT COUNT(*) AS count FROM jobs WHERE status IN (?, ?) "
+            "AND json_extract(payload, '$.client.key') = ?",
+            (QueueStatus.QUEUED.value, QueueStatus.RUNNING.value, client_key)
+        ).fetchone()
+        return row["count"]
+
+BROKER_BACKENDS: Dict[str, Callable[[str], JobBroker]] = {
+    "sqlite": SQLiteBroker,
+}
+
+def register_broker(scheme: str, factory: Callable[[str], JobBroker]) -> None:
+    BROKER_BACKENDS[scheme] = factory
+
+def broker_from_url(url: str) -> JobBroker:
+    scheme, sep, location = url.partition("://")
+    if not sep or scheme not in BROKER_BACKENDS:
+        raise ValueError(f"Unsupported render broker: {url} (known: {', '.join(BROKER_BACKENDS)})")
+    return BROKER_BACKENDS[scheme](location)
+
+def broker_from_env() -> Optional[JobBroker]:
+    """
+    RENDER_BROKER selects the broker, e.g. sqlite:///shared/render_jobs.db.
+    Unset means jobs render inside the API process.
+    """
+    if not BROKER_URL:
+        return None
+    broker = broker_from_url(BROKER_URL)
+    print(f"📮 Render broker: {BROKER_URL}")
+    return broker
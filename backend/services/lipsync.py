@@ -0,0 +1,181 @@
+import bisect
+import json
+import re
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+class Viseme(Enum):
+    REST = "rest"
+    MBP = "mbp"
+    FV = "fv"
+    TH = "th"
+    L = "l"
+    WQ = "wq"
+    O = "o"
+    E = "e"
+    AI = "ai"
+    CDG = "cdg"
+
+# (openness, spread): openness 0..1, spread -1 (rounded lips) .. 1 (wide lips)
+VISEME_SHAPES: Dict[Viseme, Tuple[float, float]] = {
+    Viseme.REST: (0.0, 0.0),
+    Viseme.MBP: (0.0, 0.0),
+    Viseme.FV: (0.15, 0.1),
+    Viseme.TH: (0.2, 0.05),
+    Viseme.L: (0.35, 0.0),
+    Viseme.WQ: (0.3, -0.8),
+    Viseme.O: (0.6, -0.5),
+    Viseme.E: (0.4, 0.7),
+    Viseme.AI: (0.9, 0.2),
+    Viseme.CDG: (0.3, 0.3),
+}
+
+DIGRAPH_VISEMES = {
+    'th': Viseme.TH,
+    'sh': Viseme.CDG,
+    'ch': Viseme.CDG,
+    'ph': Viseme.FV,
+    'oo': Viseme.WQ,
+    'ou': Viseme.WQ,
+    'ow': Viseme.O,
+    'ee': Viseme.E,
+    'ea': Viseme.E,
+    'ai': Viseme.AI,
+    'ay': Viseme.AI,
+}
+
+LETTER_VISEMES = {
+    'a': Viseme.AI, 'i': Viseme.AI,
+    'e': Viseme.E, 'y': Viseme.E,
+    'o': Viseme.O,
+    'u': Viseme.WQ, 'w': Viseme.WQ, 'q': Viseme.WQ,
+    'm': Viseme.MBP, 'b': Viseme.MBP, 'p': Viseme.MBP,
+    'f': Viseme.FV, 'v': Viseme.FV,
+    'l': Viseme.L,
+}
+
+VOWEL_VISEMES = {Viseme.AI, Viseme.E, Viseme.O, Viseme.WQ}
+
+COARTICULATION_KERNEL = np.array([0.25, 0.5, 0.25], dtype=np.float32)
+
+@dataclass
+class VisemeEvent:
+    start: float
+    end: float
+    viseme: Viseme
+
+@dataclass
+class VisemeTrack:
+    events: List[VisemeEvent] = field(default_factory=list)
+    word_starts: List[float] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return self.events[-1].end if self.events else 0.0
+
+    def viseme_at(self, t: float) -> Viseme:
+        starts = [e.start for e in self.events]
+        idx = bisect.bisect_right(starts, t) - 1
+        if idx >= 0 and t < self.events[idx].end:
+            return self.events[idx].viseme
+        return Viseme.REST
+
+    def frame_features(self, fps: int, total_frames: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Sample the timeline at each frame centre and return per-frame
+        (openness, spread, onsets) arrays; frames after the speech are at rest.
+        """
+        track_frames = max(int(np.ceil(self.duration * fps)), 1)
+        openness = np.zeros(track_frames, dtype=np.float32)
+        spread = np.zeros(track_frames, dtype=np.float32)
+        onsets = np.zeros(track_frames, dtype=np.float32)
+
+        starts = [e.start for e in self.events]
+        for i in range(track_frames):
+            t = (i + 0.5) / fps
+            idx = bisect.bisect_right(starts, t) - 1
+            if idx >= 0 and t < self.events[idx].end:
+                openness[i], spread[i] = VISEME_SHAPES[self.events[idx].viseme]
+
+        for start in self.word_starts:
+            idx = int(start * fps)
+            if idx < track_frames:
+                onsets[idx] = 1.0
+        for i in range(1, track_frames):
+            onsets[i] = max(onsets[i], onsets[i - 1] * 0.6)
+
+        openness = np.convolve(openness, COARTICULATION_KERNEL, mode='same')
+        spread = np.convolve(spread, COARTICULATION_KERNEL, mode='same')
+
+        rest = max(total_frames - track_frames, 0)
+        return tuple(np.pad(values[:total_frames], (0, rest)) for values in (openness, spread, onsets))
+
+    def to_list(self) -> List[List]:
+        return [[round(e.start, 3), round(e.end, 3), e.viseme.value] for e in self.events]
+
+def word_to_visemes(word: str) -> List[Viseme]:
+    letters = re.sub(r'[^a-z]', '', word.lower())
+    visemes = []
+    i = 0
+    while i < len(letters):
+        digraph = letters[i:i + 2]
+        if digraph in DIGRAPH_VISEMES:
+            viseme = DIGRAPH_VISEMES[digraph]
+            i += 2
+        else:
+            viseme = LETTER_VISEMES.get(letters[i], Viseme.CDG)
+            i += 1
+        if not visemes or visemes[-1] != viseme:
+            visemes.append(viseme)
+    return visemes
+
+def build_viseme_track(word_boundaries: List[Dict]) -> VisemeTrack:
+    events: List[VisemeEvent] = []
+    word_starts: List[float] = []
+
+    for word in word_boundaries:
+        start, end = float(word['start']), float(word['end'])
+        if end <= start:
+            continue
+        word_starts.append(start)
+
+        visemes = word_to_visemes(word['text']) or [Viseme.CDG]
+        weights = [2.0 if v in VOWEL_VISEMES else 1.0 for v in visemes]
+        unit = (end - start) / sum(weights)
+
+        t = start
+        for viseme, weight in zip(visemes, weights):
+            seg_end = t + unit * weight
+            if events and events[-1].viseme == viseme and abs(events[-1].end - t) < 1e-6:
+                events[-1].end = seg_end
+            else:
+                events.append(VisemeEvent(t, seg_end, viseme))
+            t = seg_end
+
+    return VisemeTrack(events=events, word_starts=word_starts)
+
+def word_boundaries_path(audio_path: str) -> Path:
+    return Path(audio_path).with_suffix('.words.json')
+
+def save_word_boundaries(audio_path: str, word_boundaries: List[Dict]) -> None:
+    word_boundaries_path(audio_path).write_text(json.dumps(word_boundaries))
+
+def load_word_boundaries(audio_path: str) -> Optional[List[Dict]]:
+    path = word_boundaries_path(audio_path)
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Could not read word boundaries {path}: {e}")
+        return None
+
+def load_viseme_track(audio_path: str) -> Optional[VisemeTrack]:
+    word_boundaries = load_word_boundaries(audio_path)
+    if not word_boundaries:
+        return None
+    return build_viseme_track(word_boundaries)
@@ -5,15 +5,14 @@ def generate_ai_video_free(prompt: str, output_path: str) -> bool:
     Generate AI video using free alternatives.
     Uses Pollinations AI for images + MoviePy for animation.
     """
+    output_path = Path(output_path)
+    image_path = output_path.parent / f"{output_path.stem}_temp.jpg"
+    
     try:
         from services.ai_image_generator import generate_ai_image
         
-        output_path = Path(output_path)
-        
         print(f"🎬 Generating AI video (free) for: {prompt[:50]}...")
         
-        image_path = output_path.parent / f"{output_path.stem}_temp.jpg"
-        
         success = generate_ai_image(prompt, str(image_path))
         
         if success:
@@ -27,6 +26,34 @@ def generate_ai_video_free(prompt: str, output_path: str) -> bool:
     except Exception as e:
         print(f"❌ Error generating AI video: {e}")
         return False
+    finally:
+        image_path.unlink(missing_ok=True)
+
+
+def ken_burns_warp(w: int, h: int, t: float, duration: float = 5.0):
+    """
+    Zoom in and out with a circular pan: the frame at time t is the image
+    scaled by up to 1.4x and cropped at the pan offset (black outside it).
+    """
+    import cv2
+    import numpy as np
+    from services.effects import Warp
+    
+    progress = t / duration
+    
+    zoom = 1 + 0.4 * np.sin(progress * np.pi)
+    
+    new_w = int(w * zoom)
+    new_h = int(h * zoom)
+    
+    pan_x = int((new_w - w) * (0.3 + 0.4 * np.sin(progress * 2 * np.pi)))
+    pan_y = int((new_h - h) * (0.3 + 0.4 * np.cos(progress * 2 * np.pi)))
+    
+    # Resize-then-crop as one resample: scale about pixel centres, then shift by the pan
+    sx, sy = new_w / w, new_h / h
+    return Warp(np.float32([[sx, 0, 0.5 * sx - 0.5 - pan_x],
+                            [0, sy, 0.5 * sy - 0.5 - pan_y]]),
+                border=cv2.BORDER_CONSTANT)
 
 
 def create_animated_video_from_image(image_path: str, output_path: str) -> bool:
@@ -35,41 +62,25 @@ def create_animated_video_from_image(image_path: str, output_path: str) -> bool:
     This is a free alternative to paid AI video generation.
     """
     try:
-        from moviepy.editor import ImageClip
         import numpy as np
         from PIL import Image
+        from services.effects import EffectGraph, renderer
+        from services.frame_store import FrameStore
         
         print("   Creating animated video from image...")
         
-        image = ImageClip(image_path, duration=5)
-        w, h = image.size
-        
-        def dynamic_animation(get_frame, t):
-            frame = get_frame(t)
-            
-            progress = t / 5
-            
-            zoom = 1 + 0.4 * np.sin(progress * np.pi)
-            
-            new_w = int(w * zoom)
-            new_h = int(h * zoom)
-            
-            img = Image.fromarray(frame)
-            img = img.resize((new_w, new_h), Image.LANCZOS)
-            
-            pan_x = int((new_w - w) * (0.3 + 0.4 * np.sin(progress * 2 * np.pi)))
-            pan_y = int((new_h - h) * (0.3 + 0.4 * np.cos(progress * 2 * np.pi)))
-            
-            img = img.crop((pan_x, pan_y, pan_x + w, pan_y + h))
-            
-            return np.array(img)
-        
-        frames = [dynamic_animation(image.get_frame, t / 30) for t in range(0, 150)]
+        image = np.array(Image.open(image_path).convert('RGB'))
+        h, w = image.shape[:2]
         
         from moviepy.video.io.ImageSequenceClip import ImageSequenceClip
-        video = ImageSequenceClip(frames, fps=30)
         
-        video.write_videofile(output_path, codec='libx264', fps=30, audio=False, verbose=False)
+        # Each frame is one warp written straight into its store slot
+        with FrameStore.create(150, h, w) as frames:
+            for t in range(0, 150):
+                renderer.render(EffectGraph([ken_burns_warp(w, h, t / 30)]), image, dst=frames.reserve())
+            
+            video = ImageSequenceClip(list(frames), fps=30)
+            video.write_videofile(output_path, codec='libx264', fps=30, audio=False, verbose=False)
         
         print("   ✅ Animation complete!")
         return True
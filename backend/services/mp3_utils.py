@@ -0,0 +1,75 @@
+from typing import Iterator, Optional, Tuple
+
+BITRATES_MPEG1_L3 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+BITRATES_MPEG2_L3 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000],
+}
+
+def _skip_id3(data: bytes) -> int:
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = ((data[6] & 0x7F) << 21) | ((data[7] & 0x7F) << 14) | ((data[8] & 0x7F) << 7) | (data[9] & 0x7F)
+        return 10 + size
+    return 0
+
+def _parse_header(data: bytes, pos: int) -> Optional[Tuple[int, int, int]]:
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+
+    version = (data[pos + 1] >> 3) & 0x03
+    layer = (data[pos + 1] >> 1) & 0x03
+    bitrate_idx = (data[pos + 2] >> 4) & 0x0F
+    sample_idx = (data[pos + 2] >> 2) & 0x03
+    padding = (data[pos + 2] >> 1) & 0x01
+
+    if version == 1 or layer != 1 or bitrate_idx in (0, 15) or sample_idx == 3:
+        return None
+
+    sample_rate = SAMPLE_RATES[version][sample_idx]
+    if version == 3:
+        samples = 1152
+        bitrate = BITRATES_MPEG1_L3[bitrate_idx] * 1000
+    else:
+        samples = 576
+        bitrate = BITRATES_MPEG2_L3[bitrate_idx] * 1000
+
+    frame_len = samples // 8 * bitrate // sample_rate + padding
+    return frame_len, samples, sample_rate
+
+def iter_frames(data: bytes) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Yield (offset, length, samples, sample_rate) for each MPEG Layer III frame,
+    skipping a leading ID3v2 tag and any Xing/Info header frame.
+    """
+    pos = _skip_id3(data)
+    first = True
+    while pos < len(data):
+        header = _parse_header(data, pos)
+        if header is None:
+            pos += 1
+            continue
+        frame_len, samples, sample_rate = header
+        if frame_len <= 0 or pos + frame_len > len(data):
+            break
+        side_info = data[pos:pos + min(frame_len, 48)]
+        if first and (b"Xing" in side_info or b"Info" in side_info):
+            first = False
+            pos += frame_len
+            continue
+        first = False
+        yield pos, frame_len, samples, sample_rate
+        pos += frame_len
+
+def mp3_audio_frames(data: bytes) -> Tuple[bytes, float]:
+    """
+    Return the raw audio frames of an MP3 (metadata stripped) and their exact duration,
+    so chunks from the same encoder can be concatenated gaplessly.
+    """
+    chunks = []
+    duration = 0.0
+    for offset, length, samples, sample_rate in iter_frames(data):
+        chunks.append(data[offset:offset + length])
+        duration += samples / sample_rate
+    return b"".join(chunks), duration
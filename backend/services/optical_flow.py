@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from enum import Enum
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from services.frame_buffers import frame_buffers
+from services.telemetry import count_cache
+
+FLOW_MAX_SIDE = int(os.getenv("OPTICAL_FLOW_MAX_SIDE", "480"))
+FLOW_CACHE_ENTRIES = int(os.getenv("OPTICAL_FLOW_CACHE_ENTRIES", "32"))
+# Mean absolute grey-level difference (0-255) below which two inputs count as the same picture
+STATIC_THRESHOLD = 0.5
+# Mean residual after warping with the previous flow below which that flow is reused
+REUSE_THRESHOLD = 1.0
+
+class FlowMethod(Enum):
+    FARNEBACK = "farneback"
+    DIS = "dis"
+
+DEFAULT_FLOW_METHOD = FlowMethod(os.getenv("OPTICAL_FLOW_METHOD", FlowMethod.FARNEBACK.value))
+
+class FlowEstimator:
+    """
+    Dense optical flow for the render loops. Flow is computed on greyscale
+    copies downscaled so the long side is at most max_side, then upsampled and
+    rescaled to the frame size. Before computing, each pair is checked against
+    three cheaper answers: near-identical inputs give zero flow, a pair seen
+    before (by content hash of the downscaled inputs) comes from an LRU cache,
+    and when the previous pair's flow still explains the new pair (mean residual
+    below REUSE_THRESHOLD) it is carried forward as-is.
+    """
+
+    def __init__(self, max_side: int = FLOW_MAX_SIDE, cache_entries: int = FLOW_CACHE_ENTRIES):
+        self.max_side = max_side
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._last: Optional[Tuple[FlowMethod, np.ndarray]] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats: Dict[str, int] = {"static": 0, "cached": 0, "extrapolated": 0, "computed": 0}
+
+    def downscale(self, frame: np.ndarray, role: str = "flow") -> np.ndarray:
+        """
+        Greyscale copy with the long side at most max_side, in a pooled buffer.
+        """
+        h, w = frame.shape[:2]
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(
+            frame, cv2.COLOR_RGB2GRAY, dst=frame_buffers.get(f"{role}_gray", (h, w)))
+        scale = min(1.0, self.max_side / max(h, w))
+        if scale == 1.0:
+            return gray
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return cv2.resize(gray, size, dst=frame_buffers.get(f"{role}_small", (size[1], size[0])),
+                          interpolation=cv2.INTER_AREA)
+
+    def _dis(self) -> "cv2.DISOpticalFlow":
+        dis = getattr(self._local, "dis", None)
+        if dis is None:
+            dis = self._local.dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_FAST)
+        return dis
+
+    def compute(self, prev_gray: np.ndarray, curr_gray: np.ndarray, method: FlowMethod) -> np.ndarray:
+        """
+        Uncached flow between two greyscale images at their own resolution.
+        """
+        if method == FlowMethod.DIS:
+            return self._dis().calc(prev_gray, curr_gray, None)
+        return cv2.calcOpticalFlowFarneback(
+            prev_gray, curr_gray, None,
+            pyr_scale=0.5, levels=3, winsize=15,
+            iterations=3, poly_n=5, poly_sigma=1.2,
+            flags=0
+        )
+
+    def _reusable(self, last: Tuple[FlowMethod, np.ndarray], method: FlowMethod,
+                  prev_small: np.ndarray, curr_small: np.ndarray) -> bool:
+        last_method, last_flow = last
+        if last_method != method or last_flow.shape[:2] != prev_small.shape:
+            return False
+        h, w = prev_small.shape
+        mapping = frame_buffers.get("flow_reuse_map", (h, w, 2), np.float32)
+        np.copyto(mapping, last_flow)
+        mapping[:, :, 0] += np.arange(w, dtype=np.float32)
+        mapping[:, :, 1] += np.arange(h, dtype=np.float32)[:, np.newaxis]
+        # prev(x) ~ curr(x + flow(x)): sampling the second image along the flow should give the first
+        predicted = cv2.remap(curr_small, mapping, None, cv2.INTER_LINEAR,
+                              dst=frame_buffers.get("flow_reuse_warp", (h, w)), borderMode=cv2.BORDER_REPLICATE)
+        residual = cv2.norm(predicted, prev_small, cv2.NORM_L1) / prev_small.size
+        return residual < REUSE_THRESHOLD
+
+    def _small_flow(self, prev_small: np.ndarray, curr_small: np.ndarray,
+                    method: FlowMethod) -> Tuple[Optional[np.ndarray], str]:
+        difference = cv2.norm(prev_small, curr_small, cv2.NORM_L1) / prev_small.size
+        if difference < STATIC_THRESHOLD:
+            with self._lock:
+                self.stats["static"] += 1
+            return None, "static"
+
+        key = (method, prev_small.shape,
+               hashlib.blake2b(prev_small.tobytes(), digest_size=16).digest(),
+               hashlib.blake2b(curr_small.tobytes(), digest_size=16).digest())
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["cached"] += 1
+            last = self._last
+        if cached is not None:
+            return cached, "cached"
+
+        if last is not None and self._reusable(last, method, prev_small, curr_small):
+            flow, outcome = last[1], "extrapolated"
+        else:
+            flow, outcome = self.compute(prev_small, curr_small, method), "computed"
+
+        with self._lock:
+            self._cache[key] = flow
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+            self._last = (method, flow)
+            self.stats[outcome] += 1
+        return flow, outcome
+
+    def flow(self, prev_frame: np.ndarray, curr_frame: np.ndarray,
+             method: Optional[FlowMethod] = None, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Flow from prev_frame to curr_frame at frame resolution, in pixels.
+        """
+        method = method or DEFAULT_FLOW_METHOD
+        h, w = prev_frame.shape[:2]
+        prev_small = self.downscale(prev_frame, "flow_prev")
+        curr_small = self.downscale(curr_frame, "flow_curr")
+
+        small, outcome = self._small_flow(prev_small, curr_small, method)
+        count_cache("optical_flow", outcome != "computed")
+
+        if dst is None:
+            dst = np.empty((h, w, 2), dtype=np.float32)
+        if small is None:
+            dst.fill(0)
+            return dst
+
+        sh, sw = small.shape[:2]
+        if (sh, sw) == (h, w):
+            np.copyto(dst, small)
+            return dst
+        cv2.resize(small, (w, h), dst=dst, interpolation=cv2.INTER_LINEAR)
+        dst[:, :, 0] *= w / sw
+        dst[:, :, 1] *= h / sh
+        return dst
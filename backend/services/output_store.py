@@ -0,0 +1,227 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Set
+
+OUTPUT_DIR = Path("/tmp/output")
+
+OUTPUT_QUOTA_BYTES = int(float(os.getenv("OUTPUT_QUOTA_MB", "5120")) * 1024 * 1024)
+VIDEO_TTL_SECONDS = float(os.getenv("OUTPUT_VIDEO_TTL_HOURS", "24")) * 3600
+ORPHAN_TTL_SECONDS = 6 * 3600.0
+SWEEP_INTERVAL_SECONDS = 300.0
+
+VIDEO_SUFFIX = "_video.mp4"
+
+def _size(path: Path) -> int:
+    try:
+        if path.is_dir():
+            return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+class OutputStore:
+    """
+    Owns the lifecycle of everything written to OUTPUT_DIR. Jobs register their
+    intermediates with track() and are reference counted: the job itself, a
+    scheduled final render and a batch sharing its assets each hold a
+    reference, and the intermediates are deleted when the last one is released,
+    whether the job succeeded or not. Published videos ("<job>_video.mp4") are
+    expired by TTL and then least-recently-served first until the directory fits
+    OUTPUT_QUOTA_BYTES. Anything else left by a crashed process is removed once
+    it is older than ORPHAN_TTL_SECONDS.
+    """
+
+    def __init__(self, root: Path = OUTPUT_DIR, quota_bytes: int = OUTPUT_QUOTA_BYTES,
+                 video_ttl: float = VIDEO_TTL_SECONDS, orphan_ttl: float = ORPHAN_TTL_SECONDS,
+                 name: str = "Output"):
+        self.root = Path(root)
+        self.name = name
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self.video_ttl = video_ttl
+        self.orphan_ttl = orphan_ttl
+        self._artifacts: Dict[str, Set[Path]] = {}
+        self._refs: Dict[str, int] = {}
+        self._last_access: Dict[str, float] = {}
+        self._scratch: Set[Path] = set()
+        self._lock = threading.Lock()
+        self.deleted_bytes = 0
+
+    def track(self, job_id: str, *paths) -> None:
+        with self._lock:
+            self._artifacts.setdefault(job_id, set()).update(Path(p) for p in paths)
+
+    def retain(self, job_id: str) -> None:
+        with self._lock:
+            self._refs[job_id] = self._refs.get(job_id, 0) + 1
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            refs = self._refs.get(job_id, 1) - 1
+            if refs > 0:
+                self._refs[job_id] = refs
+                return
+            self._refs.pop(job_id, None)
+            paths = self._artifacts.pop(job_id, set())
+
+        freed = 0
+        for path in paths:
+            if path.exists():
+                freed += _size(path)
+                _remove(path)
+        self.deleted_bytes += freed
+        if freed:
+            print(f"🧹 Removed {len(paths)} intermediates of job {job_id} ({freed / 1e6:.1f} MB)")
+
+    @contextmanager
+    def job(self, job_id: str):
+        self.retain(job_id)
+        try:
+            yield
+        finally:
+            self.release(job_id)
+
+    @contextmanager
+    def scratch(self, prefix: str, suffix: str = ""):
+        """
+        A temp path in OUTPUT_DIR that is deleted when the block exits.
+        """
+        path = self.root / f"{prefix}{uuid.uuid4().hex}{suffix}"
+        with self._lock:
+            self._scratch.add(path)
+        try:
+            yield path
+        finally:
+            _remove(path)
+            with self._lock:
+                self._scratch.discard(path)
+
+    def touch(self, path: Path) -> None:
+        with self._lock:
+            self._last_access[Path(path).name] = time.time()
+
+    def _active_jobs(self) -> Set[str]:
+        with self._lock:
+            return set(self._refs)
+
+    def _protected(self) -> Set[Path]:
+        with self._lock:
+            protected = set(self._scratch)
+            for paths in self._artifacts.values():
+                protected.update(paths)
+            return protected
+
+    def _entries(self) -> List[Path]:
+        try:
+            return list(self.root.iterdir())
+        except FileNotFoundError:
+            return []
+
+    def _is_active(self, path: Path, active_jobs: Set[str]) -> bool:
+        return any(path.name.startswith(job_id) for job_id in active_jobs)
+
+    def sweep(self) -> Dict:
+        now = time.time()
+        active_jobs = self._active_jobs()
+        protected = self._protected()
+        removed_orphans = removed_videos = 0
+        videos = []
+        used = 0
+
+        for path in self._entries():
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            size = _size(path)
+
+            if path.name.endswith(VIDEO_SUFFIX):
+                last_used = max(mtime, self._last_access.get(path.name, 0.0))
+                if now - last_used > self.video_ttl and not self._is_active(path, active_jobs):
+                    _remove(path)
+                    self.deleted_bytes += size
+                    removed_videos += 1
+                    continue
+                videos.append((last_used, path, size))
+                used += size
+                continue
+
+            if path in protected or self._is_active(path, active_jobs):
+                used += size
+                continue
+            if now - mtime > self.orphan_ttl:
+                _remove(path)
+                self.deleted_bytes += size
+                removed_orphans += 1
+                continue
+            used += size
+
+        for last_used, path, size in sorted(videos, key=lambda video: video[0]):
+            if used <= self.quota_bytes:
+                break
+            if self._is_active(path, active_jobs):
+                continue
+            _remove(path)
+            self.deleted_bytes += size
+            used -= size
+            removed_videos += 1
+
+        with self._lock:
+            existing = {path.name for _, path, _ in videos if path.exists()}
+            self._last_access = {name: t for name, t in self._last_access.items() if name in existing}
+
+        if removed_orphans or removed_videos:
+            print(f"🧹 {self.name} sweep: removed {removed_videos} videos and {removed_orphans} orphaned files, "
+                  f"{used / 1e6:.0f} MB used of {self.quota_bytes / 1e6:.0f} MB")
+        return {"removed_videos": removed_videos, "removed_orphans": removed_orphans, "bytes_used": used}
+
+    def usage(self) -> Dict:
+        videos = intermediates = 0
+        video_bytes = intermediate_bytes = 0
+        for path in self._entries():
+            size = _size(path)
+            if path.name.endswith(VIDEO_SUFFIX):
+                videos += 1
+                video_bytes += size
+            else:
+                intermediates += 1
+                intermediate_bytes += size
+        try:
+            disk = shutil.disk_usage(self.root)
+            disk_free = disk.free
+        except OSError:
+            disk_free = None
+        return {
+            "root": str(self.root),
+            "bytes_used": video_bytes + intermediate_bytes,
+            "quota_bytes": self.quota_bytes,
+            "videos": videos,
+            "video_bytes": video_bytes,
+            "intermediates": intermediates,
+            "intermediate_bytes": intermediate_bytes,
+            "active_jobs": len(self._active_jobs()),
+            "deleted_bytes": self.deleted_bytes,
+            "disk_free_bytes": disk_free,
+        }
+
+    async def run_sweeper(self, interval: float = SWEEP_INTERVAL_SECONDS) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"⚠️  {self.name} sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+output_store = OutputStore()
@@ -3,11 +3,14 @@ import httpx
 from typing import Dict, List, Optional
 import json
 
+from services.telemetry import count_upstream, traced
+
 class PerplexityService:
     def __init__(self):
         self.api_key = os.getenv("PERPLEXITY_API_KEY", "")
         self.base_url = "https://api.perplexity.ai"
         
+    @traced("perplexity.enhance")
     async def enhance_video_prompt(self, prompt: str, mode: str = "physics") -> str:
         """
         Enhance video generation prompt using Perplexity AI
@@ -46,6 +49,7 @@ class PerplexityService:
                     headers=headers,
                     json=payload
                 )
+                count_upstream("perplexity", response.status_code)
                 response.raise_for_status()
                 result = response.json()
                 
@@ -142,6 +146,7 @@ Return as JSON with keys: physics_terms, lighting, camera, atmosphere. Keep each
                     headers=headers,
                     json=payload
                 )
+                count_upstream("perplexity", response.status_code)
                 response.raise_for_status()
                 result = response.json()
                 
@@ -11,6 +11,17 @@ from enum import Enum
 import requests
 import urllib.parse
 from services.ai_image_generator import get_cached_image, cache_image
+from services.cancellation import check_cancelled
+from services.effects import Blur, Draw, EffectGraph, Grade, renderer
+from services.frame_buffers import frame_buffers, place
+from services.frame_store import FrameStore
+from services.profiling import frame_clock
+from services.telemetry import count_upstream, traced
+
+KEYFRAME_SIZE = (1080, 1920)
+COLOR_GRADING = Grade.gain([1.05, 1.02, 0.95])
+# 0.1 of the (255, 255, 200) flare colour
+LENS_FLARE_LIGHT = (25.5, 25.5, 20.0, 0.0)
 
 class PhysicsType(Enum):
     GRAVITY = "gravity"
@@ -248,16 +259,24 @@ class Particle:
         x, y = int(self.x), int(self.y)
         radius = int(self.size)
 
-        overlay = frame.copy()
+        # Only the particle's bounding box changes, so blend that instead of a full-frame overlay
+        h, w = frame.shape[:2]
+        x1, y1 = max(0, x - radius - 1), max(0, y - radius - 1)
+        x2, y2 = min(w, x + radius + 2), min(h, y + radius + 2)
+        if x1 >= x2 or y1 >= y2:
+            return frame
+
+        region = frame[y1:y2, x1:x2]
+        overlay = region.copy()
 
         color = [int(c * alpha) for c in self.color]
 
-        cv2.circle(overlay, (x, y), radius, color, -1)
+        cv2.circle(overlay, (x - x1, y - y1), radius, color, -1)
 
         highlight = [min(255, c + 50) for c in color]
-        cv2.circle(overlay, (x - radius//3, y - radius//3), radius//3, highlight, -1)
+        cv2.circle(overlay, (x - radius//3 - x1, y - radius//3 - y1), radius//3, highlight, -1)
 
-        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
+        cv2.addWeighted(overlay, alpha, region, 1 - alpha, 0, region)
 
         return frame
 
@@ -282,9 +301,11 @@ class PhysicsConfig:
     simulation_steps: int = 2
 
 class PhysicsVideoGenerator:
-    def __init__(self):
-        self.width = 1080
-        self.height = 1920
+    def __init__(self, width: int = 1080, height: int = 1920, post_processing: bool = True):
+        self.width = width
+        self.height = height
+        self.post_processing = post_processing
+        self.renderer = renderer
         self.particles: List[Particle] = []
         self.obstacles: List[Dict] = []
 
@@ -340,7 +361,7 @@ class PhysicsVideoGenerator:
             keyframe_path = Path("/tmp/output") / f"keyframe_{random.randint(10000, 99999)}_{i}.png"
             keyframe_path.parent.mkdir(parents=True, exist_ok=True)
 
-            success = self._fetch_image_with_retry(kf_prompt, str(keyframe_path), self.width, self.height)
+            success = self._fetch_image_with_retry(kf_prompt, str(keyframe_path), *KEYFRAME_SIZE)
 
             if success:
                 keyframe_paths.append(str(keyframe_path))
@@ -379,6 +400,7 @@ class PhysicsVideoGenerator:
 
         return keyframe_prompts
 
+    @traced("image.fetch")
     def _fetch_image_with_retry(self, prompt: str, output_path: str, width: int, height: int, max_retries: int = 5) -> bool:
         try:
             cleaned_prompt = prompt.replace('\n', ' ').replace('\r', ' ')
@@ -401,6 +423,7 @@ class PhysicsVideoGenerator:
                 try:
                     print(f"📥 Attempt {attempt + 1}/{max_retries}: Fetching keyframe...")
                     response = requests.get(image_url, timeout=60)
+                    count_upstream("pollinations", response.status_code)
 
                     if response.status_code == 429:
                         retry_after = int(response.headers.get('Retry-After', base_delay * (2 ** attempt)))
@@ -437,7 +460,10 @@ class PhysicsVideoGenerator:
             return False
 
     def interpolate_frames(self, keyframe1: np.ndarray, keyframe2: np.ndarray, 
-                          num_intermediate: int) -> List[np.ndarray]:
+                          num_intermediate: int, out: Optional[FrameStore] = None) -> List[np.ndarray]:
+        """
+        With out, the blended frames are written straight into the store's slots.
+        """
         print(f"🔄 Interpolating {num_intermediate} frames between keyframes...")
 
         flow = cv2.calcOpticalFlowFarneback(
@@ -448,20 +474,25 @@ class PhysicsVideoGenerator:
 
         interpolated = []
 
+        h, w = keyframe1.shape[:2]
+        x_coords = np.arange(w, dtype=np.float32)
+        y_coords = np.arange(h, dtype=np.float32)[:, np.newaxis]
+        flow_map = frame_buffers.get("interpolation_map", (h, w, 2), np.float32)
+        warped1 = frame_buffers.like("interpolation_warp1", keyframe1)
+        warped2 = frame_buffers.like("interpolation_warp2", keyframe2)
+
         for i in range(1, num_intermediate + 1):
             alpha = i / (num_intermediate + 1)
 
-            h, w = keyframe1.shape[:2]
-            flow_map = np.zeros((h, w, 2), dtype=np.float32)
+            np.multiply(flow, alpha, out=flow_map)
+            flow_map[:, :, 0] += x_coords
+            flow_map[:, :, 1] += y_coords
 
-            y_coords, x_coords = np.mgrid[0:h, 0:w]
-            flow_map[:, :, 0] = x_coords + flow[:, :, 0] * alpha
-            flow_map[:, :, 1] = y_coords + flow[:, :, 1] * alpha
+            cv2.remap(keyframe1, flow_map, None, cv2.INTER_LINEAR, dst=warped1, borderMode=cv2.BORDER_REFLECT)
+            cv2.remap(keyframe2, flow_map, None, cv2.INTER_LINEAR, dst=warped2, borderMode=cv2.BORDER_REFLECT)
 
-            warped1 = cv2.remap(keyframe1, flow_map, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
-            warped2 = cv2.remap(keyframe2, flow_map, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
-
-            blended = cv2.addWeighted(warped1, 1 - alpha, warped2, alpha, 0)
+            dst = out.reserve() if out is not None else None
+            blended = cv2.addWeighted(warped1, 1 - alpha, warped2, alpha, 0, dst=dst)
 
             interpolated.append(blended)
 
@@ -503,60 +534,52 @@ class PhysicsVideoGenerator:
             frame = particle.draw(frame)
         return frame
 
-    def apply_post_processing(self, frame: np.ndarray, frame_num: int, total_frames: int) -> np.ndarray:
-        frame = self._apply_motion_blur(frame, frame_num, total_frames)
-        frame = self._apply_color_grading(frame)
-        frame = self._apply_lens_effects(frame)
-
-        return frame
-
-    def _apply_motion_blur(self, frame: np.ndarray, frame_num: int, total_frames: int) -> np.ndarray:
-        if frame_num % 3 != 0:
-            return frame
-
-        kernel_size = random.choice([3, 5, 7])
-        kernel = np.zeros((kernel_size, kernel_size))
-        kernel[int((kernel_size-1)/2), :] = np.ones(kernel_size) / kernel_size
-
-        blurred = cv2.filter2D(frame, -1, kernel)
-
-        return blurred
-
-    def _apply_color_grading(self, frame: np.ndarray) -> np.ndarray:
-        frame = frame.astype(np.float32)
-
-        frame[:, :, 0] = frame[:, :, 0] * 1.05
-        frame[:, :, 1] = frame[:, :, 1] * 1.02
-        frame[:, :, 2] = frame[:, :, 2] * 0.95
-
-        frame = np.clip(frame, 0, 255)
-        frame = frame.astype(np.uint8)
-
-        return frame
-
-    def _apply_lens_effects(self, frame: np.ndarray) -> np.ndarray:
-        h, w = frame.shape[:2]
+    def post_processing_graph(self, frame_shape: Tuple[int, ...], frame_num: int, total_frames: int) -> EffectGraph:
+        graph = EffectGraph()
+        if not self.post_processing:
+            return graph.add(COLOR_GRADING)
 
-        lens_flare = self._create_lens_flare(w, h)
+        if frame_num % 3 == 0:
+            graph.add(Blur.motion(random.choice([3, 5, 7])))
+        graph.add(COLOR_GRADING)
+        # frame * 0.9 + flare * 0.1: the flare is black outside its disc, so only the disc gets light added
+        graph.add(Grade.gain(0.9))
+        graph.add(self._lens_flare(frame_shape[1], frame_shape[0]))
 
-        frame = cv2.addWeighted(frame, 0.9, lens_flare, 0.1, 0)
+        return graph
 
-        return frame
-
-    def _create_lens_flare(self, width: int, height: int) -> np.ndarray:
-        flare = np.zeros((height, width, 3), dtype=np.uint8)
+    def apply_post_processing(self, frame: np.ndarray, frame_num: int, total_frames: int,
+                              dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        With dst the result is written there (dst may be frame itself).
+        """
+        return self.renderer.render(self.post_processing_graph(frame.shape, frame_num, total_frames), frame, dst)
 
+    def _lens_flare(self, width: int, height: int) -> Draw:
         center_x, center_y = width // 2, height // 3
 
+        # The flare discs share a centre, so only the largest shows; the unused
+        # opacity draws keep the random sequence unchanged
+        radius = 0
         for i in range(5):
-            radius = random.randint(20, 100)
-            alpha = random.randint(10, 50)
-
-            cv2.circle(flare, (center_x, center_y), radius, (255, 255, 200), -1)
-
-        return flare
-
-    def generate_physics_video(self, prompt: str, duration: float = 5.0, fps: int = 30) -> List[np.ndarray]:
+            radius = max(radius, random.randint(20, 100))
+            random.randint(10, 50)
+
+        def draw(frame: np.ndarray) -> None:
+            x1, y1 = max(0, center_x - radius), max(0, center_y - radius)
+            x2, y2 = min(width, center_x + radius + 1), min(height, center_y + radius + 1)
+            if x1 >= x2 or y1 >= y2:
+                return
+            roi = frame[y1:y2, x1:x2]
+            mask = frame_buffers.get("lens_flare_mask", roi.shape[:2])
+            mask.fill(0)
+            cv2.circle(mask, (center_x - x1, center_y - y1), radius, 255, -1)
+            cv2.add(roi, LENS_FLARE_LIGHT, dst=roi, mask=mask)
+
+        return Draw(draw)
+
+    @traced("frames.physics", count_frames=True)
+    def generate_physics_video(self, prompt: str, duration: float = 5.0, fps: int = 30) -> FrameStore:
         print(f"🎬 Generating physics-based video: {prompt[:100]}...")
 
         scene_data = self.parse_scene_description(prompt)
@@ -566,21 +589,28 @@ class PhysicsVideoGenerator:
 
         if not keyframe_paths:
             print("❌ No keyframes generated")
-            return []
+            return FrameStore.create(0, self.height, self.width)
 
         keyframes = []
-        for path in keyframe_paths:
-            img = Image.open(path)
-            img = img.resize((self.width, self.height), Image.Resampling.LANCZOS)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            keyframes.append(np.array(img))
+        try:
+            for path in keyframe_paths:
+                img = Image.open(path)
+                img = img.resize((self.width, self.height), Image.Resampling.LANCZOS)
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                keyframes.append(np.array(img))
+        finally:
+            for path in keyframe_paths:
+                Path(path).unlink(missing_ok=True)
 
         total_frames = int(duration * fps)
         frames_per_keyframe = total_frames // len(keyframes)
-        intermediate_frames = frames_per_keyframe - 1
+        intermediate_frames = max(0, frames_per_keyframe - 1)
 
-        all_frames = []
+        # Keyframes, interpolated frames and the post-processing pass all live in
+        # one preallocated store, which spills to disk for long or large videos
+        all_frames = FrameStore.create(len(keyframes) + (len(keyframes) - 1) * intermediate_frames,
+                                       self.height, self.width)
 
         for i in range(len(keyframes)):
             current_keyframe = keyframes[i]
@@ -588,30 +618,32 @@ class PhysicsVideoGenerator:
 
             if i < len(keyframes) - 1:
                 next_keyframe = keyframes[i + 1]
-                interpolated = self.interpolate_frames(current_keyframe, next_keyframe, intermediate_frames)
-                all_frames.extend(interpolated)
+                self.interpolate_frames(current_keyframe, next_keyframe, intermediate_frames, out=all_frames)
+        del keyframes
 
         if PhysicsType.FLUID in scene_data['physics_effects']:
             print(f"💧 Initializing fluid particles...")
             self.particles = self.initialize_fluid_particles(self.width // 2, self.height // 2, count=200)
 
+        tick = frame_clock("frames.physics")
         for frame_num in range(len(all_frames)):
+            check_cancelled()
             dt = 1.0 / fps
+            frame = all_frames[frame_num]
 
             if PhysicsType.FLUID in scene_data['physics_effects']:
                 if frame_num == int(total_frames * 0.3):
                     self.particles = self.initialize_fluid_particles(self.width // 2, self.height // 3, count=150)
 
                 self.update_particles(dt)
-                all_frames[frame_num] = self.render_particles(all_frames[frame_num])
+                place(self.render_particles(frame), frame)
 
-            all_frames[frame_num] = self.apply_post_processing(all_frames[frame_num], frame_num, total_frames)
+            # Post-processing runs in place in the frame's store slot
+            self.apply_post_processing(frame, frame_num, total_frames, dst=frame)
+            tick()
 
             if (frame_num + 1) % 10 == 0:
                 print(f"  Progress: {frame_num + 1}/{total_frames} frames")
 
-        for path in keyframe_paths:
-            Path(path).unlink(missing_ok=True)
-
         print(f"✅ Physics video generated: {len(all_frames)} frames")
         return all_frames
@@ -0,0 +1,207 @@
+import asyncio
+import contextvars
+import inspect
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from services.cancellation import check_cancelled
+from services.frame_buffers import frame_buffers
+from services.telemetry import count_cache, tracer
+
+def _release_buffers(func: Callable[..., Any], args: Sequence[Any]) -> Any:
+    # Worker threads are reused; a finished stage shouldn't leave its frame-sized
+    # scratch buffers pooled on the thread
+    try:
+        return func(*args)
+    finally:
+        frame_buffers.clear()
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[..., Any]
+    deps: List[str] = field(default_factory=list)
+    traced: bool = True
+
+@dataclass
+class StageTiming:
+    start: float
+    end: float
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+class StageGraph:
+    """
+    Small DAG executor for generation pipelines. Each stage receives the results
+    of its dependencies as positional arguments, in the order they were declared,
+    and starts as soon as those dependencies finish. Sync callables run in worker
+    threads so blocking network and rendering stages overlap.
+    """
+
+    def __init__(self, name: str = "pipeline"):
+        self.name = name
+        self.stages: Dict[str, Stage] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, StageTiming] = {}
+        self._origin: Optional[float] = None
+
+    def add(self, name: str, func: Callable[..., Any], deps: Sequence[str] = ()) -> "StageGraph":
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self.stages[name] = Stage(name, func, list(deps))
+        return self
+
+    def value(self, name: str, value: Any) -> "StageGraph":
+        self.add(name, lambda: value)
+        self.stages[name].traced = False
+        return self
+
+    def seed(self, results: Dict[str, Any], names: Sequence[str]) -> "StageGraph":
+        for name in names:
+            if name in results:
+                self.value(name, results[name])
+        return self
+
+    def _span(self, stage: Stage):
+        return tracer.span(stage.name, graph=self.name) if stage.traced else nullcontext()
+
+    async def _call(self, stage: Stage, args: List[Any]) -> Any:
+        if inspect.iscoroutinefunction(stage.func):
+            with self._span(stage):
+                return await stage.func(*args)
+
+        # Sync stages open their span in the worker thread, so profilers see the thread
+        def call():
+            with self._span(stage):
+                return _release_buffers(stage.func, args)
+
+        # Like asyncio.to_thread, but a cancelled stage waits for its thread to
+        # return, so a failed or timed-out graph only finishes once its work has
+        future = asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, call)
+        try:
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait({future})
+            raise
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, "asyncio.Task"]) -> Any:
+        args = [await tasks[dep] for dep in stage.deps]
+        check_cancelled()
+
+        start = time.perf_counter()
+        try:
+            result = await self._call(stage, args)
+        finally:
+            self.timings[stage.name] = StageTiming(start - self._origin, time.perf_counter() - self._origin)
+
+        self.results[stage.name] = result
+        return result
+
+    async def run(self) -> Dict[str, Any]:
+        self._origin = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.ensure_future(self._run_stage(stage, tasks))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            self.print_timings()
+
+        return self.results
+
+    def critical_path(self) -> List[str]:
+        finish: Dict[str, float] = {}
+        parent: Dict[str, Optional[str]] = {}
+        for name, stage in self.stages.items():
+            timing = self.timings.get(name)
+            duration = timing.duration if timing else 0.0
+            best = max(stage.deps, key=lambda d: finish[d], default=None)
+            finish[name] = (finish[best] if best else 0.0) + duration
+            parent[name] = best
+
+        if not finish:
+            return []
+        node = max(finish, key=finish.get)
+        path = []
+        while node is not None:
+            path.append(node)
+            node = parent[node]
+        return path[::-1]
+
+    def timing_summary(self) -> Dict[str, float]:
+        return {name: round(t.duration, 3) for name, t in self.timings.items()}
+
+    def print_timings(self) -> None:
+        if not self.timings:
+            return
+        total = max(t.end for t in self.timings.values())
+        busy = sum(t.duration for t in self.timings.values())
+        print(f"\n⏱️  {self.name} stage timings (wall {total:.2f}s, sum of stages {busy:.2f}s)")
+        for name, t in sorted(self.timings.items(), key=lambda item: item[1].start):
+            print(f"   {name:<14} {t.start:7.2f}s → {t.end:7.2f}s  ({t.duration:.2f}s)")
+        print(f"   critical path: {' → '.join(self.critical_path())}")
+
+class AssetMemo:
+    """
+    Single-flight memo shared by the pipelines of one job group. Stages wrapped
+    with share() run once per key and argument tuple; later callers await the
+    same future instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._futures: Dict[Any, asyncio.Future] = {}
+        self._cleanups: List[Callable[[], Any]] = []
+        self.hits = 0
+
+    def share(self, key: Any, func: Callable[..., Any]) -> Callable[..., Any]:
+        async def shared(*args):
+            memo_key = (key, *args)
+            future = self._futures.get(memo_key)
+            if future is None:
+                future = asyncio.ensure_future(self._call(func, args))
+                self._futures[memo_key] = future
+                count_cache("asset_memo", False)
+            else:
+                self.hits += 1
+                count_cache("asset_memo", True)
+            return await asyncio.shield(future)
+        return shared
+
+    async def _call(self, func: Callable[..., Any], args: Sequence[Any]) -> Any:
+        if inspect.iscoroutinefunction(func):
+            return await func(*args)
+        result = await asyncio.to_thread(_release_buffers, func, args)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def on_close(self, callback: Callable[[], Any]) -> None:
+        self._cleanups.append(callback)
+
+    def close(self) -> None:
+        for future in self._futures.values():
+            if not future.done():
+                future.cancel()
+        for callback in self._cleanups:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  Shared asset cleanup failed: {e}")
+        self._futures.clear()
+        self._cleanups.clear()
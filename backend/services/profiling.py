@@ -0,0 +1,359 @@
+import asyncio
+import hmac
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from services.telemetry import Span, tracer
+
+PROFILE_DIR = Path("/tmp/output")
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+# tracemalloc slows allocation-heavy Python code several times over; one frame is enough for per-line totals
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))
+MAX_KEPT_PROFILES = 20
+MAX_REQUESTED_JOBS = 200
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 30
+
+def admin_authorized(headers) -> bool:
+    token = os.getenv("ADMIN_TOKEN")
+    supplied = headers.get("x-admin-token")
+    return bool(token and supplied and hmac.compare_digest(token, supplied))
+
+def profiling_requested(headers) -> Optional[str]:
+    """
+    X-Profile on a generation request, honoured for callers with the admin token:
+    "1" for CPU samples plus allocation tracking, "cpu" for samples only.
+    Returns the mode or None.
+    """
+    value = headers.get("x-profile", "").lower()
+    if not value or value in ("0", "false", "no") or not admin_authorized(headers):
+        return None
+    return "cpu" if value == "cpu" else "full"
+
+def profile_path(job_id: str) -> Path:
+    return PROFILE_DIR / f"{job_id}_profile.json"
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+class ProfileSession:
+    """
+    One profiled phase of a job. The sampler records the stacks of threads that
+    are currently inside one of the job's spans; per-frame clocks and
+    tracemalloc snapshots are kept alongside.
+    """
+
+    def __init__(self, job_id: str, phase: str, track_memory: bool = True):
+        self.job_id = job_id
+        self.phase = phase
+        self.track_memory = track_memory
+        self.started = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.frame_times: Dict[str, List[float]] = {}
+        self.allocations: List[Dict] = []
+        self.memory_peak_bytes = 0
+        self.threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def enter_thread(self, ident: int) -> None:
+        with self._lock:
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+
+    def exit_thread(self, ident: int) -> None:
+        with self._lock:
+            depth = self.threads.get(ident, 0) - 1
+            if depth > 0:
+                self.threads[ident] = depth
+            else:
+                self.threads.pop(ident, None)
+
+    def sample(self, frames: Dict[int, object], labels: Dict[object, str]) -> None:
+        with self._lock:
+            idents = list(self.threads)
+        for ident in idents:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def frame_timing(self) -> Dict[str, Dict]:
+        summary = {}
+        for name, times in self.frame_times.items():
+            if not times:
+                continue
+            ordered = sorted(range(len(times)), key=times.__getitem__, reverse=True)
+            summary[name] = {
+                "frames": len(times),
+                "total_seconds": round(sum(times), 4),
+                "mean_ms": round(statistics.fmean(times) * 1000, 3),
+                "p50_ms": round(statistics.median(times) * 1000, 3),
+                "p95_ms": round(sorted(times)[int(0.95 * (len(times) - 1))] * 1000, 3),
+                "max_ms": round(times[ordered[0]] * 1000, 3),
+                "slowest_frames": ordered[:5],
+            }
+        return summary
+
+    def top_functions(self) -> List[Dict]:
+        """
+        Self and inclusive sample counts per function, from the folded stacks.
+        """
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for label in set(frames):
+                inclusive[label] += count
+        total = max(self.samples, 1)
+        return [{"function": label, "self_pct": round(100 * count / total, 1),
+                 "total_pct": round(100 * inclusive[label] / total, 1)}
+                for label, count in own.most_common(TOP_FUNCTIONS)]
+
+    def folded(self) -> List[str]:
+        return [f"{self.phase};{stack} {count}" for stack, count in self.stacks.most_common()]
+
+    def summary(self) -> Dict:
+        return {
+            "phase": self.phase,
+            "started_at": self.started,
+            "duration_seconds": round(self.duration, 3),
+            "samples": self.samples,
+            "interval_ms": PROFILE_INTERVAL_SECONDS * 1000,
+            "top_functions": self.top_functions(),
+            "frame_timing": self.frame_timing(),
+            "memory_peak_bytes": self.memory_peak_bytes if self.track_memory else None,
+            "top_allocations": self.allocations,
+        }
+
+class JobProfiler:
+    """
+    Opt-in per-job profiling. A job marked with request() runs its phases under
+    a sampling profiler thread and tracemalloc; results are written to
+    <job>_profile.json next to the video. When no job is being profiled no
+    tracer hook is installed and frame_clock() returns a no-op, so the cost is a
+    dict lookup per job and per frame loop.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._requested: "OrderedDict[str, str]" = OrderedDict()
+        self._armed = 0
+        self._armed_mode = "full"
+        self._sessions: Dict[str, ProfileSession] = {}
+        self._profiles: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._sampler_stop: Optional[threading.Event] = None
+        self._started_tracemalloc = False
+
+    def arm(self, count: int, mode: str = "full") -> int:
+        with self._lock:
+            self._armed = max(0, count)
+            self._armed_mode = mode
+            return self._armed
+
+    def request(self, job_id: str, mode: str = "full") -> None:
+        with self._lock:
+            self._requested[job_id] = mode
+            while len(self._requested) > MAX_REQUESTED_JOBS:
+                self._requested.popitem(last=False)
+
+    def claim_armed(self, job_id: str) -> bool:
+        with self._lock:
+            if self._armed <= 0:
+                return False
+            self._armed -= 1
+            mode = self._armed_mode
+        self.request(job_id, mode)
+        return True
+
+    def is_requested(self, job_id: str) -> bool:
+        return job_id in self._requested
+
+    def requested_mode(self, job_id: str) -> Optional[str]:
+        return self._requested.get(job_id)
+
+    def stats(self) -> Dict:
+        return {"armed": self._armed, "armed_mode": self._armed_mode,
+                "active": list(self._sessions), "kept": list(self._profiles)}
+
+    def _memory_wanted(self) -> bool:
+        return any(session.track_memory for session in self._sessions.values())
+
+    def _hook(self, span: Span, entering: bool) -> None:
+        session = self._sessions.get(span.trace_id)
+        if session is None or _on_event_loop():
+            return
+        if entering:
+            session.enter_thread(threading.get_ident())
+        else:
+            session.exit_thread(threading.get_ident())
+
+    def _sample_loop(self, stop: threading.Event) -> None:
+        labels: Dict[object, str] = {}
+        while not stop.wait(self.interval):
+            frames = sys._current_frames()
+            for session in list(self._sessions.values()):
+                session.sample(frames, labels)
+            del frames
+
+    def _start(self, session: ProfileSession) -> None:
+        with self._lock:
+            first = not self._sessions
+            self._sessions[session.job_id] = session
+            if first:
+                tracer.hooks.append(self._hook)
+                # Each sampler gets its own stop event: one still winding down
+                # from the previous session can't be revived by this start
+                self._sampler_stop = threading.Event()
+                self._sampler = threading.Thread(target=self._sample_loop, args=(self._sampler_stop,),
+                                                 name="job-profiler", daemon=True)
+                self._sampler.start()
+            if session.track_memory and not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+        if session.track_memory:
+            tracemalloc.reset_peak()
+
+    def _stop_session(self, session: ProfileSession) -> None:
+        sampler = None
+        with self._lock:
+            self._sessions.pop(session.job_id, None)
+            if not self._sessions:
+                if self._hook in tracer.hooks:
+                    tracer.hooks.remove(self._hook)
+                if self._sampler_stop is not None:
+                    self._sampler_stop.set()
+                sampler, self._sampler, self._sampler_stop = self._sampler, None, None
+            if self._started_tracemalloc and not self._memory_wanted():
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        if sampler is not None:
+            sampler.join(timeout=1.0)
+
+    @contextmanager
+    def session(self, job_id: str, phase: str):
+        """
+        Profile the enclosed phase if the job asked for it. Must be entered inside
+        the job's root span. Only threads inside one of the job's spans are
+        sampled; the event loop thread is shared with other jobs and mostly idle
+        in select(), so it is never registered.
+        """
+        mode = self._requested.get(job_id)
+        if mode is None:
+            yield None
+            return
+
+        # Concurrent phases of one job (a final render still running) keep the first session
+        if job_id in self._sessions:
+            yield None
+            return
+
+        session = ProfileSession(job_id, phase, track_memory=mode != "cpu")
+        self._start(session)
+        before = tracemalloc.take_snapshot() if session.track_memory else None
+        started = time.perf_counter()
+        print(f"🔬 Profiling {phase} of job {job_id} ({mode})")
+        try:
+            yield session
+        finally:
+            session.duration = time.perf_counter() - started
+            if before is not None:
+                try:
+                    after = tracemalloc.take_snapshot()
+                    session.memory_peak_bytes = tracemalloc.get_traced_memory()[1]
+                    session.allocations = [
+                        {"location": str(stat.traceback[0]), "size_bytes": stat.size_diff,
+                         "count": stat.count_diff}
+                        for stat in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]
+                    ]
+                except Exception as e:
+                    print(f"⚠️  Allocation snapshot failed for job {job_id}: {e}")
+            self._stop_session(session)
+            self._save(session)
+
+    def _save(self, session: ProfileSession) -> None:
+        profile = self.get(session.job_id) or {"job_id": session.job_id, "phases": {}, "folded": []}
+        profile["phases"][session.phase] = session.summary()
+        profile["spans"] = tracer.trace(session.job_id)
+        profile["folded"] = [line for line in profile["folded"]
+                             if not line.startswith(f"{session.phase};")] + session.folded()
+        with self._lock:
+            self._profiles[session.job_id] = profile
+            self._profiles.move_to_end(session.job_id)
+            while len(self._profiles) > MAX_KEPT_PROFILES:
+                self._profiles.popitem(last=False)
+        try:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            profile_path(session.job_id).write_text(json.dumps(profile))
+        except OSError as e:
+            print(f"⚠️  Could not write profile for job {session.job_id}: {e}")
+        print(f"🔬 Profile for job {session.job_id} ({session.phase}): {session.samples} samples, "
+              f"{session.duration:.1f}s")
+
+    def get(self, job_id: str, fallback: Optional[Path] = None) -> Optional[Dict]:
+        with self._lock:
+            profile = self._profiles.get(job_id)
+        if profile is not None:
+            return profile
+        for path in (profile_path(job_id), fallback):
+            if path is not None and path.exists():
+                return json.loads(path.read_text())
+        return None
+
+    def frame_clock(self, stage: str) -> Callable[[], None]:
+        """
+        Per-frame timer for a render loop: call the returned function once per
+        frame. A no-op unless the current job is being profiled.
+        """
+        if not self._sessions:
+            return _noop
+        current = tracer.current()
+        session = self._sessions.get(current.trace_id) if current is not None else None
+        if session is None:
+            return _noop
+
+        times = session.frame_times.setdefault(stage, [])
+        last = [time.perf_counter()]
+
+        def tick() -> None:
+            now = time.perf_counter()
+            times.append(now - last[0])
+            last[0] = now
+        return tick
+
+def _noop() -> None:
+    pass
+
+def folded_stacks(profile: Dict) -> str:
+    return "\n".join(profile.get("folded", [])) + "\n"
+
+job_profiler = JobProfiler()
+frame_clock = job_profiler.frame_clock
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Optional
+
+from services.admission import ClientInfo, admission, priority_for
+from services.output_store import VIDEO_TTL_SECONDS, output_store
+from services.pipeline import StageGraph
+from services.render_scheduler import RenderPlan, render_scheduler
+from services.profiling import job_profiler
+from services.telemetry import job_span
+
+PREVIEW_RESOLUTION = (360, 640)
+PREVIEW_FPS = 12
+MAX_TRACKED_JOBS = 1000
+
+class JobStatus(Enum):
+    RENDERING = "rendering"
+    PREVIEW = "preview"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+@dataclass
+class RenderJob:
+    job_id: str
+    video_path: str
+    status: JobStatus = JobStatus.RENDERING
+    tier: Optional[str] = None
+    error: Optional[str] = None
+    stage_timings: Dict[str, float] = field(default_factory=dict)
+    profile: Optional[Dict] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status.value,
+            "tier": self.tier,
+            "error": self.error,
+            "stage_timings": self.stage_timings,
+            **({"profile": self.profile} if self.profile else {}),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+class JobRegistry:
+    """
+    Status of recent jobs. A finished job is forgotten after the output store's
+    video TTL without updates, and the oldest jobs go first past max_jobs.
+    """
+
+    def __init__(self, max_jobs: int = MAX_TRACKED_JOBS, ttl: float = VIDEO_TTL_SECONDS):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, RenderJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.status != JobStatus.RENDERING and job.updated_at < cutoff:
+                del self._jobs[job_id]
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def create(self, job_id: str, video_path: str) -> RenderJob:
+        job = RenderJob(job_id=job_id, video_path=video_path)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            self._evict()
+        return job
+
+    def get(self, job_id: str) -> Optional[RenderJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def update(self, job_id: str, **changes) -> Optional[RenderJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            for key, value in changes.items():
+                setattr(job, key, value)
+            job.updated_at = time.time()
+            return job
+
+job_registry = JobRegistry()
+
+def attach_profile(job_id: str) -> None:
+    profile = job_profiler.get(job_id)
+    if profile is None:
+        return
+    job_registry.update(job_id, profile={
+        "phases": {phase: {"duration_seconds": summary["duration_seconds"], "samples": summary["samples"]}
+                   for phase, summary in profile["phases"].items()},
+        "url": f"/admin/jobs/{job_id}/profile",
+        "flamegraph_url": f"/admin/jobs/{job_id}/profile/flamegraph",
+    })
+
+def staging_path(video_path: Path, tier: str) -> Path:
+    video_path = Path(video_path)
+    return video_path.with_name(f"{video_path.stem}.{tier}{video_path.suffix}")
+
+def publish_video(job_id: str, staged_path: Path, video_path: Path, tier: str,
+                  graph: Optional[StageGraph] = None) -> None:
+    """
+    Atomically move a finished render onto the job's public path, so the preview
+    and the final render are served from the same URL.
+    """
+    os.replace(staged_path, video_path)
+    status = JobStatus.PREVIEW if tier == "preview" else JobStatus.COMPLETED
+    timings = graph.timing_summary() if graph else {}
+    job = job_registry.get(job_id)
+    if job is not None:
+        timings = {**job.stage_timings, **timings}
+    job_registry.update(job_id, status=status, tier=tier, stage_timings=timings)
+    print(f"📢 Published {tier} render for job {job_id}")
+
+async def run_final_render(job_id: str, graph: StageGraph, staged_path: Path, video_path: Path,
+                           plan: Optional[RenderPlan] = None, client: Optional[ClientInfo] = None) -> None:
+    try:
+        with job_span("final_render", job_id), job_profiler.session(job_id, "final_render"):
+            if plan is not None and client is not None:
+                async with admission.slot(client, priority_for(client, "final"), plan.estimated_cost):
+                    await render_scheduler.run(job_id, plan, graph.run())
+            elif plan is not None:
+                await render_scheduler.run(job_id, plan, graph.run())
+            else:
+                await graph.run()
+            publish_video(job_id, staged_path, video_path, "final", graph)
+    except Exception as e:
+        print(f"❌ Final render failed for job {job_id}, keeping preview: {e}")
+        Path(staged_path).unlink(missing_ok=True)
+        job_registry.update(job_id, status=JobStatus.FAILED, error=str(e))
+    finally:
+        if job_profiler.is_requested(job_id):
+            attach_profile(job_id)
+        output_store.release(job_id)
+
+def schedule_final_render(background_tasks, job_id: str, graph: StageGraph, staged_path: Path, video_path: Path,
+                          plan: Optional[RenderPlan] = None, client: Optional[ClientInfo] = None) -> None:
+    """
+    Queue the final render after the preview response. The job's intermediates
+    are kept until it finishes.
+    """
+    output_store.retain(job_id)
+    background_tasks.add_task(run_final_render, job_id, graph, staged_path, video_path, plan, client)
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Dict, List, Optional, Tuple
+
+from services.advanced_video_engine import QualityPreset
+from services.cancellation import cancel_scope
+
+COST_MODEL_PATH = Path(os.getenv("RENDER_COST_MODEL", "/tmp/render_cost_model.json"))
+
+EFFECT_FLAGS = (
+    "enable_optical_flow",
+    "enable_style_transfer",
+    "enable_lighting_effects",
+    "enable_atmospheric_effects",
+)
+
+DEGRADE_EFFECT_ORDER = (
+    "enable_optical_flow",
+    "enable_atmospheric_effects",
+    "enable_style_transfer",
+    "enable_lighting_effects",
+)
+
+QUALITY_LADDER = ["ULTRA", "HIGH", "QUALITY", "BALANCED", "SPEED"]
+QUALITY_ALIASES = {"low": "speed", "medium": "balanced", "max": "ultra"}
+
+# Seconds per megapixel-frame for the per-pixel terms, seconds per job for "overhead".
+DEFAULT_COST_COEFFICIENTS = {
+    "overhead": 8.0,
+    "base": 0.004,
+    "encode": 0.006,
+    "enable_optical_flow": 0.045,
+    "enable_style_transfer": 0.012,
+    "enable_lighting_effects": 0.008,
+    "enable_atmospheric_effects": 0.010,
+    "cinematic": 0.0,
+    "character": 0.020,
+    "hybrid": 0.006,
+    "physics": 0.030,
+    "tiktok": 0.015,
+}
+
+MIN_FPS = 15
+DEFAULT_DEADLINE_SECONDS = 600.0
+MAX_CONCURRENT_RENDERS = int(os.getenv("MAX_CONCURRENT_RENDERS", max(1, (os.cpu_count() or 2) // 2)))
+MAX_COST_UNDER_LOAD = 120.0
+
+class RenderBudgetExceeded(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RenderDeadlineExceeded(Exception):
+    pass
+
+def resolve_quality(quality: str) -> str:
+    key = QUALITY_ALIASES.get(quality.lower(), quality.lower())
+    if key.upper() not in QualityPreset.__members__:
+        print(f"⚠️  Unknown quality '{quality}', using balanced")
+        return "balanced"
+    return key
+
+@dataclass
+class RenderPlan:
+    kind: str
+    quality: str
+    fps: int
+    resolution: Tuple[int, int]
+    duration: float
+    effects: Dict[str, bool]
+    deadline: float
+    raw_cost: float = 0.0
+    estimated_cost: float = 0.0
+    degradations: List[str] = field(default_factory=list)
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def summary(self) -> Dict:
+        return {
+            "quality": self.quality,
+            "fps": self.fps,
+            "resolution": list(self.resolution),
+            "effects": dict(self.effects),
+            "estimated_seconds": round(self.estimated_cost, 1),
+            "degradations": list(self.degradations),
+        }
+
+class CostModel:
+    """
+    Linear render-cost model: a fixed per-job overhead plus a per megapixel-frame
+    cost for the pipeline kind, encoding and each enabled effect. Coefficients come
+    from COST_MODEL_PATH when a benchmark run has written one, and a global
+    correction factor tracks the observed/estimated ratio of finished jobs.
+    """
+
+    def __init__(self, coefficients: Optional[Dict[str, float]] = None):
+        self.coefficients = {**DEFAULT_COST_COEFFICIENTS, **(coefficients or {})}
+        self.correction = 1.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path = COST_MODEL_PATH) -> "CostModel":
+        if path.exists():
+            try:
+                coefficients = json.loads(path.read_text())
+                print(f"📐 Loaded render cost model from {path}")
+                return cls(coefficients)
+            except Exception as e:
+                print(f"⚠️  Could not read render cost model {path}: {e}")
+        return cls()
+
+    def save(self, path: Path = COST_MODEL_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.coefficients, indent=2, sort_keys=True))
+
+    def raw_estimate(self, kind: str, resolution: Tuple[int, int], fps: int, duration: float,
+                     effects: Dict[str, bool]) -> float:
+        c = self.coefficients
+        megapixels = resolution[0] * resolution[1] / 1e6
+        frames = duration * fps
+        per_frame = c["base"] + c["encode"] + c.get(kind, 0.0)
+        per_frame += sum(c[flag] for flag in EFFECT_FLAGS if effects.get(flag))
+        return c["overhead"] + frames * megapixels * per_frame
+
+    def estimate(self, plan: RenderPlan) -> float:
+        plan.raw_cost = self.raw_estimate(plan.kind, plan.resolution, plan.fps, plan.duration, plan.effects)
+        plan.estimated_cost = plan.raw_cost * self.correction
+        return plan.estimated_cost
+
+    def observe(self, plan: RenderPlan, elapsed: float) -> None:
+        if plan.raw_cost <= 0:
+            return
+        with self._lock:
+            ratio = elapsed / plan.raw_cost
+            self.correction = min(8.0, max(0.25, 0.8 * self.correction + 0.2 * ratio))
+
+class RenderScheduler:
+    """
+    Picks the render settings for each request from its deadline and the current
+    load. Settings are degraded one step at a time (fps above 30, optical flow,
+    atmosphere, style transfer, lighting, then lower presets and MIN_FPS) until
+    the estimated cost fits the budget.
+    """
+
+    def __init__(self, cost_model: Optional[CostModel] = None,
+                 capacity: int = MAX_CONCURRENT_RENDERS,
+                 max_cost_under_load: float = MAX_COST_UNDER_LOAD):
+        self.cost_model = cost_model or CostModel.load()
+        self.capacity = capacity
+        self.max_cost_under_load = max_cost_under_load
+        self._active: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> Tuple[int, float]:
+        with self._lock:
+            return len(self._active), sum(self._active.values())
+
+    def budget(self, deadline_seconds: float) -> float:
+        active, backlog = self.load()
+        slowdown = max(1.0, (active + 1) / self.capacity)
+        budget = deadline_seconds / slowdown
+        if active >= self.capacity:
+            budget = min(budget, self.max_cost_under_load)
+        return budget
+
+    def _degrade(self, plan: RenderPlan, allow_quality_change: bool) -> Optional[str]:
+        if plan.fps > 30:
+            plan.fps = 30
+            return "fps 30"
+
+        for flag in DEGRADE_EFFECT_ORDER:
+            if plan.effects.get(flag):
+                plan.effects[flag] = False
+                return f"{flag[len('enable_'):]} off"
+
+        quality = plan.quality.upper()
+        if allow_quality_change and quality in QUALITY_LADDER and quality != QUALITY_LADDER[-1]:
+            lower = QUALITY_LADDER[QUALITY_LADDER.index(quality) + 1]
+            preset = QualityPreset[lower].value
+            plan.quality = lower.lower()
+            plan.resolution = preset["resolution"]
+            plan.fps = min(plan.fps, preset["fps"])
+            return f"quality {plan.quality}"
+
+        if plan.fps > MIN_FPS:
+            plan.fps = MIN_FPS
+            return f"fps {MIN_FPS}"
+
+        return None
+
+    def plan(self, kind: str, quality: str, duration: float, fps: Optional[int] = None,
+             effects: Optional[Dict[str, bool]] = None, deadline_seconds: Optional[float] = None,
+             allow_quality_change: bool = True) -> RenderPlan:
+        quality = resolve_quality(quality)
+        preset = QualityPreset[quality.upper()].value
+        deadline_seconds = deadline_seconds or DEFAULT_DEADLINE_SECONDS
+
+        plan = RenderPlan(
+            kind=kind,
+            quality=quality,
+            fps=fps or preset["fps"],
+            resolution=preset["resolution"],
+            duration=duration,
+            effects=dict(effects) if effects is not None else {flag: True for flag in EFFECT_FLAGS},
+            deadline=time.monotonic() + deadline_seconds,
+        )
+
+        budget = self.budget(deadline_seconds)
+        while self.cost_model.estimate(plan) > budget:
+            step = self._degrade(plan, allow_quality_change)
+            if step is None:
+                active, backlog = self.load()
+                raise RenderBudgetExceeded(
+                    f"Estimated render time {plan.estimated_cost:.0f}s exceeds the {budget:.0f}s budget",
+                    retry_after=max(1.0, backlog / self.capacity)
+                )
+            plan.degradations.append(step)
+
+        if plan.degradations:
+            print(f"📉 Degraded {kind} render under budget {budget:.0f}s: {', '.join(plan.degradations)}")
+        print(f"🧮 Render plan: {plan.quality} {plan.resolution[0]}x{plan.resolution[1]}@{plan.fps}fps, "
+              f"~{plan.estimated_cost:.0f}s")
+        return plan
+
+    def revise(self, job_id: str, plan: RenderPlan, duration: float) -> None:
+        """
+        Re-estimate a planned or running job once its real length is known, e.g.
+        from the TTS audio; the job's load and the cost model's observation use it.
+        """
+        plan.duration = duration
+        self.cost_model.estimate(plan)
+        with self._lock:
+            if job_id in self._active:
+                self._active[job_id] = plan.estimated_cost
+
+    @contextmanager
+    def track(self, job_id: str, plan: RenderPlan):
+        with self._lock:
+            self._active[job_id] = plan.estimated_cost
+        start = time.monotonic()
+        try:
+            yield plan
+            self.cost_model.observe(plan, time.monotonic() - start)
+        finally:
+            with self._lock:
+                self._active.pop(job_id, None)
+
+    async def run(self, job_id: str, plan: RenderPlan, awaitable: Awaitable):
+        """
+        Await a render while it counts towards the load, cancelling it once the
+        plan's deadline passes. Worker threads can't be interrupted, so the render
+        loops check a cancel event once per frame and the job keeps counting (and
+        holding its admission slot) until they have actually stopped.
+        """
+        with self.track(job_id, plan):
+            remaining = plan.remaining()
+            if remaining <= 0:
+                if asyncio.iscoroutine(awaitable):
+                    awaitable.close()
+                raise RenderDeadlineExceeded(f"Render deadline passed before job {job_id} started")
+            with cancel_scope() as cancel:
+                task = asyncio.ensure_future(awaitable)
+            try:
+                done, _ = await asyncio.wait({task}, timeout=remaining)
+            except asyncio.CancelledError:
+                cancel.set()
+                task.cancel()
+                raise
+            if task in done:
+                return task.result()
+
+            cancel.set()
+            print(f"⏰ Job {job_id} exceeded its deadline, stopping its render")
+            await asyncio.wait({task})
+            if not task.cancelled() and task.exception() is None:
+                return task.result()
+            raise RenderDeadlineExceeded(f"Render for job {job_id} exceeded its deadline")
+
+render_scheduler = RenderScheduler()
@@ -0,0 +1,167 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from services.telemetry import annotate, traced
+
+GOP_SECONDS = 2.0
+SEGMENT_GOPS = 2
+MAX_SEGMENT_WORKERS = max(1, min(os.cpu_count() or 1, 8))
+
+def get_ffmpeg_binary() -> str:
+    try:
+        from moviepy.config import get_setting
+        return get_setting("FFMPEG_BINARY")
+    except Exception:
+        return os.environ.get("IMAGEIO_FFMPEG_EXE", "ffmpeg")
+
+def gop_size(fps: int) -> int:
+    return max(1, int(round(fps * GOP_SECONDS)))
+
+def _to_rgb24(frame: np.ndarray) -> bytes:
+    if frame.ndim == 2:
+        frame = np.repeat(frame[:, :, None], 3, axis=2)
+    elif frame.shape[2] == 4:
+        frame = frame[:, :, :3]
+    if frame.dtype != np.uint8:
+        frame = np.clip(frame, 0, 255).astype(np.uint8)
+    return np.ascontiguousarray(frame).tobytes()
+
+def _segment_command(ffmpeg: str, width: int, height: int, fps: int, gop: int, preset: str,
+                     bitrate: Optional[str], crf: int, threads: int, output: Path) -> List[str]:
+    cmd = [
+        ffmpeg, "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps),
+        "-i", "-",
+        "-an",
+        "-c:v", "libx264", "-preset", preset,
+        "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+        "-pix_fmt", "yuv420p", "-threads", str(threads),
+    ]
+    if bitrate:
+        cmd += ["-b:v", bitrate]
+    else:
+        cmd += ["-crf", str(crf)]
+    cmd += ["-f", "mpegts", str(output)]
+    return cmd
+
+def _encode_segment(cmd: List[str], frames: List[np.ndarray]) -> None:
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        for frame in frames:
+            proc.stdin.write(_to_rgb24(frame))
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    stderr = proc.stderr.read()
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg segment encode failed: {stderr.decode(errors='ignore').strip()}")
+
+@traced("mux")
+def _concat_and_mux(ffmpeg: str, segment_paths: List[Path], list_path: Path, output_path: str,
+                    audio_path: Optional[str], duration: float) -> None:
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            escaped = str(path.resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", str(list_path)]
+    if audio_path:
+        cmd += ["-stream_loop", "-1", "-i", audio_path, "-map", "0:v:0", "-map", "1:a:0", "-c:a", "aac"]
+    cmd += ["-c:v", "copy", "-t", f"{duration:.3f}", "-movflags", "+faststart", output_path]
+
+    result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg concat failed: {result.stderr.decode(errors='ignore').strip()}")
+
+@traced("encode")
+def encode_frames(frames: Iterable[np.ndarray], output_path: str, fps: int,
+                  audio_path: Optional[str] = None, preset: str = "medium",
+                  bitrate: Optional[str] = None, crf: int = 23,
+                  max_workers: int = MAX_SEGMENT_WORKERS) -> str:
+    """
+    Encode an RGB frame stream with several ffmpeg processes at once. Frames are cut
+    into segments of SEGMENT_GOPS closed GOPs, each segment is encoded by its own
+    libx264 process starting on a keyframe, and the segments are joined with the
+    concat demuxer (stream copy) while the audio is looped/trimmed and muxed in.
+    frames may be a list or a generator; at most max_workers segments are buffered.
+    """
+    ffmpeg = get_ffmpeg_binary()
+    output_path = str(output_path)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+    gop = gop_size(fps)
+    segment_frames = gop * SEGMENT_GOPS
+    threads_per_segment = max(1, (os.cpu_count() or 1) // max_workers)
+
+    work_dir = Path(tempfile.mkdtemp(prefix=".segments_", dir=Path(output_path).parent))
+    slots = threading.BoundedSemaphore(max_workers)
+    segment_paths: List[Path] = []
+    futures = []
+    total_frames = 0
+    size = None
+    start = time.perf_counter()
+
+    def submit(executor: ThreadPoolExecutor, batch: List[np.ndarray]) -> None:
+        segment_path = work_dir / f"segment_{len(segment_paths):05d}.ts"
+        segment_paths.append(segment_path)
+        cmd = _segment_command(ffmpeg, size[1], size[0], fps, gop, preset, bitrate, crf,
+                               threads_per_segment, segment_path)
+
+        def run():
+            try:
+                _encode_segment(cmd, batch)
+            finally:
+                slots.release()
+
+        futures.append(executor.submit(run))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            batch: List[np.ndarray] = []
+            slots.acquire()
+            held = True
+            try:
+                for frame in frames:
+                    if size is None:
+                        size = frame.shape[:2]
+                    batch.append(frame)
+                    total_frames += 1
+                    if len(batch) == segment_frames:
+                        held = False
+                        submit(executor, batch)
+                        batch = []
+                        slots.acquire()
+                        held = True
+                if batch:
+                    held = False
+                    submit(executor, batch)
+            finally:
+                if held:
+                    slots.release()
+
+            for future in futures:
+                future.result()
+
+        if total_frames == 0:
+            raise ValueError("No frames to encode")
+
+        _concat_and_mux(ffmpeg, segment_paths, work_dir / "segments.txt", output_path,
+                        audio_path, total_frames / fps)
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    annotate(frames=total_frames, segments=len(segment_paths))
+    print(f"⚡ Encoded {total_frames} frames in {len(segment_paths)} segments "
+          f"({max_workers} workers, GOP {gop}) in {elapsed:.2f}s")
+    return output_path
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from services.output_store import SWEEP_INTERVAL_SECONDS, VIDEO_TTL_SECONDS, OutputStore
+
+SHARED_STORAGE_URL = os.getenv("SHARED_STORAGE", "file:///tmp/shared_output")
+SHARED_STORAGE_QUOTA_BYTES = int(float(os.getenv("SHARED_STORAGE_QUOTA_MB", os.getenv("OUTPUT_QUOTA_MB", "5120"))) * 1024 * 1024)
+
+class SharedStorage(ABC):
+    """
+    Where workers upload finished videos so the API can serve them, whichever
+    node rendered them.
+    """
+
+    @abstractmethod
+    def upload(self, local_path: Path, name: str) -> str:
+        ...
+
+    @abstractmethod
+    def path(self, name: str) -> Optional[Path]:
+        ...
+
+    def touch(self, name: str) -> None:
+        """
+        Record that name was served, for least-recently-served expiry.
+        """
+
+    def sweep(self) -> Dict:
+        """
+        Expire old uploads. Backends whose objects expire on their own (e.g. a
+        bucket lifecycle rule) can leave this a no-op.
+        """
+        return {}
+
+    async def run_sweeper(self, interval: float = SWEEP_INTERVAL_SECONDS) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"⚠️  Shared storage sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+class LocalDirStorage(SharedStorage):
+    """
+    A directory visible to the API and all workers, e.g. an NFS or volume mount.
+    Uploads are copied to a temp name and renamed into place, so readers never
+    see a partial file and a preview is replaced atomically by the final video.
+    Uploads expire like local outputs: videos by TTL and then least recently
+    served first above SHARED_STORAGE_QUOTA_MB, other files (profiles, temp
+    files of crashed uploads) after the video TTL.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.store = OutputStore(self.root, quota_bytes=SHARED_STORAGE_QUOTA_BYTES,
+                                 orphan_ttl=VIDEO_TTL_SECONDS, name="Shared storage")
+
+    def upload(self, local_path: Path, name: str) -> str:
+        target = self.root / name
+        temp = self.root / f".{name}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(local_path, temp)
+            os.replace(temp, target)
+        finally:
+            temp.unlink(missing_ok=True)
+        print(f"☁️  Uploaded {name} to {self.root}")
+        return name
+
+    def path(self, name: str) -> Optional[Path]:
+        candidate = self.root / Path(name).name
+        return candidate if candidate.exists() else None
+
+    def touch(self, name: str) -> None:
+        self.store.touch(self.root / Path(name).name)
+
+    def sweep(self) -> Dict:
+        return self.store.sweep()
+
+STORAGE_BACKENDS: Dict[str, Callable[[str], SharedStorage]] = {
+    "file": LocalDirStorage,
+}
+
+def register_storage(scheme: str, factory: Callable[[str], SharedStorage]) -> None:
+    STORAGE_BACKENDS[scheme] = factory
+
+def storage_from_env() -> SharedStorage:
+    scheme, sep, location = SHARED_STORAGE_URL.partition("://")
+    if not sep or scheme not in STORAGE_BACKENDS:
+        raise ValueError(f"Unsupported shared storage: {SHARED_STORAGE_URL} (known: {', '.join(STORAGE_BACKENDS)})")
+    return STORAGE_BACKENDS[scheme](location)
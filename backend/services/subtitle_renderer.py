@@ -0,0 +1,250 @@
+import bisect
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageColor
+
+FONT_CANDIDATES = ["Arial.ttf", "Arial Bold.ttf", "DejaVuSans-Bold.ttf", "DejaVuSans.ttf"]
+
+@dataclass
+class SubtitleWord:
+    text: str
+    start: float
+    end: float
+
+@dataclass
+class SubtitleCue:
+    words: List[SubtitleWord]
+    start: float
+    end: float
+
+    @property
+    def text(self) -> str:
+        return " ".join(w.text for w in self.words)
+
+@dataclass
+class _Sprite:
+    x: int
+    y: int
+    premultiplied: np.ndarray
+    inv_alpha: np.ndarray
+
+@dataclass
+class _PreparedCue:
+    cue: SubtitleCue
+    line: _Sprite
+    highlights: List[_Sprite] = field(default_factory=list)
+    word_starts: List[float] = field(default_factory=list)
+
+def _group_words(words: List[SubtitleWord], max_chars: int) -> List[List[SubtitleWord]]:
+    lines = []
+    current: List[SubtitleWord] = []
+    current_len = 0
+
+    for word in words:
+        added = len(word.text) + (1 if current else 0)
+        if current and current_len + added > max_chars:
+            lines.append(current)
+            current, current_len = [], 0
+            added = len(word.text)
+        current.append(word)
+        current_len += added
+
+    if current:
+        lines.append(current)
+    return lines
+
+def build_subtitle_cues(script: str, duration: float, word_boundaries: Optional[List[Dict]] = None,
+                        max_chars: int = 20, hold: float = 0.3) -> List[SubtitleCue]:
+    """
+    Group words into subtitle lines. Timing comes from the TTS word boundaries
+    when available, otherwise words share the duration in proportion to their length.
+    """
+    if word_boundaries:
+        words = [SubtitleWord(w['text'], float(w['start']), float(w['end']))
+                 for w in word_boundaries if float(w['start']) < duration]
+    else:
+        tokens = script.split() or [script]
+        weights = [len(t) + 1 for t in tokens]
+        unit = duration / sum(weights)
+        words, t = [], 0.0
+        for token, weight in zip(tokens, weights):
+            words.append(SubtitleWord(token, t, t + unit * weight))
+            t += unit * weight
+
+    lines = _group_words(words, max_chars)
+    cues = []
+    for i, line in enumerate(lines):
+        start = line[0].start
+        if i + 1 < len(lines):
+            end = lines[i + 1][0].start
+        else:
+            end = min(line[-1].end + hold, duration)
+        cues.append(SubtitleCue(words=line, start=start, end=max(end, start + 1e-3)))
+    return cues
+
+class SubtitleRenderer:
+    """
+    Pre-rasterizes each subtitle line once into an RGBA sprite and blends it
+    into the subtitle bounding box of each frame, with optional karaoke
+    highlighting of the word being spoken.
+    """
+
+    def __init__(self, frame_size: Tuple[int, int], font_size: int = 40, color: str = "white",
+                 highlight_color: str = "#FFD400", karaoke: bool = True,
+                 stroke_width: int = 3, bottom_margin: int = 120, side_margin: int = 40):
+        self.frame_w, self.frame_h = int(frame_size[0]), int(frame_size[1])
+        self.font_size = font_size
+        self.color = ImageColor.getrgb(color)
+        self.highlight_color = ImageColor.getrgb(highlight_color)
+        self.karaoke = karaoke
+        self.stroke_width = stroke_width
+        self.bottom_margin = bottom_margin
+        self.side_margin = side_margin
+        self._fonts: Dict[int, ImageFont.ImageFont] = {}
+        self._cues: List[_PreparedCue] = []
+        self._starts: List[float] = []
+
+    def _font(self, size: int) -> ImageFont.ImageFont:
+        font = self._fonts.get(size)
+        if font is None:
+            for candidate in FONT_CANDIDATES:
+                try:
+                    font = ImageFont.truetype(candidate, size)
+                    break
+                except OSError:
+                    continue
+            else:
+                font = ImageFont.load_default(size=size)
+            self._fonts[size] = font
+        return font
+
+    def _layout(self, words: List[str], size: int) -> Tuple[List[int], int, int, Tuple[int, int]]:
+        font = self._font(size)
+        space = font.getlength(" ")
+        offsets, x = [], 0.0
+        for word in words:
+            offsets.append(int(x))
+            x += font.getlength(word) + space
+        left, top, right, bottom = font.getbbox(" ".join(words), stroke_width=self.stroke_width)
+        width = int(x - space) + 2 * self.stroke_width
+        height = bottom - top + 2 * self.stroke_width
+        return offsets, width, height, (self.stroke_width, self.stroke_width - top)
+
+    def _rasterize(self, words: List[str], colors: List[Optional[Tuple[int, int, int]]],
+                   size: int, width: int, height: int, origin: Tuple[int, int],
+                   offsets: List[int]) -> np.ndarray:
+        font = self._font(size)
+        canvas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(canvas)
+        for word, color, offset in zip(words, colors, offsets):
+            if color is None:
+                continue
+            draw.text((origin[0] + offset, origin[1]), word, font=font, fill=color + (255,),
+                      stroke_width=self.stroke_width, stroke_fill=(0, 0, 0, 255))
+        return np.array(canvas)
+
+    def _sprite(self, rgba: np.ndarray, x: int, y: int) -> _Sprite:
+        alpha = rgba[:, :, 3:4].astype(np.float32) / 255.0
+        premultiplied = rgba[:, :, :3].astype(np.float32) * alpha
+        return _Sprite(x=x, y=y, premultiplied=premultiplied, inv_alpha=1.0 - alpha)
+
+    def prepare(self, cues: List[SubtitleCue]) -> None:
+        max_width = self.frame_w - 2 * self.side_margin
+        self._cues = []
+
+        for cue in cues:
+            words = [w.text for w in cue.words]
+            size = self.font_size
+            offsets, width, height, origin = self._layout(words, size)
+            while width > max_width and size > 12:
+                size = max(12, int(size * max_width / width))
+                offsets, width, height, origin = self._layout(words, size)
+
+            x = max((self.frame_w - width) // 2, 0)
+            y = max(self.frame_h - self.bottom_margin - height, 0)
+            width = min(width, self.frame_w - x)
+            height = min(height, self.frame_h - y)
+
+            line_rgba = self._rasterize(words, [self.color] * len(words), size,
+                                        width, height, origin, offsets)
+            prepared = _PreparedCue(cue=cue, line=self._sprite(line_rgba, x, y),
+                                    word_starts=[w.start for w in cue.words])
+
+            if self.karaoke:
+                for i in range(len(words)):
+                    colors = [self.highlight_color if j == i else None for j in range(len(words))]
+                    rgba = self._rasterize(words, colors, size, width, height, origin, offsets)
+                    prepared.highlights.append(self._sprite(rgba, x, y))
+
+            self._cues.append(prepared)
+
+        self._starts = [c.cue.start for c in self._cues]
+
+    def _blend(self, frame: np.ndarray, sprite: _Sprite) -> None:
+        h, w = sprite.inv_alpha.shape[:2]
+        roi = frame[sprite.y:sprite.y + h, sprite.x:sprite.x + w]
+        blended = roi.astype(np.float32) * sprite.inv_alpha + sprite.premultiplied
+        roi[:] = blended.astype(np.uint8)
+
+    def render(self, frame: np.ndarray, t: float) -> np.ndarray:
+        idx = bisect.bisect_right(self._starts, t) - 1
+        if idx < 0 or t >= self._cues[idx].cue.end:
+            return frame
+
+        prepared = self._cues[idx]
+        frame = frame.copy()
+        self._blend(frame, prepared.line)
+
+        if prepared.highlights:
+            word_idx = max(bisect.bisect_right(prepared.word_starts, t) - 1, 0)
+            self._blend(frame, prepared.highlights[word_idx])
+
+        return frame
+
+def _ass_time(t: float) -> str:
+    cs = int(round(t * 100))
+    h, cs = divmod(cs, 360000)
+    m, cs = divmod(cs, 6000)
+    s, cs = divmod(cs, 100)
+    return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+def write_ass_subtitles(cues: List[SubtitleCue], output_path: str, frame_size: Tuple[int, int],
+                        font_size: int = 40, karaoke: bool = True, bottom_margin: int = 120) -> str:
+    """
+    Write the cues as an ASS track (with \\k karaoke tags) for burning in with ffmpeg's ass filter.
+    """
+    width, height = frame_size
+    primary = "&H0000D4FF" if karaoke else "&H00FFFFFF"
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+        "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Default,Arial,{font_size},{primary},&H00FFFFFF,&H00000000,&H00000000,"
+        f"-1,0,0,0,100,100,0,0,1,3,0,2,40,40,{bottom_margin},1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+
+    for cue in cues:
+        if karaoke:
+            parts = []
+            for i, word in enumerate(cue.words):
+                next_start = cue.words[i + 1].start if i + 1 < len(cue.words) else cue.end
+                parts.append(f"{{\\k{max(int(round((next_start - word.start) * 100)), 1)}}}{word.text}")
+            text = " ".join(parts)
+        else:
+            text = cue.text
+        lines.append(f"Dialogue: 0,{_ass_time(cue.start)},{_ass_time(cue.end)},Default,,0,0,0,,{text}")
+
+    Path(output_path).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return output_path
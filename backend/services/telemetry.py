@@ -0,0 +1,399 @@
+import contextvars
+import functools
+import inspect
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+METRIC_PREFIX = "tiktok_"
+MAX_FINISHED_SPANS = int(os.getenv("TRACE_BUFFER_SPANS", "5000"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+FPS_BUCKETS = (1, 2, 5, 10, 15, 24, 30, 60, 120, 240, 480, 1000)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple = ()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = METRIC_PREFIX + name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> Iterable[str]:
+        ...
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}_total{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+class Gauge(_Metric):
+    """
+    Gauge set directly, or computed at scrape time by set_function().
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], object]) -> None:
+        """
+        function returns a number, or a {label value tuple: number} dict for
+        labelled gauges.
+        """
+        self._function = function
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._function is not None:
+            try:
+                computed = self._function()
+            except Exception as e:
+                print(f"⚠️  Metric {self.name} failed: {e}")
+                computed = {}
+            if isinstance(computed, dict):
+                values.update({key if isinstance(key, tuple) else (key,): v for key, v in computed.items()})
+            elif computed is not None:
+                values[()] = computed
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per bucket counts, then sum and count
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return int(series[-1]) if series else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.label_names, key, (("le", _format_value(bound)),))
+                yield f"{self.name}_bucket{labels} {_format_value(count)}"
+            labels = _format_labels(self.label_names, key, (("le", "+Inf"),))
+            yield f"{self.name}_bucket{labels} {_format_value(series[-1])}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {_format_value(series[-1])}"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+http_request_seconds = registry.histogram("http_request_duration_seconds", "HTTP request latency",
+                                          ("method", "route", "status"))
+stage_seconds = registry.histogram("stage_duration_seconds", "Wall time of pipeline stages and spans",
+                                   ("stage", "status"))
+stage_fps = registry.histogram("stage_frames_per_second", "Frames per second of frame rendering and encoding spans",
+                               ("stage",), buckets=FPS_BUCKETS)
+job_seconds = registry.histogram("job_duration_seconds", "End-to-end generation job time", ("kind", "status"))
+cache_requests = registry.counter("cache_requests", "Cache lookups by cache and result (hit/miss)",
+                                  ("cache", "result"))
+upstream_responses = registry.counter("upstream_responses", "Responses from external services by status code",
+                                      ("service", "status"))
+upstream_rate_limited = registry.counter("upstream_rate_limited", "HTTP 429 responses from external services",
+                                         ("service",))
+admission_rejections = registry.counter("admission_rejections", "Jobs rejected or failed by scheduling",
+                                        ("reason",))
+queue_depth = registry.gauge("queue_depth", "Jobs waiting or running, by queue and state", ("queue", "state"))
+process_memory = registry.gauge("process_resident_memory_bytes", "Resident memory of this process")
+process_peak_memory = registry.gauge("process_peak_resident_memory_bytes", "Peak resident memory of this process")
+
+def _resident_memory() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _peak_memory() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+process_memory.set_function(_resident_memory)
+process_peak_memory.set_function(_peak_memory)
+
+def count_cache(cache: str, hit: bool) -> None:
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+def count_upstream(service: str, status_code: Optional[int]) -> None:
+    if status_code is None:
+        return
+    upstream_responses.inc(service=service, status=str(status_code))
+    if status_code == 429:
+        upstream_rate_limited.inc(service=service)
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    attributes: Dict[str, object] = field(default_factory=dict)
+    end: Optional[float] = None
+    status: str = "ok"
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": round(self.duration, 4),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+class Tracer:
+    """
+    Minimal OpenTelemetry-style tracer. Spans nest through a context variable,
+    which asyncio tasks and asyncio.to_thread() inherit, so a job's stages and
+    the service calls inside them share the job's trace. Every finished span is
+    observed in stage_duration_seconds (and stage_frames_per_second when it
+    carries a "frames" attribute) and kept in a bounded buffer for /jobs/{id}/trace.
+    """
+
+    def __init__(self, max_spans: int = MAX_FINISHED_SPANS):
+        self._finished: Deque[Span] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        # Called with (span, entering) in the thread the span runs in; empty unless profiling
+        self.hooks: List[Callable[[Span, bool], None]] = []
+
+    @contextmanager
+    def span(self, name: str, trace_id: Optional[str] = None, **attributes):
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=trace_id or (parent.trace_id if parent else uuid.uuid4().hex),
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent and not trace_id else None,
+            start=time.time(),
+            attributes=dict(attributes),
+        )
+        token = _current_span.set(span)
+        for hook in self.hooks:
+            hook(span, True)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            span.end = span.start + elapsed
+            for hook in self.hooks:
+                hook(span, False)
+            _current_span.reset(token)
+            self._finish(span, elapsed)
+
+    def _finish(self, span: Span, elapsed: float) -> None:
+        stage_seconds.observe(elapsed, stage=span.name, status=span.status)
+        frames = span.attributes.get("frames")
+        if span.status == "ok" and frames and elapsed > 0:
+            stage_fps.observe(frames / elapsed, stage=span.name)
+        with self._lock:
+            self._finished.append(span)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def trace(self, trace_id: str) -> List[Dict]:
+        with self._lock:
+            spans = [span for span in self._finished if span.trace_id == trace_id]
+        return [span.to_dict() for span in sorted(spans, key=lambda s: s.start)]
+
+tracer = Tracer()
+span = tracer.span
+
+def annotate(**attributes) -> None:
+    current = tracer.current()
+    if current is not None:
+        current.set(**attributes)
+
+def traced(name: str, count_frames: bool = False):
+    """
+    Run the decorated function inside a span. With count_frames the span gets a
+    "frames" attribute from len() of the returned frame list.
+    """
+    def decorate(func):
+        def finish(current: Span, result):
+            if count_frames and result is not None:
+                current.set(frames=len(result))
+            return result
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def run_async(*args, **kwargs):
+                with tracer.span(name) as current:
+                    return finish(current, await func(*args, **kwargs))
+            return run_async
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            with tracer.span(name) as current:
+                return finish(current, func(*args, **kwargs))
+        return run
+    return decorate
+
+@contextmanager
+def job_span(kind: str, job_id: str):
+    """
+    Root span of a generation job; the job id is the trace id.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        with tracer.span(f"job.{kind}", trace_id=job_id, kind=kind, job_id=job_id) as current:
+            yield current
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        job_seconds.observe(time.perf_counter() - started, kind=kind, status=status)
+
+def render_metrics() -> str:
+    return registry.render()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve /metrics from a background thread, for processes without the API
+    (render workers).
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{port}/metrics")
+    return server
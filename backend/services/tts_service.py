@@ -1,40 +1,257 @@
 import edge_tts
 import asyncio
+import hashlib
+import os
+import re
+import shutil
+import weakref
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 import gtts
 
-async def generate_audio_async(text: str, output_path: str, voice: str = "en-US-GuyNeural"):
-    communicate = edge_tts.Communicate(text, voice)
-    await communicate.save(output_path)
+from services.lipsync import load_word_boundaries, save_word_boundaries, word_boundaries_path
+from services.mp3_utils import mp3_audio_frames
+from services.telemetry import count_cache, traced
+
+DEFAULT_VOICE = "en-US-GuyNeural"
+DEFAULT_RATE = "+0%"
+
+TTS_CACHE_DIR = Path("/tmp/tts_cache")
+TTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+MAX_TTS_CACHE_BYTES = 512 * 1024 * 1024
+MAX_CONCURRENT_EDGE_TTS = 4
+CHUNKED_TTS_MIN_CHARS = 400
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])\s+')
+
+_loop_state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[asyncio.Semaphore, Dict[str, asyncio.Future]]]" = weakref.WeakKeyDictionary()
+
+def get_tts_cache_key(text: str, voice: str, rate: str, engine: str) -> str:
+    payload = "\x1f".join([engine, voice, rate, text])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def get_cached_audio(cache_key: str) -> Optional[Path]:
+    cache_path = TTS_CACHE_DIR / f"{cache_key}.mp3"
+    if cache_path.exists() and cache_path.stat().st_size > 0:
+        os.utime(cache_path)
+        return cache_path
+    return None
+
+def evict_tts_cache(max_bytes: int = MAX_TTS_CACHE_BYTES) -> int:
+    entries = []
+    total = 0
+    for path in TTS_CACHE_DIR.glob("*.mp3"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        word_boundaries_path(str(path)).unlink(missing_ok=True)
+        total -= size
+        removed += 1
+
+    if removed:
+        print(f"🧹 Evicted {removed} cached TTS files")
+    return removed
+
+def _get_loop_state() -> Tuple[asyncio.Semaphore, Dict[str, asyncio.Future]]:
+    loop = asyncio.get_running_loop()
+    state = _loop_state.get(loop)
+    if state is None:
+        state = (asyncio.Semaphore(MAX_CONCURRENT_EDGE_TTS), {})
+        _loop_state[loop] = state
+    return state
+
+@traced("tts.edge")
+async def generate_audio_async(text: str, output_path: str, voice: str = DEFAULT_VOICE,
+                               rate: str = DEFAULT_RATE) -> List[Dict]:
+    communicate = edge_tts.Communicate(text, voice, rate=rate)
+    word_boundaries = []
+
+    with open(output_path, 'wb') as f:
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                f.write(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                start = chunk["offset"] / 1e7
+                word_boundaries.append({
+                    "text": chunk["text"],
+                    "start": start,
+                    "end": start + chunk["duration"] / 1e7
+                })
+
+    save_word_boundaries(output_path, word_boundaries)
+    return word_boundaries
+
+@traced("tts.gtts")
+def _generate_gtts(text: str, output_path: str) -> None:
+    tts = gtts.gTTS(text=text, lang='en', slow=False)
+    tts.save(output_path)
+
+async def _synthesize(cache_key: str, text: str, voice: str, rate: str, method: str,
+                     edge_semaphore: asyncio.Semaphore) -> Path:
+    cache_path = TTS_CACHE_DIR / f"{cache_key}.mp3"
+    temp_path = TTS_CACHE_DIR / f"{cache_key}.{os.getpid()}.tmp.mp3"
 
-def generate_audio(text: str, output_path: str, method: str = "edge") -> str:
-    output_path = Path(output_path)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    
     try:
         if method == "edge":
             try:
-                loop = asyncio.get_running_loop()
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(
-                        asyncio.run,
-                        generate_audio_async(text, str(output_path))
-                    )
-                    future.result()
+                async with edge_semaphore:
+                    word_boundaries = await generate_audio_async(text, str(temp_path), voice, rate)
+                save_word_boundaries(str(cache_path), word_boundaries)
             except Exception as edge_error:
                 print(f"⚠️ Edge TTS failed: {edge_error}, falling back to Google TTS...")
-                tts = gtts.gTTS(text=text, lang='en', slow=False)
-                tts.save(str(output_path))
-        else:
-            tts = gtts.gTTS(text=text, lang='en', slow=False)
-            tts.save(str(output_path))
-        
-        if output_path.exists() and output_path.stat().st_size > 0:
-            return str(output_path)
+                return await _synthesize_to_cache(text, voice, rate, "gtts")
         else:
+            await asyncio.to_thread(_generate_gtts, text, str(temp_path))
+
+        if not temp_path.exists() or temp_path.stat().st_size == 0:
             raise Exception("Audio file was not created or is empty")
-            
+
+        os.replace(temp_path, cache_path)
+        evict_tts_cache()
+        return cache_path
+
+    finally:
+        temp_path.unlink(missing_ok=True)
+        word_boundaries_path(str(temp_path)).unlink(missing_ok=True)
+
+async def _synthesize_to_cache(text: str, voice: str, rate: str, method: str) -> Path:
+    cache_key = get_tts_cache_key(text, voice, rate, method)
+    cached_path = get_cached_audio(cache_key)
+    if cached_path:
+        print(f"🔄 Using cached TTS audio: {cached_path.name}")
+        count_cache("tts", True)
+        return cached_path
+
+    edge_semaphore, inflight = _get_loop_state()
+    task = inflight.get(cache_key)
+    if task is not None:
+        count_cache("tts", True)
+    else:
+        count_cache("tts", False)
+        # The synthesis belongs to the in-flight map, not to the first caller: a
+        # caller that is cancelled stops waiting but the others still get the audio
+        task = asyncio.ensure_future(_synthesize(cache_key, text, voice, rate, method, edge_semaphore))
+        inflight[cache_key] = task
+
+        def finished(done: asyncio.Task) -> None:
+            if inflight.get(cache_key) is done:
+                del inflight[cache_key]
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(finished)
+
+    return await asyncio.shield(task)
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_BOUNDARY.split(text.strip()) if s.strip()]
+
+async def synthesize_audio_chunked(text: str, output_path: str, voice: str = DEFAULT_VOICE,
+                                   rate: str = DEFAULT_RATE, method: str = "edge",
+                                   max_parallel: int = MAX_CONCURRENT_EDGE_TTS) -> str:
+    """
+    Split the script at sentence boundaries, synthesize the sentences concurrently
+    (each cached on its own) and append them to the output in order as soon as each
+    prefix is ready. Word boundaries are shifted by the exact MP3 duration of the
+    preceding chunks.
+    """
+    output_path = Path(output_path)
+    sentences = split_sentences(text)
+    limiter = asyncio.Semaphore(max_parallel)
+
+    async def synthesize_chunk(sentence: str) -> Path:
+        async with limiter:
+            return await _synthesize_to_cache(sentence, voice, rate, method)
+
+    tasks = [asyncio.ensure_future(synthesize_chunk(sentence)) for sentence in sentences]
+    word_boundaries: List[Dict] = []
+    offset = 0.0
+
+    try:
+        with open(output_path, 'wb') as f:
+            for i, task in enumerate(tasks):
+                chunk_path = await task
+                if chunk_path.stem != get_tts_cache_key(sentences[i], voice, rate, method):
+                    raise Exception(f"Chunk {i + 1} fell back to a different TTS engine")
+
+                frames, duration = mp3_audio_frames(chunk_path.read_bytes())
+                f.write(frames)
+
+                for word in load_word_boundaries(str(chunk_path)) or []:
+                    word_boundaries.append({
+                        "text": word["text"],
+                        "start": word["start"] + offset,
+                        "end": word["end"] + offset
+                    })
+                offset += duration
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    if word_boundaries:
+        save_word_boundaries(str(output_path), word_boundaries)
+
+    print(f"🧩 Chunked TTS: {len(sentences)} sentences, {offset:.2f}s of audio")
+    return str(output_path)
+
+async def synthesize_audio(text: str, output_path: str, voice: str = DEFAULT_VOICE,
+                           rate: str = DEFAULT_RATE, method: str = "edge",
+                           chunked: Optional[bool] = None) -> str:
+    """
+    Native async TTS entry point. Audio is served from a content-addressed cache
+    keyed by (text, voice, rate, engine); concurrent identical requests share one
+    synthesis and edge-tts calls are capped at MAX_CONCURRENT_EDGE_TTS per loop.
+    Long multi-sentence scripts are synthesized sentence by sentence unless
+    chunked is set explicitly.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    word_boundaries_path(str(output_path)).unlink(missing_ok=True)
+
+    if chunked is None:
+        chunked = len(text) >= CHUNKED_TTS_MIN_CHARS and len(split_sentences(text)) > 1
+
+    if chunked:
+        try:
+            return await synthesize_audio_chunked(text, str(output_path), voice, rate, method)
+        except Exception as e:
+            print(f"⚠️ Chunked TTS failed: {e}, synthesizing the whole script...")
+            word_boundaries_path(str(output_path)).unlink(missing_ok=True)
+
+    try:
+        cache_path = await _synthesize_to_cache(text, voice, rate, method)
+
+        shutil.copyfile(cache_path, output_path)
+        cached_words = word_boundaries_path(str(cache_path))
+        if cached_words.exists():
+            shutil.copyfile(cached_words, word_boundaries_path(str(output_path)))
+
+        return str(output_path)
+
     except Exception as e:
         print(f"Error generating audio with {method}: {e}")
         raise
+
+def generate_audio(text: str, output_path: str, method: str = "edge") -> str:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(synthesize_audio(text, output_path, method=method))
+
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(
+            asyncio.run,
+            synthesize_audio(text, output_path, method=method)
+        ).result()
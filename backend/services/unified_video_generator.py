@@ -1,83 +1,101 @@
 import numpy as np
-import cv2
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import os
+import tempfile
 import uuid
 from moviepy.editor import ImageSequenceClip
 from moviepy.audio.io.AudioFileClip import AudioFileClip
 from moviepy.audio.fx.all import audio_loop
 
 from services.advanced_video_engine import AdvancedVideoEngine, VideoConfig, VideoStyle, QualityPreset, CameraMovement
-from services.advanced_character_animator import AdvancedCharacterAnimator, EmotionType
+from services.advanced_character_animator import AdvancedCharacterAnimator, resolve_emotion
+from services.compositor import Compositor, Layer, LayerTransform, StreamLayer, circle_mask
+from services.frame_store import FrameStore
+from services.frame_stream import FrameStream
+from services.pipeline import AssetMemo, StageGraph
+from services.segment_encoder import encode_frames
 import requests
 import urllib.parse
 
+from services.profiling import frame_clock
+from services.telemetry import count_upstream, span, traced
+
+HYBRID_CHARACTER_OPACITY = 0.3
+
 class UnifiedVideoGenerator:
     def __init__(self):
         self.video_engine = AdvancedVideoEngine()
         self.character_animator = AdvancedCharacterAnimator()
         
+    def write_video(self, frames: FrameStore, audio_path: str, output_path: str,
+                    quality: str, duration: float, fps: Optional[int] = None) -> str:
+        quality_preset = QualityPreset[quality.upper()]
+        fps = fps or quality_preset.value["fps"]
+        
+        print(f"\n🎬 Composing video from {len(frames)} frames...")
+        
+        try:
+            return encode_frames(frames, output_path, fps, audio_path=audio_path, preset='medium',
+                                 bitrate=quality_preset.value["bitrate"])
+        except Exception as e:
+            print(f"⚠️  Segmented encode failed: {e}, falling back to single-stream encode...")
+        
+        clip = ImageSequenceClip(list(frames), fps=fps)
+        
+        audio_clip = AudioFileClip(audio_path)
+        
+        if audio_clip.duration > duration:
+            audio_clip = audio_clip.subclip(0, duration)
+        elif audio_clip.duration < duration:
+            audio_clip = audio_loop(audio_clip, duration=duration)
+        
+        final_clip = clip.set_audio(audio_clip)
+        
+        output_dir = Path(output_path).parent
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        final_clip.write_videofile(
+            output_path,
+            fps=fps,
+            codec='libx264',
+            audio_codec='aac',
+            preset='medium',
+            bitrate=quality_preset.value["bitrate"],
+            threads=4,
+            logger=None
+        )
+        
+        clip.close()
+        audio_clip.close()
+        final_clip.close()
+        
+        return output_path
+    
+    def render_cinematic_frames(self, prompt: str, style: str = "cinematic", quality: str = "balanced",
+                                camera_movement: str = "static", duration: float = 5.0,
+                                effects: Optional[Dict[str, bool]] = None,
+                                fps: Optional[int] = None) -> FrameStore:
+        print(f"\n{'='*60}")
+        print(f"🎬 Generating Advanced AI Video")
+        print(f"{'='*60}")
+        print(f"📝 Prompt: {prompt[:100]}...")
+        print(f"🎨 Style: {style}")
+        print(f"⚙️  Quality: {quality}")
+        print(f"📷 Camera: {camera_movement}")
+        print(f"⏱️  Duration: {duration}s")
+        print(f"{'='*60}\n")
+        
+        return self._generate_background_frames(prompt, style, quality, camera_movement, duration,
+                                                effects, fps)
+    
     def generate_cinematic_video(self, prompt: str, audio_path: str, output_path: str,
                                   style: str = "cinematic", quality: str = "balanced",
                                   camera_movement: str = "static", duration: float = 5.0) -> str:
         try:
-            print(f"\n{'='*60}")
-            print(f"🎬 Generating Advanced AI Video")
-            print(f"{'='*60}")
-            print(f"📝 Prompt: {prompt[:100]}...")
-            print(f"🎨 Style: {style}")
-            print(f"⚙️  Quality: {quality}")
-            print(f"📷 Camera: {camera_movement}")
-            print(f"⏱️  Duration: {duration}s")
-            print(f"{'='*60}\n")
-            
-            video_style = VideoStyle(style)
-            quality_preset = QualityPreset[quality.upper()]
-            camera = CameraMovement(camera_movement)
-            
-            config = VideoConfig(
-                style=video_style,
-                quality=quality_preset,
-                camera_movement=camera,
-                duration=duration,
-                enable_optical_flow=True,
-                enable_style_transfer=True,
-                enable_lighting_effects=True,
-                enable_atmospheric_effects=True
-            )
-            
-            frames = self.video_engine.generate_video_frames(config, prompt)
-            
-            print(f"\n🎬 Composing video from {len(frames)} frames...")
-            
-            clip = ImageSequenceClip(frames, fps=quality_preset.value["fps"])
-            
-            audio_clip = AudioFileClip(audio_path)
-            
-            if audio_clip.duration > duration:
-                audio_clip = audio_clip.subclip(0, duration)
-            elif audio_clip.duration < duration:
-                audio_clip = audio_loop(audio_clip, duration=duration)
-            
-            final_clip = clip.set_audio(audio_clip)
+            frames = self.render_cinematic_frames(prompt, style, quality, camera_movement, duration)
             
-            output_dir = Path(output_path).parent
-            output_dir.mkdir(parents=True, exist_ok=True)
-            
-            final_clip.write_videofile(
-                output_path,
-                fps=quality_preset.value["fps"],
-                codec='libx264',
-                audio_codec='aac',
-                preset='medium',
-                bitrate=quality_preset.value["bitrate"],
-                threads=4,
-                logger=None
-            )
-            
-            clip.close()
-            audio_clip.close()
-            final_clip.close()
+            self.write_video(frames, audio_path, output_path, quality, duration)
             
             print(f"\n✅ Advanced video created successfully: {output_path}")
             return output_path
@@ -88,6 +106,61 @@ class UnifiedVideoGenerator:
             traceback.print_exc()
             raise
     
+    def fetch_character_image(self, prompt: str, character_type: str = "person",
+                              quality: str = "balanced") -> Path:
+        character_prompt = self._get_character_prompt(character_type)
+        full_prompt = f"{character_prompt} {prompt}"
+        
+        cleaned_prompt = full_prompt.replace('\n', ' ').replace('\r', ' ')
+        cleaned_prompt = ' '.join(cleaned_prompt.split())
+        cleaned_prompt = cleaned_prompt[:200]
+        
+        encoded_prompt = urllib.parse.quote(cleaned_prompt)
+        
+        quality_preset = QualityPreset[quality.upper()]
+        resolution = quality_preset.value["resolution"]
+        
+        image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width={resolution[0]}&height={resolution[1]}&nologo=true&seed={uuid.uuid4().hex[:8]}"
+        
+        print(f"📥 Generating character image...")
+        response = requests.get(image_url, timeout=60)
+        count_upstream("pollinations", response.status_code)
+        response.raise_for_status()
+        
+        temp_dir = Path("/tmp/output")
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        
+        temp_image_path = temp_dir / f"char_{uuid.uuid4().hex}.png"
+        with open(temp_image_path, 'wb') as f:
+            f.write(response.content)
+        
+        print(f"✅ Character image generated: {temp_image_path}")
+        
+        return temp_image_path
+    
+    def animate_character_image(self, image_path: Path, audio_path: str, output_path: str,
+                                emotion: str = "neutral", quality: str = "balanced",
+                                duration: float = 5.0, keep_image: bool = False,
+                                fps: Optional[int] = None) -> str:
+        quality_preset = QualityPreset[quality.upper()]
+        width, height = quality_preset.value["resolution"]
+        animator = self.character_animator
+        resolution = (min(width, animator.width), min(height, animator.height))
+        
+        try:
+            return animator.create_animated_video(
+                base_image_path=str(image_path),
+                audio_path=audio_path,
+                output_path=output_path,
+                emotion=resolve_emotion(emotion),
+                duration=duration,
+                fps=fps or quality_preset.value["fps"],
+                resolution=resolution
+            )
+        finally:
+            if not keep_image:
+                Path(image_path).unlink(missing_ok=True)
+    
     def generate_character_video(self, prompt: str, audio_path: str, output_path: str,
                                   character_type: str = "person", emotion: str = "neutral",
                                   quality: str = "balanced", duration: float = 5.0) -> str:
@@ -102,45 +175,9 @@ class UnifiedVideoGenerator:
             print(f"⏱️  Duration: {duration}s")
             print(f"{'='*60}\n")
             
-            character_prompt = self._get_character_prompt(character_type)
-            full_prompt = f"{character_prompt} {prompt}"
-            
-            cleaned_prompt = full_prompt.replace('\n', ' ').replace('\r', ' ')
-            cleaned_prompt = ' '.join(cleaned_prompt.split())
-            cleaned_prompt = cleaned_prompt[:200]
-            
-            encoded_prompt = urllib.parse.quote(cleaned_prompt)
-            
-            quality_preset = QualityPreset[quality.upper()]
-            resolution = quality_preset.value["resolution"]
-            
-            image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width={resolution[0]}&height={resolution[1]}&nologo=true&seed={uuid.uuid4().hex[:8]}"
-            
-            print(f"📥 Generating character image...")
-            response = requests.get(image_url, timeout=60)
-            response.raise_for_status()
-            
-            temp_dir = Path("/tmp/output")
-            temp_dir.mkdir(parents=True, exist_ok=True)
-            
-            temp_image_path = temp_dir / f"char_{uuid.uuid4().hex}.png"
-            with open(temp_image_path, 'wb') as f:
-                f.write(response.content)
-            
-            print(f"✅ Character image generated: {temp_image_path}")
-            
-            emotion_enum = EmotionType(emotion)
-            
-            video_path = self.character_animator.create_animated_video(
-                base_image_path=str(temp_image_path),
-                audio_path=audio_path,
-                output_path=output_path,
-                emotion=emotion_enum,
-                duration=duration,
-                fps=quality_preset.value["fps"]
-            )
-            
-            temp_image_path.unlink(missing_ok=True)
+            image_path = self.fetch_character_image(prompt, character_type, quality)
+            video_path = self.animate_character_image(image_path, audio_path, output_path,
+                                                      emotion, quality, duration)
             
             print(f"\n✅ Advanced character video created successfully: {video_path}")
             return video_path
@@ -198,6 +235,13 @@ class UnifiedVideoGenerator:
             raise
     
     def _generate_character_image(self, prompt: str, quality: str) -> str:
+        from services.ai_image_generator import image_fetch_lock
+        resolution = QualityPreset[quality.upper()].value["resolution"]
+        with image_fetch_lock(prompt, *resolution):
+            return self._fetch_character_image_url(prompt, quality)
+    
+    @traced("image.fetch")
+    def _fetch_character_image_url(self, prompt: str, quality: str) -> str:
         cleaned_prompt = prompt.replace('\n', ' ').replace('\r', ' ')
         cleaned_prompt = ' '.join(cleaned_prompt.split())
         cleaned_prompt = cleaned_prompt[:200]
@@ -224,6 +268,7 @@ class UnifiedVideoGenerator:
                 response = requests.get(image_url, timeout=60)
                 
                 print(f"📊 Response status: {response.status_code}, content length: {len(response.content)}")
+                count_upstream("pollinations", response.status_code)
                 
                 if response.status_code == 429:
                     retry_after = int(response.headers.get('Retry-After', base_delay * (2 ** attempt)))
@@ -266,111 +311,197 @@ class UnifiedVideoGenerator:
         return image_url
     
     def _generate_background_frames(self, prompt: str, style: str, quality: str, 
-                                     camera_movement: str, duration: float) -> List[np.ndarray]:
+                                     camera_movement: str, duration: float,
+                                     effects: Optional[Dict[str, bool]] = None,
+                                     fps: Optional[int] = None) -> FrameStore:
         video_style = VideoStyle(style)
         quality_preset = QualityPreset[quality.upper()]
         camera = CameraMovement(camera_movement)
+        preview = quality_preset is QualityPreset.PREVIEW
+        
+        if effects is None:
+            effects = {
+                "enable_optical_flow": not preview,
+                "enable_style_transfer": True,
+                "enable_lighting_effects": True,
+                "enable_atmospheric_effects": not preview
+            }
         
         config = VideoConfig(
             style=video_style,
             quality=quality_preset,
             camera_movement=camera,
             duration=duration,
-            enable_optical_flow=True,
-            enable_style_transfer=True,
-            enable_lighting_effects=True,
-            enable_atmospheric_effects=True
+            fps=fps,
+            **effects
         )
         
         return self.video_engine.generate_video_frames(config, prompt)
     
-    def _compose_hybrid_video(self, character_image_url: str, background_frames: List[np.ndarray],
+    def _compose_hybrid_video(self, character_image_url: str, background_frames: FrameStore,
                                audio_path: str, output_path: str, emotion: str,
                                quality: str, duration: float) -> str:
-        import requests
-        from PIL import Image
+        fps = QualityPreset[quality.upper()].value["fps"]
+        combined_frames = self._compose_hybrid_frames(character_image_url, background_frames,
+                                                      audio_path, emotion, fps)
         
-        response = requests.get(character_image_url, timeout=60)
-        response.raise_for_status()
+        return self.write_video(combined_frames, audio_path, output_path, quality, duration)
+    
+    def _hybrid_character_layer(self, image_path: Path, box: Tuple[int, int, int, int], total_frames: int,
+                                audio_path: Optional[str], emotion: str, fps: int) -> Layer:
+        from PIL import Image
         
-        temp_dir = Path("/tmp/output")
-        temp_dir.mkdir(parents=True, exist_ok=True)
+        char_x, char_y, char_w, char_h = box
+        transform = LayerTransform(char_x, char_y, opacity=HYBRID_CHARACTER_OPACITY)
+        feather = max(3, min(char_w, char_h) // 40)
         
-        temp_char_path = temp_dir / f"char_{uuid.uuid4().hex}.png"
-        with open(temp_char_path, 'wb') as f:
-            f.write(response.content)
+        if not audio_path:
+            # Sprite and feathered mask are prepared once; each frame blends only the character's box
+            char_img = Image.open(image_path)
+            if char_img.mode != 'RGB':
+                char_img = char_img.convert('RGB')
+            return Layer.from_image(np.array(char_img), (char_w, char_h), transform,
+                                    mask="circle", feather=feather, name="character")
         
-        char_img = Image.open(temp_char_path)
-        char_array = np.array(char_img)
+        animator = self.character_animator
+        # Resolved here: an error on the producer thread would only surface mid-composite
+        emotion_type = resolve_emotion(emotion)
         
-        if char_img.mode != 'RGB':
-            char_img = char_img.convert('RGB')
-            char_array = np.array(char_img)
+        def produce(store: FrameStore):
+            with span("frames.hybrid_character", frames=total_frames):
+                tick = frame_clock("frames.hybrid_character")
+                for frame in animator.iter_frames(str(image_path), audio_path, total_frames, fps,
+                                                  emotion_type, resolution=(char_w, char_h), out=store):
+                    yield frame
+                    tick()
         
-        quality_preset = QualityPreset[quality.upper()]
-        fps = quality_preset.value["fps"]
-        total_frames = len(background_frames)
+        # The animator renders at the overlay size on its own thread while this one composites
+        stream = FrameStream(produce, (char_h, char_w, 3), name="hybrid-character")
+        return StreamLayer(stream, circle_mask(char_w, char_h, feather), transform, name="character")
+    
+    @traced("frames.hybrid_compose", count_frames=True)
+    def _compose_hybrid_frames(self, character_image_url: str, background_frames: FrameStore,
+                               audio_path: Optional[str] = None, emotion: str = "neutral",
+                               fps: int = 30) -> FrameStore:
+        """
+        Overlay the character on the background frames in place and return them.
+        With audio_path the character is animated (lip-sync, expressions, head
+        motion) and its frames are streamed from the animator as they render;
+        without it a still image is used.
+        """
+        import requests
         
-        combined_frames = []
+        temporary = not character_image_url.startswith("file://")
+        if temporary:
+            response = requests.get(character_image_url, timeout=60)
+            response.raise_for_status()
+            fd, path = tempfile.mkstemp(prefix="hybrid_character_", suffix=".png")
+            os.close(fd)
+            image_path = Path(path)
+            image_path.write_bytes(response.content)
+        else:
+            image_path = Path(character_image_url[len("file://"):])
         
-        for i, bg_frame in enumerate(background_frames):
-            h, w = bg_frame.shape[:2]
-            
-            char_resized = cv2.resize(char_array, (w // 3, h // 3), interpolation=cv2.INTER_AREA)
-            
-            char_x = w - char_resized.shape[1] - 50
-            char_y = h - char_resized.shape[0] - 100
-            
-            combined = bg_frame.copy()
-            
-            if char_x >= 0 and char_y >= 0:
-                mask = np.zeros((char_resized.shape[0], char_resized.shape[1]), dtype=np.uint8)
-                cv2.circle(mask, 
-                          (char_resized.shape[1] // 2, char_resized.shape[0] // 2), 
-                          min(char_resized.shape[:2]) // 2, 255, -1)
-                
-                mask = mask / 255.0
-                mask = mask[:, :, np.newaxis]
-                
-                char_region = combined[char_y:char_y + char_resized.shape[0], 
-                                      char_x:char_x + char_resized.shape[1]]
-                
-                blended = (char_region * (1 - mask * 0.3) + char_resized * mask * 0.3).astype(np.uint8)
+        try:
+            compositor = Compositor()
+            if background_frames.count:
+                h, w = background_frames.shape[:2]
+                char_w, char_h = w // 3, h // 3
+                char_x = w - char_w - 50
+                char_y = h - char_h - 100
                 
-                combined[char_y:char_y + char_resized.shape[0], 
-                        char_x:char_x + char_resized.shape[1]] = blended
-            
-            combined_frames.append(combined)
-        
-        clip = ImageSequenceClip(combined_frames, fps=fps)
-        
-        audio_clip = AudioFileClip(audio_path)
-        
-        if audio_clip.duration > duration:
-            audio_clip = audio_clip.subclip(0, duration)
-        elif audio_clip.duration < duration:
-            audio_clip = audio_loop(audio_clip, duration=duration)
-        
-        final_clip = clip.set_audio(audio_clip)
-        
-        final_clip.write_videofile(
-            output_path,
-            fps=fps,
-            codec='libx264',
-            audio_codec='aac',
-            preset='medium',
-            bitrate=quality_preset.value["bitrate"],
-            threads=4,
-            logger=None
-        )
-        
-        clip.close()
-        audio_clip.close()
-        final_clip.close()
-        
-        temp_char_path.unlink(missing_ok=True)
+                if char_x >= 0 and char_y >= 0:
+                    compositor.add(self._hybrid_character_layer(
+                        image_path, (char_x, char_y, char_w, char_h), background_frames.count,
+                        audio_path, emotion, fps))
+            
+            compositor.render(background_frames, background_frames.count,
+                              tick=frame_clock("frames.hybrid_compose"))
+        finally:
+            if temporary:
+                image_path.unlink(missing_ok=True)
         
-        return output_path
+        return background_frames
+
+def add_advanced_asset_stages(graph: StageGraph, prompt_stage: str, video_type: str = "cinematic",
+                              character_type: str = "person", quality: str = "balanced",
+                              generator: Optional[UnifiedVideoGenerator] = None,
+                              assets: Optional[AssetMemo] = None) -> None:
+    """
+    Declare the fetched inputs of the advanced pipeline (character images) as their
+    own stages, always at the final quality, so preview and final renders share them.
+    With an AssetMemo, identical images are fetched once for the whole job group;
+    character images then stay on disk until the memo is closed, so render them
+    with keep_image=True.
+    """
+    generator = generator or UnifiedVideoGenerator()
+    
+    if video_type == "character":
+        def fetch(prompt):
+            image_path = generator.fetch_character_image(prompt, character_type, quality)
+            if assets is not None:
+                assets.on_close(lambda: Path(image_path).unlink(missing_ok=True))
+            return image_path
+        if assets is not None:
+            fetch = assets.share(("character_image", character_type, quality), fetch)
+        graph.add("image", fetch, deps=[prompt_stage])
+    elif video_type == "hybrid":
+        def fetch():
+            return generator._generate_character_image(generator._get_character_prompt(character_type), quality)
+        if assets is not None:
+            fetch = assets.share(("hybrid_image", character_type, quality), fetch)
+        graph.add("image", fetch)
+    elif video_type != "cinematic":
+        raise ValueError(f"Unknown video type: {video_type}")
+
+def add_advanced_render_stages(graph: StageGraph, prompt_stage: str, audio_stage: str,
+                               output_path: str, video_type: str = "cinematic",
+                               style: str = "cinematic", emotion: str = "neutral",
+                               quality: str = "balanced", camera_movement: str = "static",
+                               duration: float = 5.0, prefix: str = "", keep_image: bool = False,
+                               effects: Optional[Dict[str, bool]] = None, fps: Optional[int] = None,
+                               generator: Optional[UnifiedVideoGenerator] = None) -> str:
+    """
+    Declare the render/encode stages on top of the asset stages. Frame rendering
+    runs alongside TTS; audio is only awaited by the final animate/encode stage.
+    effects (VideoConfig enable_* flags) and fps override the preset defaults.
+    Returns the name of the stage that produces the output video.
+    """
+    generator = generator or UnifiedVideoGenerator()
+    frames_stage, compose_stage, encode_stage = f"{prefix}frames", f"{prefix}compose", f"{prefix}encode"
+    
+    if video_type == "cinematic":
+        graph.add(frames_stage, lambda prompt: generator.render_cinematic_frames(
+            prompt, style, quality, camera_movement, duration, effects, fps), deps=[prompt_stage])
+        graph.add(encode_stage, lambda frames, audio_path: generator.write_video(
+            frames, audio_path, output_path, quality, duration, fps), deps=[frames_stage, audio_stage])
+    elif video_type == "character":
+        graph.add(encode_stage, lambda image_path, audio_path: generator.animate_character_image(
+            image_path, audio_path, output_path, emotion, quality, duration, keep_image, fps),
+            deps=["image", audio_stage])
+    elif video_type == "hybrid":
+        graph.add(frames_stage, lambda prompt: generator._generate_background_frames(
+            prompt, style, quality, camera_movement, duration, effects, fps), deps=[prompt_stage])
+        graph.add(compose_stage, lambda image, frames, audio_path: generator._compose_hybrid_frames(
+            image, frames, audio_path, emotion, fps or QualityPreset[quality.upper()].value["fps"]),
+            deps=["image", frames_stage, audio_stage])
+        graph.add(encode_stage, lambda frames, audio_path: generator.write_video(
+            frames, audio_path, output_path, quality, duration, fps), deps=[compose_stage, audio_stage])
+    else:
+        raise ValueError(f"Unknown video type: {video_type}")
+    
+    return encode_stage
+
+def add_advanced_video_stages(graph: StageGraph, prompt_stage: str, audio_stage: str,
+                              output_path: str, video_type: str = "cinematic",
+                              style: str = "cinematic", character_type: str = "person",
+                              emotion: str = "neutral", quality: str = "balanced",
+                              camera_movement: str = "static", duration: float = 5.0) -> str:
+    generator = UnifiedVideoGenerator()
+    add_advanced_asset_stages(graph, prompt_stage, video_type, character_type, quality, generator)
+    return add_advanced_render_stages(graph, prompt_stage, audio_stage, output_path, video_type,
+                                      style, emotion, quality, camera_movement, duration,
+                                      generator=generator)
 
 def generate_advanced_video(prompt: str, audio_path: str, output_path: str,
                             video_type: str = "cinematic", style: str = "cinematic",
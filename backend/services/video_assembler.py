@@ -2,24 +2,44 @@ from PIL import Image
 if not hasattr(Image, 'ANTIALIAS'):
     Image.ANTIALIAS = Image.LANCZOS
 
-from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip, TextClip, CompositeVideoClip
+from moviepy.editor import VideoFileClip, AudioFileClip, ImageClip
 from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
 import os
 from pathlib import Path
+from typing import Tuple
+
+from services.lipsync import load_word_boundaries
+from services.segment_encoder import encode_frames
+from services.subtitle_renderer import SubtitleRenderer, build_subtitle_cues
 
 os.environ['IMAGEIO_FFMPEG_EXE'] = '/usr/local/bin/ffmpeg'
 
+MAX_TIKTOK_DURATION = 10.0
+
+def tiktok_duration(audio_path: str) -> float:
+    """
+    Length of the video create_tiktok_video makes for this audio.
+    """
+    audio = AudioFileClip(audio_path)
+    try:
+        return min(audio.duration, MAX_TIKTOK_DURATION)
+    finally:
+        audio.close()
+
 def create_tiktok_video(
     script: str,
     audio_path: str,
     background_path: str,
     output_path: str,
     subtitle_color: str = "white",
-    subtitle_size: int = 40
+    subtitle_size: int = 40,
+    karaoke: bool = True,
+    resolution: Tuple[int, int] = (720, 1280),
+    fps: int = 15
 ) -> str:
     try:
         audio = AudioFileClip(audio_path)
-        audio_duration = min(audio.duration, 10)
+        audio_duration = min(audio.duration, MAX_TIKTOK_DURATION)
         
         bg_path = Path(background_path)
         print(f"🔍 Background path: {bg_path}")
@@ -41,50 +61,41 @@ def create_tiktok_video(
             elif video.duration < audio_duration:
                 video = video.loop(duration=audio_duration)
         
-        target_width = 720
-        target_height = 1280
+        target_width, target_height = resolution
         video = video.resize(height=target_height)
         
         if video.size[0] > target_width:
             crop_x = (video.size[0] - target_width) // 2
             video = video.crop(x1=crop_x, y1=0, x2=crop_x + target_width, y2=target_height)
         
-        subtitle_lines = wrap_text(script, max_chars=20)
-        subtitles = []
+        word_boundaries = load_word_boundaries(audio_path)
+        cues = build_subtitle_cues(script, audio_duration, word_boundaries, max_chars=20)
+        print(f"💬 {len(cues)} subtitle lines ({'word-timed' if word_boundaries else 'estimated timing'})")
         
-        line_duration = audio_duration / len(subtitle_lines)
-        
-        for i, line in enumerate(subtitle_lines):
-            try:
-                txt_clip = TextClip(
-                    line,
-                    fontsize=subtitle_size,
-                    color=subtitle_color,
-                    font='Arial',
-                    method='label',
-                    size=(1000, None)
-                ).set_position('center', 'bottom').set_start(i * line_duration).set_duration(line_duration)
-                subtitles.append(txt_clip)
-            except Exception as text_error:
-                print(f"Error creating text clip: {text_error}")
-                continue
-        
-        if subtitles:
-            final_video = CompositeVideoClip([video] + subtitles)
-        else:
+        try:
+            font_size = max(12, round(subtitle_size * target_height / 1280))
+            renderer = SubtitleRenderer(video.size, font_size=font_size, color=subtitle_color, karaoke=karaoke)
+            renderer.prepare(cues)
+            final_video = video.fl(lambda get_frame, t: renderer.render(get_frame(t), t))
+        except Exception as text_error:
+            print(f"Error rendering subtitles: {text_error}")
             final_video = video
         
-        final_video = final_video.set_audio(audio)
-        
-        final_video.write_videofile(
-            output_path,
-            fps=15,
-            codec='libx264',
-            audio_codec='aac',
-            preset='ultrafast',
-            threads=1,
-            logger=None
-        )
+        try:
+            encode_frames(final_video.iter_frames(fps=fps, dtype='uint8'), output_path, fps,
+                          audio_path=audio_path, preset='ultrafast')
+        except Exception as encode_error:
+            print(f"⚠️  Segmented encode failed: {encode_error}, falling back to single-stream encode...")
+            final_video = final_video.set_audio(audio)
+            final_video.write_videofile(
+                output_path,
+                fps=fps,
+                codec='libx264',
+                audio_codec='aac',
+                preset='ultrafast',
+                threads=1,
+                logger=None
+            )
         
         video.close()
         audio.close()
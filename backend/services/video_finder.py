@@ -4,6 +4,8 @@ from pathlib import Path
 from typing import Optional
 from dotenv import load_dotenv
 
+from services.telemetry import count_upstream
+
 load_dotenv()
 
 PEXELS_API_KEY = os.getenv("PEXELS_API_KEY")
@@ -25,6 +27,7 @@ def download_pexels_video(query: str, output_path: str) -> bool:
 
         search_url = f"https://api.pexels.com/videos/search?query={query}&per_page=1&orientation=landscape"
         response = requests.get(search_url, headers=headers, timeout=10)
+        count_upstream("pexels", response.status_code)
         response.raise_for_status()
 
         data = response.json()
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import re
+from email.utils import formatdate
+from pathlib import Path
+from typing import Mapping, Optional, Tuple
+
+from starlette.responses import Response
+
+CHUNK_SIZE = 1024 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def file_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=" range into an inclusive (start, end) pair. Multi-range
+    and malformed headers return None so the whole file is served instead.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+class VideoFileResponse(Response):
+    """
+    File response for rendered videos: single-range requests (206), strong ETags
+    with If-None-Match/If-Range, HEAD, and zero-copy sends when the server offers
+    the http.response.zerocopy extension. The file is opened up front, so a
+    preview being replaced by the final render mid-request can't mix the two.
+    """
+
+    def __init__(self, path: Path, request_headers: Mapping[str, str], method: str = "GET",
+                 immutable: bool = True, media_type: str = "video/mp4"):
+        self.file = open(path, "rb")
+        stat = os.fstat(self.file.fileno())
+        size = stat.st_size
+        etag = file_etag(stat)
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": formatdate(stat.st_mtime, usegmt=True),
+            "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        }
+        status_code = 200
+        self.start, self.length = 0, size
+        self.send_body = method != "HEAD"
+
+        if_none_match = request_headers.get("if-none-match")
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            status_code, self.length, self.send_body = 304, 0, False
+        elif range_header and (not if_range or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                status_code, self.length, self.send_body = 416, 0, False
+                headers["content-range"] = f"bytes */{size}"
+            else:
+                if byte_range is not None:
+                    start, end = byte_range
+                    status_code = 206
+                    self.start, self.length = start, end - start + 1
+                    headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        if status_code != 304:
+            headers["content-length"] = str(self.length)
+        if not self.send_body:
+            self.file.close()
+        super().__init__(status_code=status_code, headers=headers,
+                         media_type=media_type if status_code in (200, 206) else None)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        try:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopy", "file": self.file,
+                            "offset": self.start, "count": self.length})
+                return
+
+            self.file.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await asyncio.to_thread(self.file.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            self.file.close()
@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+import pytest
+
+from services.compositor import Layer, LayerTransform
+from services.effects import Blur, Composite, Draw, EffectGraph, Grade, NumpyBackend, OpenCVBackend, Warp
+from services.local_video_generator import ken_burns_warp
+
+HEIGHT, WIDTH = 96, 128
+
+def _frame() -> np.ndarray:
+    rs = np.random.RandomState(0)
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+    smooth = np.stack([x * 255 / WIDTH, y * 255 / HEIGHT, 128 + 100 * np.sin((x + y) / 9)], -1)
+    return np.clip(smooth + rs.normal(0, 8, smooth.shape), 0, 255).astype(np.uint8)
+
+def _layer() -> Layer:
+    sprite = np.full((40, 30, 3), (250, 40, 90), dtype=np.uint8)
+    return Layer.from_image(sprite, (30, 40), LayerTransform(80, 30, opacity=0.6), feather=5)
+
+def _circle(frame: np.ndarray) -> None:
+    cv2.circle(frame, (40, 50), 12, (255, 255, 200), -1)
+
+# name: (nodes, max difference, border margin excluded from the comparison)
+CASES = {
+    "translate": ([Warp.translate(7, -5)], 0, 0),
+    "translate_fraction": ([Warp.translate(3.5, 2.25)], 1, 0),
+    "rotate": ([Warp.rotate((WIDTH / 2, HEIGHT / 2), 12)], 1, 0),
+    "crop": ([Warp.crop(16, 12, 112, 84, WIDTH, HEIGHT)], 1, 2),
+    "ken_burns": ([ken_burns_warp(WIDTH, HEIGHT, 3.3)], 1, 0),
+    "warp_chain": ([Warp.translate(4, 3), Warp.crop(8, 6, 120, 90, WIDTH, HEIGHT)], 1, 1),
+    "gain": ([Grade.gain([1.1, 0.9, 1.3])], 1, 0),
+    "mix": ([Grade.mix((255, 200, 150), 0.3)], 1, 0),
+    "grade_chain": ([Grade.mix((20, 40, 60), 0.2), Grade.gain([0.9, 0.95, 1.0]),
+                     Grade.gain([1.05, 1.02, 0.95])], 2, 0),
+    "identity_grade": ([Grade.gain(1.0)], 0, 0),
+    "gaussian": ([Blur.gaussian(1.5)], 1, 0),
+    "motion": ([Blur.motion(5)], 1, 0),
+    "blur_chain": ([Blur.motion(3), Blur.gaussian(1.0)], 2, 0),
+    "composite": ([Composite(_layer())], 1, 0),
+    "draw": ([Draw(_circle)], 0, 0),
+    "mixed": ([Grade.gain([1.05, 1.02, 0.95]), Grade.mix((255, 255, 255), 0.1), Blur.gaussian(1.0),
+               Warp.translate(5, 0), Composite(_layer()), Draw(_circle)], 2, 0),
+}
+
+def _max_difference(a: np.ndarray, b: np.ndarray, margin: int) -> int:
+    if margin:
+        a, b = a[margin:-margin, margin:-margin], b[margin:-margin, margin:-margin]
+    return int(np.abs(a.astype(np.int16) - b.astype(np.int16)).max())
+
+@pytest.mark.parametrize("case", sorted(CASES))
+@pytest.mark.parametrize("target", ["new", "dst", "in_place"])
+def test_opencv_matches_reference(case, target):
+    nodes, tolerance, margin = CASES[case]
+    frame = _frame()
+    expected = NumpyBackend().render(EffectGraph(nodes), frame)
+
+    source = frame.copy()
+    if target == "new":
+        result = OpenCVBackend().render(EffectGraph(nodes), source)
+    elif target == "dst":
+        dst = np.zeros_like(frame)
+        result = OpenCVBackend().render(EffectGraph(nodes), source, dst=dst)
+        assert result is dst
+    else:
+        result = OpenCVBackend().render(EffectGraph(nodes), source, dst=source)
+        assert result is source
+
+    if target != "in_place":
+        np.testing.assert_array_equal(source, frame)
+    assert result.shape == frame.shape and result.dtype == np.uint8
+    assert _max_difference(result, expected, margin) <= tolerance
+
+def test_fused_warps_resample_once():
+    # Fused warps differ from per-node resampling, but match the composed warp
+    nodes = [Warp.translate(2.5, 1.5), Warp.rotate((WIDTH / 2, HEIGHT / 2), 5),
+             Warp.crop(8, 6, 120, 90, WIDTH, HEIGHT)]
+    matrix = np.eye(3)
+    for node in nodes:
+        matrix = np.vstack([node.matrix, [0, 0, 1]]) @ matrix
+    frame = _frame()
+    expected = NumpyBackend().render(EffectGraph([Warp(matrix[:2])]), frame)
+    assert _max_difference(OpenCVBackend().render(EffectGraph(nodes), frame), expected, 0) <= 1
+
+def test_fusion_plans():
+    backend = OpenCVBackend()
+    assert len(backend.plan(EffectGraph(CASES["warp_chain"][0]))) == 1
+    assert len(backend.plan(EffectGraph(CASES["grade_chain"][0]))) == 1
+    assert len(backend.plan(EffectGraph(CASES["blur_chain"][0]))) == 1
+    assert backend.plan(EffectGraph(CASES["identity_grade"][0])) == []
+    # A grade that can saturate must be clamped before the next one
+    assert len(backend.plan(EffectGraph([Grade.gain(1.5), Grade.gain(0.5)]))) == 2
@@ -0,0 +1,157 @@
+"""
+Render worker. Pulls generation jobs from the broker configured by RENDER_BROKER,
+runs the same pipelines as the API and uploads the result to SHARED_STORAGE.
+
+    RENDER_BROKER=sqlite:///shared/render_jobs.db SHARED_STORAGE=file:///shared/videos \
+        python -m backend.worker --concurrency 2
+"""
+import argparse
+import asyncio
+import signal
+import socket
+import sys
+import uuid
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fastapi import BackgroundTasks
+
+import main
+from services.admission import ClientInfo
+from services.job_broker import HEARTBEAT_SECONDS, JobBroker, QueuedJob, broker_from_env
+from services.output_store import output_store
+from services.profiling import job_profiler, profile_path
+from services.render_jobs import job_registry
+from services.render_scheduler import MAX_CONCURRENT_RENDERS
+from services.shared_storage import SharedStorage, storage_from_env
+from services.telemetry import start_metrics_server
+
+POLL_SECONDS = 2.0
+
+JOB_KINDS = {
+    "basic": (main.VideoRequest, main.run_basic_job),
+    "advanced": (main.VideoRequest, main.run_advanced_job),
+    "physics": (main.PhysicsVideoRequest, main.run_physics_job),
+}
+
+class RenderWorker:
+    def __init__(self, broker: JobBroker, storage: SharedStorage, concurrency: int = MAX_CONCURRENT_RENDERS,
+                 worker_id: Optional[str] = None):
+        self.broker = broker
+        self.storage = storage
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        if not self._stopping.is_set():
+            print(f"🛑 Worker {self.worker_id} stopping after current jobs...")
+            self._stopping.set()
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            if not await asyncio.to_thread(self.broker.heartbeat, job_id, self.worker_id):
+                print(f"⚠️  Lost lease on job {job_id}, another worker may retry it")
+                return
+
+    def _upload(self, job_id: str) -> str:
+        video_path = main.OUTPUT_DIR / f"{job_id}_video.mp4"
+        return self.storage.upload(video_path, video_path.name)
+
+    async def execute(self, job: QueuedJob) -> dict:
+        request_model, run_job = JOB_KINDS[job.kind]
+        request = request_model(**job.payload["request"])
+        client = ClientInfo(**job.payload["client"])
+        background_tasks = BackgroundTasks()
+        if job.payload.get("profile"):
+            job_profiler.request(job.job_id, job.payload["profile"])
+
+        with output_store.job(job.job_id):
+            # The uploaded copy is the one that is served, so drop the local video with the intermediates
+            output_store.track(job.job_id, main.OUTPUT_DIR / f"{job.job_id}_video.mp4", profile_path(job.job_id))
+            response = await run_job(request, job.job_id, client, background_tasks)
+            video = await asyncio.to_thread(self._upload, job.job_id)
+
+            if background_tasks.tasks:
+                await background_tasks()
+                record = job_registry.get(job.job_id)
+                if record is not None and record.tier == "final":
+                    video = await asyncio.to_thread(self._upload, job.job_id)
+                    response.tier = "final"
+
+            if profile_path(job.job_id).exists():
+                await asyncio.to_thread(self.storage.upload, profile_path(job.job_id), profile_path(job.job_id).name)
+
+        return {**response.model_dump(), "video": video}
+
+    async def process(self, job: QueuedJob) -> None:
+        print(f"\n🛠️  Worker {self.worker_id} running {job.kind} job {job.job_id} "
+              f"(attempt {job.attempts}/{job.max_attempts})")
+        heartbeat = asyncio.ensure_future(self._heartbeat(job.job_id))
+        try:
+            result = await self.execute(job)
+        except Exception as e:
+            error = str(getattr(e, "detail", e))
+            print(f"❌ Job {job.job_id} failed on {self.worker_id}: {error}")
+            await asyncio.to_thread(self.broker.fail, job.job_id, self.worker_id, error,
+                                    getattr(e, "retry_after", None))
+            return
+        finally:
+            heartbeat.cancel()
+
+        if await asyncio.to_thread(self.broker.complete, job.job_id, self.worker_id, result):
+            print(f"✅ Job {job.job_id} completed on {self.worker_id}")
+        else:
+            print(f"⚠️  Job {job.job_id} finished after its lease expired, result discarded")
+
+    async def _loop(self, once: bool) -> None:
+        while not self._stopping.is_set():
+            job = await asyncio.to_thread(self.broker.claim, self.worker_id)
+            if job is None:
+                if once:
+                    return
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.process(job)
+
+    async def run(self, once: bool = False) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        print(f"👷 Worker {self.worker_id} started with {self.concurrency} slots")
+        sweeper = asyncio.ensure_future(output_store.run_sweeper())
+        try:
+            await asyncio.gather(*(self._loop(once) for _ in range(self.concurrency)))
+        finally:
+            sweeper.cancel()
+        print(f"👋 Worker {self.worker_id} stopped")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render worker for the Text-to-TikTok API")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_RENDERS,
+                        help="jobs rendered at the same time")
+    parser.add_argument("--worker-id", default=None)
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on this port")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    broker = broker_from_env()
+    if broker is None:
+        sys.exit("RENDER_BROKER is not set, e.g. RENDER_BROKER=sqlite:///tmp/render_jobs.db")
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    worker = RenderWorker(broker, storage_from_env(), max(1, args.concurrency), args.worker_id)
+    asyncio.run(worker.run(once=args.once))